@@ -61,6 +61,7 @@ class BeastXml(object):
             model.beastxml = self
         for clock in self.config.clocks:
             clock.beastxml = self
+        # Maps the clades of the TaxonSets defined so far to their IDs.
         self._taxon_sets = {}
         self.build_xml()
         self.validate_ids()
@@ -229,7 +230,7 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         Make a rough estimate of what the starting height of the tree should
         be so we can initialise somewhere decent.
         """
-        self.config.treeprior.estimate_height(self)
+        self.config.treeprior.estimate_height(self.config)
 
     def add_distributions(self):
         """
@@ -311,17 +312,17 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         definition of the tree).  If this is not the case, passing
         define_taxa=True will define, rather than refer to, the taxa.
         """
-        # Kill duplicates
-        langs = sorted(list(set(langs)))
+        clade = self.config.taxa.clade(langs)
 
         # If we've been asked to build an emtpy TaxonSet, something is very wrong,
         # so better to die loud and early
-        assert langs
+        assert clade
         # Refer to any previous TaxonSet with the same languages
-        for idref, taxa in self._taxon_sets.items():
-            if langs == taxa:
-                xml.taxonset(parent, idref=idref)
-                return
+        if clade in self._taxon_sets:
+            xml.taxonset(parent, idref=self._taxon_sets[clade])
+            return
+        # Clades iterate in the (sorted) order of the analysis languages.
+        langs = list(clade)
         if len(langs) == 1 and label == langs[0]:
             # Single taxa are IDs already. They cannot also be taxon set ids.
             label = "tx_{:}".format(label)
@@ -336,7 +337,7 @@ java -cp $(java.class.path) beast.app.beastapp.BeastMain $(resume/overwrite) -ja
         else:
             for lang in langs:
                 xml.taxon(taxonset, attrib={"id" if define_taxa else "idref" : lang})
-        self._taxon_sets[label] = langs
+        self._taxon_sets[clade] = label
 
     def add_likelihood(self):
         """
@@ -1,13 +1,20 @@
 import argparse
+import collections
 import sys
 import traceback
 import pathlib
 import logging
 
+from appdirs import user_data_dir
+
 from beastling import __version__
+from beastling import glottolog_store
 from beastling.beastxml import BeastXml
 from beastling.configuration import Configuration
+from beastling.glottolog import GlottologIndex, fingerprint
 from beastling.extractor import extract
+from beastling.fileio.compiled import SUFFIX
+from beastling.fileio.datareaders import compile_data
 from beastling.report import BeastlingReport
 from beastling.report import BeastlingGeoJSON
 
@@ -23,12 +30,17 @@ def exit(msg=None, status=0, exception=False):
 
 
 def main(*args):
+    args = args or tuple(sys.argv[1:])
+    if args[:1] == ('glottolog',):
+        glottolog_main(*args[1:])
+        exit(status=0)
 
     # Parse command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "config",
-        help="Beastling configuration file(s) (or XML file if --extract is used)",
+        help="Beastling configuration file(s) (or XML file if --extract is used, or data "
+             "file(s) if --compile-data is used)",
         type=pathlib.Path,
         default=None,
         nargs="+")
@@ -37,6 +49,25 @@ def main(*args):
         default=False,
         action="store_true",
         help="Extract configuration file (and possibly data files) from a BEASTling-generated XML file.")
+    parser.add_argument(
+        "--compile-data",
+        default=False,
+        action="store_true",
+        help="Compile data file(s) into a binary format, which loads much faster.")
+    parser.add_argument(
+        "--file-format",
+        help="With --compile-data: the format of the data file(s), as the model option "
+             "`file_format`.",
+        default=None)
+    parser.add_argument(
+        "--language-column",
+        help="With --compile-data: the column of language identifiers, as the model option "
+             "`language_column`.",
+        default=None)
+    parser.add_argument(
+        "--value-column",
+        help="With --compile-data: the column of values, as the model option `value_column`.",
+        default=None)
     parser.add_argument(
         "--report",
         default=False,
@@ -66,6 +97,11 @@ def main(*args):
         help="Generate XML file which samples from the prior, not posterior.",
         default=False,
         action="store_true")
+    parser.add_argument(
+        "--offline",
+        help="Never download Glottolog data, but fail if the release is not available locally.",
+        default=False,
+        action="store_true")
     parser.add_argument(
         "-v", "--verbose",
         help="Display details of the generated analysis.",
@@ -75,13 +111,15 @@ def main(*args):
         "--version",
         action="version",
         version = "BEASTling %s" % __version__)
-    args = parser.parse_args(args or None)
+    args = parser.parse_args(args)
     if args.verbose:
         # set the log level:
         logging.basicConfig()
         logging.getLogger().setLevel(logging.INFO)
     if args.extract:
         do_extract(args)
+    elif args.compile_data:
+        do_compile_data(args)
     else:
         do_generate(args)
     exit(status=0)
@@ -102,6 +140,29 @@ def do_extract(args):
             exception=True)
 
 
+def do_compile_data(args):
+    if args.output and len(args.config) != 1:
+        exit(msg="Can only specify an output filename when compiling exactly one data file", status=1)
+    for data in args.config:
+        if not data.exists():
+            exit(msg="No such data file: %s" % data, status=1)
+        output = pathlib.Path(args.output) if args.output else data.with_suffix(SUFFIX)
+        if output.exists() and not args.overwrite:
+            exit(msg="File %s already exists! Run beastling with the --overwrite option if you wish "
+                     "to overwrite it." % output,
+                 status=4)
+        try:
+            compile_data(
+                data,
+                output,
+                file_format=args.file_format,
+                lang_column=args.language_column,
+                value_column=args.value_column)
+        except wrap_errors as e:
+            exit(msg="Error encountered while compiling data file:", status=2, exception=True)
+        sys.stdout.write("Compiled %s into %s\n" % (data, output))
+
+
 def do_generate(args):
 
     # Make sure the requested configuration file exists
@@ -113,7 +174,8 @@ def do_generate(args):
     # This is fast, and gives us enough information to check whether or not
     try:
         config = Configuration(
-            configfile=args.config, stdin_data=args.stdin, prior=args.prior, force_glottolog_load=args.report)
+            configfile=args.config, stdin_data=args.stdin, prior=args.prior,
+            force_glottolog_load=args.report, offline=args.offline)
     except wrap_errors as e: # PRAGMA: NO COVER
         exit(msg="Error encountered while parsing configuration file:", status=2, exception=True)
 
@@ -154,3 +216,126 @@ def do_generate(args):
 
 def write_language_list(config):
     config.admin.path("_languages.txt").write_text("\n".join(config.languages.languages)+"\n", encoding='utf8')
+
+
+def glottolog_main(*args):
+    parser = argparse.ArgumentParser(
+        prog="beastling glottolog",
+        description="Manage the Glottolog releases available to BEASTling without network "
+                    "access.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+    subparsers.add_parser("list", help="List the locally available Glottolog releases.")
+    import_parser = subparsers.add_parser(
+        "import",
+        help="Import a Glottolog release from files downloaded from "
+             "https://glottolog.org/meta/downloads.")
+    import_parser.add_argument("release", help="Glottolog release number, e.g. 4.0")
+    import_parser.add_argument(
+        "newick", type=pathlib.Path, help="The classification (tree-glottolog-newick.txt)")
+    import_parser.add_argument(
+        "geo", type=pathlib.Path, help="The locations (languages-and-dialects-geo.csv)")
+    import_parser.add_argument(
+        "--overwrite",
+        help="Overwrite a release which has already been imported.",
+        default=False,
+        action="store_true")
+    for name, help in [
+        ("verify", "Check the data files of Glottolog releases against their checksums."),
+        ("precompile", "Build the index of Glottolog releases, so it need not be built when "
+                       "processing a configuration."),
+    ]:
+        subparsers.add_parser(name, help=help).add_argument(
+            "release", nargs="*", help="Glottolog release number(s), defaults to all releases")
+    args = parser.parse_args(args)
+    data_dir = pathlib.Path(user_data_dir('beastling'))
+    {
+        "list": do_glottolog_list,
+        "import": do_glottolog_import,
+        "verify": do_glottolog_verify,
+        "precompile": do_glottolog_precompile,
+    }[args.command](args, data_dir)
+
+
+def _glottolog_releases(data_dir):
+    """
+    The locally available Glottolog releases, mapped to the directory holding
+    their data.  Like `get_glottolog_data`, we prefer the package data.
+    """
+    res = collections.OrderedDict()
+    for directory in [glottolog_store.PACKAGE_DATA, data_dir]:
+        if directory.exists():
+            for release in glottolog_store.releases(directory):
+                res.setdefault(release, directory)
+    return collections.OrderedDict(
+        (r, res[r]) for r in sorted(res, key=glottolog_store.release_key))
+
+
+def _selected_releases(args, data_dir):
+    available = _glottolog_releases(data_dir)
+    for release in args.release:
+        if release not in available:
+            exit(msg="Glottolog %s is not available locally" % release, status=1)
+    return [(r, available[r]) for r in args.release or available]
+
+
+def do_glottolog_list(args, data_dir):
+    for release, directory in _glottolog_releases(data_dir).items():
+        index = glottolog_store.index_path(data_dir, release)
+        status = 'no index'
+        if index.exists():
+            sources = fingerprint(
+                glottolog_store.data_path(directory, 'newick', release),
+                glottolog_store.data_path(directory, 'geo', release))
+            try:
+                status = 'indexed' if GlottologIndex.open(index, sources=sources) else 'stale index'
+            except ValueError:  # pragma: no cover
+                status = 'invalid index'
+        sys.stdout.write("%s\t%s\t%s\n" % (release, directory, status))
+
+
+def do_glottolog_import(args, data_dir):
+    if glottolog_store.data_path(glottolog_store.PACKAGE_DATA, 'newick', args.release).exists():
+        exit(msg="Glottolog %s is distributed with BEASTling" % args.release, status=1)
+    if glottolog_store.data_path(data_dir, 'newick', args.release).exists() \
+            and not args.overwrite:
+        exit(msg="Glottolog %s has already been imported! Run beastling with the --overwrite "
+                 "option if you wish to replace it." % args.release,
+             status=4)
+    try:
+        glottolog_store.import_release(data_dir, args.release, args.newick, args.geo)
+    except wrap_errors as e:
+        exit(msg="Error encountered while importing Glottolog %s: %s" % (args.release, e),
+             status=2)
+    # Remove the index of the replaced data files.
+    index = glottolog_store.index_path(data_dir, args.release)
+    if index.exists():
+        index.unlink()
+    sys.stdout.write("Imported Glottolog %s into %s\n" % (args.release, data_dir))
+
+
+def do_glottolog_verify(args, data_dir):
+    failed = False
+    for release, directory in _selected_releases(args, data_dir):
+        try:
+            glottolog_store.verify_release(directory, release)
+            sys.stdout.write("Glottolog %s: OK\n" % release)
+        except ValueError as e:
+            sys.stderr.write("%s\n" % e)
+            failed = True
+    if failed:
+        exit(status=2)
+
+
+def do_glottolog_precompile(args, data_dir):
+    for release, directory in _selected_releases(args, data_dir):
+        index = glottolog_store.index_path(data_dir, release)
+        try:
+            GlottologIndex.load(
+                glottolog_store.data_path(directory, 'newick', release),
+                glottolog_store.data_path(directory, 'geo', release),
+                index)
+        except wrap_errors as e:
+            exit(msg="Error encountered while building the index of Glottolog %s:" % release,
+                 status=2, exception=True)
+        sys.stdout.write("Compiled the index of Glottolog %s into %s\n" % (release, index))
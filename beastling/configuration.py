@@ -1,21 +1,26 @@
 import itertools
+import collections
 import random
 from pathlib import Path
 from configparser import ConfigParser
 
-import newick
-from csvw.dsv import reader
 from appdirs import user_data_dir
 
-from beastling.fileio.datareaders import iterlocations
+from beastling.fileio.datareaders import iterlocations, DataLoader, FeatureFilter
+from beastling.fileio.cache import DataCache
 import beastling.clocks.random as random_clock
 
 import beastling.models.geo as geo
 
 from beastling import sections
+from beastling import glottolog_store
+from beastling.glottolog import GlottologIndex
 from beastling.util import log
 from beastling.util import monophyly
-from beastling.util.misc import retrieve_url
+from beastling.util import starting_trees
+from beastling.util.misc import retrieve_url, sanitise_tree
+from beastling.util.symbols import SymbolTable
+from beastling.util.clades import Taxa, Clade
 
 import beastling.treepriors.base as treepriors
 from beastling.treepriors.coalescent import CoalescentTree
@@ -24,35 +29,41 @@ from beastling.distributions import Calibration
 _BEAST_MAX_LENGTH = 2147483647
 
 
-def get_glottolog_data(datatype, release):
+def get_glottolog_data(datatype, release, offline=False):
     """
     Lookup or download data from Glottolog.
 
     :param datatype: 'newick'|'geo'
     :param release: Glottolog release number >= '2.4'
+    :param offline: If True, fail rather than download missing data.
     :return: the path of the data file
     """
-    path_spec = {
-        'newick': ('glottolog-{0}.newick', 'tree-glottolog-newick.txt'),
-        'geo': ('glottolog-{0}-geo.csv', 'languages-and-dialects-geo.csv'),
-    }
-    fname_pattern, fname_source = path_spec[datatype]
-    fname = fname_pattern.format(release)
-
-    path = Path(__file__).parent / 'data' / fname
+    path = glottolog_store.data_path(glottolog_store.PACKAGE_DATA, datatype, release)
     if not path.exists():
         data_dir = Path(user_data_dir('beastling'))
-        if not data_dir.exists():
-            data_dir.mkdir(parents=True)
-        path = data_dir / fname
+        path = glottolog_store.data_path(data_dir, datatype, release)
         if not path.exists():
+            if offline:
+                raise ValueError(
+                    'No %s data for Glottolog %s available offline. Import the release with '
+                    '"beastling glottolog import".' % (datatype, release))
+            if not data_dir.exists():
+                data_dir.mkdir(parents=True)
+            # Download to a temporary file, so that an interrupted download
+            # does not leave an incomplete data file behind.
+            tmp = path.with_name(path.name + '.part')
             try:
                 retrieve_url(
-                    'https://glottolog.org/static/download/{0}/{1}'.format(release, fname_source),
-                    path)
+                    'https://glottolog.org/static/download/{0}/{1}'.format(
+                        release, glottolog_store.DATA_FILES[datatype][1]),
+                    tmp)
+                tmp.replace(path)
             except (IOError, ValueError):
+                if tmp.exists():
+                    tmp.unlink()
                 raise ValueError(
                     'Could not retrieve %s data for Glottolog %s' % (datatype, release))
+            glottolog_store.record_checksums(data_dir, release, datatype)
     return path
 
 
@@ -63,11 +74,19 @@ class Configuration(object):
     for all options.
     """
 
-    def __init__(self, basename="beastling", configfile=None, stdin_data=False, prior=False, force_glottolog_load=False):
+    def __init__(self, basename="beastling", configfile=None, stdin_data=False, prior=False,
+                 force_glottolog_load=False, glottolog=None, offline=False):
         """
         Set all options to their default values and then, if a configuration
         file has been provided, override the default values for those options
         set in the file.
+
+        A `GlottologIndex` for the configured Glottolog release may be passed
+        as `glottolog`, e.g. to share one memory-mapped index between many
+        configurations processed in worker processes.
+
+        With `offline`, Glottolog data is never downloaded: processing fails if
+        the configured release is not available locally.
         """
         cli_params = {k: v for k, v in locals().items()}
 
@@ -90,7 +109,10 @@ class Configuration(object):
         # Glottolog data
         self.glottolog_loaded = False
         self.force_glottolog_load = force_glottolog_load
+        self.shared_glottolog = glottolog
+        self.glottolog = None
         self.classifications = {}
+        self.language_glottocodes = {}
         self.glotto_macroareas = {}
         self.locations = {}
 
@@ -100,6 +122,16 @@ class Configuration(object):
         # Stuff we compute ourselves
         self.processed = False
         self._files_to_embed = []
+        self.symbols = SymbolTable()
+        """A table of the identifiers of all languages and features in the analysis."""
+        self.taxa = Taxa([])
+        """The final languages of the analysis, from which all clades are drawn."""
+        self.starting_tree_computed = False
+        """A boolean value, True if the starting tree was computed from the data by BEASTling."""
+        self.sparse_languages = set()
+        self._selected_languages = (None, set())
+        self._family_ranges = (None, [])
+        self._clade_languages = (None, {})
 
         # Now read the config ...
         self.cfg = ConfigParser(interpolation=None)
@@ -146,6 +178,7 @@ class Configuration(object):
 
         # [admin]
         self.admin = sections.Admin.from_config(cli_params, 'admin', self.cfg)
+        self.offline = offline or self.admin.offline
         # [mcmc]
         self.mcmc = sections.MCMC.from_config(
             cli_params, 'mcmc' if self.cfg.has_section('mcmc') else 'MCMC', self.cfg)
@@ -216,6 +249,8 @@ class Configuration(object):
             "birthdeath": treepriors.BirthDeathTree,
             "coalescent": CoalescentTree
         }[self.languages.tree_prior]()
+        if self.languages.starting_tree in sections.AUTO_STARTING_TREES:
+            self.build_starting_tree()
 
         # Now we can set the value of the ascertained attribute of each model
         # Ideally this would happen during process_models, but this is impossible
@@ -241,6 +276,26 @@ class Configuration(object):
         else:
             self.tree_logging_pointless = False
 
+    def build_starting_tree(self):
+        """
+        Replace a starting tree specification like `auto-distance` by a tree
+        computed from the data.
+        """
+        if self.languages.starting_tree == 'auto-parsimony':
+            log.info(
+                "Searching a starting tree under parsimony with up to %s rearrangements."
+                % self.languages.starting_tree_search_moves)
+            tree = starting_trees.parsimony_tree(
+                self,
+                self.languages.starting_tree_search_moves,
+                self.languages.starting_tree_search_time)
+        else:
+            log.info(
+                "Computing a starting tree by UPGMA from the distances between languages.")
+            tree = starting_trees.distance_tree(self)
+        self.languages.starting_tree = sanitise_tree(tree, 'starting', self.languages.languages)
+        self.starting_tree_computed = True
+
     def define_language_groups(self):
         """Parse the [language_groups] section.
 
@@ -253,13 +308,14 @@ class Configuration(object):
         such that language groups can be specified using external sources.
 
         """
-        self.language_groups = {language: {language} for language in self.languages.languages}
-        self.language_groups["root"] = set(self.languages.languages)
+        self.language_groups = {
+            language: self.taxa.clade((language,)) for language in self.languages.languages}
+        self.language_groups["root"] = self.taxa.root
 
         for name, specification in self.language_group_configs.items():
-            taxa = set()
+            taxa = self.taxa.clade()
             for already_defined in specification:
-                taxa |= set(self.language_group(already_defined.strip()))
+                taxa |= self.language_group(already_defined.strip())
             self.language_groups[name] = taxa
 
     def load_glottolog_data(self):
@@ -277,48 +333,21 @@ class Configuration(object):
             return
         self.glottolog_loaded = True
 
-        self.classifications, glottocode2node, label2name = monophyly.classifications_from_newick(
-           str(get_glottolog_data('newick', self.admin.glottolog_release)))
-
-        # Load geographic metadata
-        dialects = []
-        for t in reader(
-                get_glottolog_data('geo', self.admin.glottolog_release), dicts=True):
-            identifiers = [t['glottocode']] +t['isocodes'].split()
-            if t['level'] == "dialect":
-                dialects.append((t, identifiers))
-            if t['macroarea']:
-                for id_ in identifiers:
-                    self.glotto_macroareas[id_] = t['macroarea']
-
-            if t['latitude'] and t['longitude']:
-                latlon = (float(t['latitude']), float(t['longitude']))
-                for id_ in identifiers:
-                    self.locations[id_] = latlon
-
-        # Second pass of geographic data to handle dialects, which inherit
-        # their parent language's location
-        for t, identifiers in dialects:
-            failed = False
-            if t['glottocode'] not in glottocode2node:  # pragma: no cover
-                # This may only happen for newick downloads of older Glottolog releases, where
-                # possibly isolates may not be included.
-                continue
-            node = glottocode2node[t['glottocode']]
-            ancestor = node.ancestor
-            while label2name[ancestor.name][1] not in self.locations:
-                if not ancestor.ancestor:
-                    # We've hit the root without finding an ancestral node
-                    # with location data!
-                    failed = True
-                    break
-                else:
-                    ancestor = ancestor.ancestor
-            if failed:
-                continue
-            latlon = self.locations[label2name[ancestor.name][1]]
-            for id_ in identifiers:
-                self.locations[id_] = latlon
+        index = self.shared_glottolog
+        if index is None:
+            release = self.admin.glottolog_release
+            index = GlottologIndex.load(
+                get_glottolog_data('newick', release, offline=self.offline),
+                get_glottolog_data('geo', release, offline=self.offline),
+                glottolog_store.index_path(user_data_dir('beastling'), release))
+        self.glottolog = index
+        # Ancestor lists are computed from the clade index when a languoid is
+        # first looked up; the rest of the index is only read where touched.
+        self.classifications = index.classifications()
+        # The index is read-only, and may be shared with other processes, so
+        # we store our additions separately.
+        self.glotto_macroareas = collections.ChainMap(self.glotto_macroareas, index.macroareas)
+        self.locations = collections.ChainMap(self.locations, index.locations)
 
     def check_glottolog_required(self):
         # We need Glottolog if...
@@ -340,8 +369,13 @@ class Configuration(object):
     def load_user_geo(self):
         if self.geography:
             # Read location data from file, patching (rather than replacing) Glottolog
+            patched = {}
             for loc_file in self.geography.data:
-                self.locations.update(dict(iterlocations(loc_file)))
+                patched.update(iterlocations(loc_file))
+            self.locations.update(patched)
+            # Dialects of patched languages inherit the new locations.
+            if self.glottolog is not None and patched:
+                self.glottolog.inherit_locations(self.locations, patched)
 
     def build_language_filter(self):
         """
@@ -360,6 +394,10 @@ class Configuration(object):
 
         # Enforce minimum data constraint
         all_langs = set(itertools.chain(*[model.data.keys() for model in self.models]))
+        # Every model covers the languages of all models, if only with
+        # missing data.
+        for model in self.models:
+            model.data = model.data.with_languages(sorted(all_langs))
         N = sum([max([len(lang.keys()) for lang in model.data.values()]) for model in self.models])
         datapoint_props = {}
         for lang in all_langs:
@@ -367,8 +405,8 @@ class Configuration(object):
             for model in self.models:
                 count += len([x for x in model.data[lang].values() if x])
             datapoint_props[lang] = 1.0*count / N
-        self.sparse_languages = [
-            l for l in all_langs if datapoint_props[l] < self.languages.minimum_data]
+        self.sparse_languages = {
+            l for l in all_langs if datapoint_props[l] < self.languages.minimum_data}
 
     @property
     def files_to_embed(self):
@@ -378,20 +416,71 @@ class Configuration(object):
         return res
 
     def filter_language(self, l):
-        if self.languages.languages and l not in self.languages.languages:
+        if not self.select_language(l):
             return False
-        if self.languages.families and not any(
-                name in self.languages.families or glottocode in self.languages.families
-                for (name, glottocode) in self.classifications.get(l,[])):
+        if l in self.sparse_languages:
             return False
-        if self.languages.macroareas and self.glotto_macroareas.get(l,None) not in self.languages.macroareas:
+        return True
+
+    def select_language(self, l, glottocode=None):
+        """
+        Check a language against those filters in [languages] which do not
+        depend on the data, i.e. all filters except minimum_data.
+
+        If the language's Glottocode is known, it is used for Glottolog
+        lookups, as is done for languages from CLDF datasets once they are
+        loaded.
+        """
+        if self.languages.languages and l not in self.selected_languages():
             return False
-        if self.languages.exclusions and l in self.languages.exclusions:
+        if self.languages.families and not self.in_families(l, glottocode):
             return False
-        if l in self.sparse_languages:
+        if self.languages.macroareas and self.glotto_macroareas.get(
+                glottocode, self.glotto_macroareas.get(l,None)) not in self.languages.macroareas:
+            return False
+        if self.languages.exclusions and l in self.languages.exclusions:
             return False
         return True
 
+    def glottocode(self, l):
+        """
+        Return the Glottocode of the Glottolog languoid a language identifier
+        refers to, or None.
+        """
+        if self.glottolog is None:
+            return None
+        for key in (l, l.lower()):
+            if key in self.language_glottocodes:
+                return self.language_glottocodes[key]
+            i = self.glottolog.node(key)
+            if i is not None:
+                return self.glottolog.clades.glottocode(i)
+
+    def in_families(self, l, glottocode=None):
+        """
+        Check whether a language belongs to one of the families given in
+        [languages].
+        """
+        if self.glottolog is None:
+            return False
+        clades = self.glottolog.clades
+        if self._family_ranges[0] is not self.languages.families:
+            self._family_ranges = (
+                self.languages.families, clades.ranges(self.languages.families))
+        if glottocode not in clades:
+            glottocode = self.glottocode(l)
+        return clades.in_ranges(self._family_ranges[1], glottocode)
+
+    def selected_languages(self):
+        """
+        Return the languages given in [languages] as set, for fast lookup.
+        """
+        # Cache the set as long as the list of languages is not replaced.
+        if self._selected_languages[0] is not self.languages.languages:
+            self._selected_languages = (
+                self.languages.languages, set(self.languages.languages))
+        return self._selected_languages[1]
+
     def handle_monophyly(self):
         """
         Construct a representation of the Glottolog monophyly constraints
@@ -416,7 +505,8 @@ class Configuration(object):
         if len(langs) != len(self.languages.languages):
             # Warn the user that some taxa aren't in Glottolog and hence will be
             # forced into an outgroup.
-            missing_langs = [l for l in self.languages.languages if l not in langs]
+            found = set(langs)
+            missing_langs = [l for l in self.languages.languages if l not in found]
             missing_langs.sort()
             missing_str = ",".join(missing_langs[0:3])
             missing_count = len(missing_langs)
@@ -471,6 +561,21 @@ class Configuration(object):
             for config in self.models:
                 config["data"] = "stdin"
 
+        # Only filters which do not depend on the data can be applied while
+        # loading it.
+        self.data_loader = DataLoader(
+            workers=self.admin.data_workers,
+            cache=DataCache() if self.admin.cache_data else None,
+            language_filter=None if self.languages.minimum_data else self.select_language,
+            symbols=self.symbols)
+        for config in self.models:
+            if config.data is not None:
+                self.data_loader.request(
+                    config.data,
+                    FeatureFilter(config.features, config.exclusions),
+                    **config.reader_options)
+        self.data_loader.start()
+
         self.models = [model.get_model(self) for model in self.models]
 
         if self.geography:
@@ -592,12 +697,17 @@ class Configuration(object):
 
         ## Perform subsampling, if requested
         self.languages.languages = sorted(self.subsample_languages(self.languages.languages))
+        self.taxa = Taxa(self.languages.languages)
         log.info("{:d} languages included in analysis: {:}".format(
             len(self.languages.languages), self.languages.languages))
 
         ## SPREAD THE WORD!
+        selected = set(self.languages.languages)
         for m in self.models:
-            m.languages = [l for l in m.languages if l in self.languages.languages]
+            m.languages = [l for l in m.languages if l in selected]
+
+        if self.glottolog_loaded:
+            self.clade_languages()
 
         self.languages.sanitise_trees()
 
@@ -637,6 +747,8 @@ class Configuration(object):
         self.tip_calibrations = {}
         """ Starting heights for calibrated tips """
         useless_calibrations = []
+        # The monophyly tree is only parsed once we need it.
+        mono_tree = None
         for clade, cs in self.calibration_configs.items():
             orig_clade = clade[:]
             originate = False
@@ -671,7 +783,7 @@ class Configuration(object):
             elif originate:
                 ## Originate calibrations on single taxa are always valid
                 pass
-            elif "," not in clade and clade in self.languages.languages:
+            elif "," not in clade and clade in self.taxa:
                 ## This looks like a tip calibration, i.e. the user has specified
                 ## only one identifier, not a comma-separated list, and that
                 ## identifier matches a language, not a Glottolog family that we
@@ -679,7 +791,7 @@ class Configuration(object):
                 log.info("Calibration on '%s' taken as tip age calibration." % clade)
                 is_tip_calibration = True
                 self.languages.tree_prior = "coalescent"
-            else: # pragma: no cover
+            else:
                 # At this point we have a non-originate calibration on
                 # a single taxa, which is not the result of
                 # specifically asking for only this taxa. Probably the
@@ -695,35 +807,19 @@ class Configuration(object):
                     "Calibration on clade '%s' matches only one language. Ignoring due to "
                     "ambiguity. Use 'originate(%s)' if this was supposed to be an originate "
                     "calibration, or explicitly identify the single language using '%s' if this "
-                    "was supposed to be a tip calibration." % (clade, clade, langs[0]))
+                    "was supposed to be a tip calibration." % (clade, clade, next(iter(langs))))
                 continue
 
             # Make sure this calibration point, which will induce a monophyly
             # constraint, does not conflict with the overall monophyly
             # constraints from Glottolog or a user-tree
             if self.languages.monophyly and len(langs) > 1:
-                mono_tree = newick.loads(self.languages.monophyly_newick)[0]
-                cal_clade = set(langs)
-                for node in mono_tree.walk():
-                    mono_clade = set(node.get_leaf_names())
-                    # If the calibration clade is not a subset of this monophyly clade, keep searching
-                    if not cal_clade.issubset(mono_clade):
-                        continue
-                    # At this point, we can take it for granted the cal clade is a subset of the mono_clade
-                    # We are happy if the calibration clade is exactly this monophyly clade
-                    if mono_clade == cal_clade:
-                        break
-                    # We are also happy if this mono_clade is a "terminal clade", i.e. has no finer structure
-                    # which the calibration clade may violate
-                    elif all((child.is_leaf for child in node.descendants)):
-                        break
-                    # We are also happy if the calibration clade is a union of descendant mono clades
-                    elif all(set(child.get_leaf_names()).issubset(cal_clade) or len(set(child.get_leaf_names()).intersection(cal_clade)) == 0 for child in node.descendants):
-                        break
-                else:
-                    # If we didn't break out of this loop, then the languages
-                    # in this calibration do not constitute a clade of the
-                    # monophyly tree
+                if mono_tree is None:
+                    mono_tree = monophyly.MonophylyTree(
+                        self.languages.monophyly_newick, self.taxa)
+                if not mono_tree.is_compatible(langs):
+                    # The languages in this calibration do not constitute a
+                    # clade of the monophyly tree
                     raise ValueError("Calibration on for clade %s violates a monophyly constraint!" % (clade))
 
             # Next parse the calibration string and build a Calibration object
@@ -748,15 +844,38 @@ class Configuration(object):
             else:
                 self.calibrations[clade_identifier] = cal_obj
 
+    def clade_languages(self):
+        """
+        Return a `dict` mapping the (lowercase) names and Glottocodes of all
+        Glottolog clades the analysis languages belong to, to the `Clade` of
+        analysis languages in the clade.
+        """
+        # The index is built once for the final list of languages, i.e. is
+        # only rebuilt if the list is replaced.
+        if self._clade_languages[0] is not self.languages.languages:
+            if list(self.taxa) != self.languages.languages:
+                self.taxa = Taxa(self.languages.languages)
+            index = collections.defaultdict(int)
+            for l in self.taxa:
+                bit = 1 << self.taxa.bits[l]
+                for name, glottocode in self.classifications.get(l.lower(), ""):
+                    index[name.lower()] |= bit
+                    index[glottocode] |= bit
+            self._clade_languages = (
+                self.languages.languages,
+                {k: Clade(self.taxa, mask) for k, mask in index.items()})
+        return self._clade_languages[1]
+
     def get_languages_by_glottolog_clade(self, clade):
         """
-        Given a comma-separated list of Glottolog ids, return a list of all
+        Given a comma-separated list of Glottolog ids, return the `Clade` of all
         languages descended from the corresponding Glottolog nodes.
         """
         clades = set(c.strip() for c in clade.split(","))
 
         # First look for clades which are actually language identifiers
-        langs = matched_clades = clades.intersection(self.languages.languages)
+        matched_clades = set(c for c in clades if c in self.taxa)
+        langs = self.taxa.clade(matched_clades)
 
         # Once a clade has matched against a language name, don't let it
         # subsequently match against anything in Glottolog!
@@ -764,13 +883,9 @@ class Configuration(object):
 
         if clades:
             # Now search against Glottolog
-            clades = [c.lower() for c in clades]
-            for l in self.languages.languages:
-                # No repeated matching!
-                if l not in langs:
-                    for name, glottocode in self.classifications.get(l.lower(), ""):
-                        if name.lower() in clades or glottocode in clades:
-                            langs.add(l)
-                            break
-
-        return list(langs)
+            index = self.clade_languages()
+            for c in clades:
+                if c.lower() in index:
+                    langs |= index[c.lower()]
+
+        return langs
@@ -4,6 +4,7 @@ import math
 import attr
 
 from beastling.util import xml
+from beastling.util.clades import Clade
 
 __all__ = ['Distribution', 'Calibration']
 
@@ -280,7 +281,8 @@ class Distribution(object):
 
 @attr.s
 class Calibration(Distribution):
-    langs = attr.ib(default=attr.Factory(list), validator=attr.validators.instance_of((list, set)))
+    langs = attr.ib(
+        default=attr.Factory(list), validator=attr.validators.instance_of((list, set, Clade)))
     originate = attr.ib(default=False, validator=attr.validators.instance_of(bool))
 
     @classmethod
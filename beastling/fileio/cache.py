@@ -0,0 +1,123 @@
+import os
+import json
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+from appdirs import user_data_dir
+
+from beastling.util import log
+
+__all__ = ['DataCache']
+
+# Bump this whenever the pickled form of parsed datasets changes.
+CACHE_FORMAT_VERSION = 1
+
+
+def dataset_files(filename):
+    """
+    Return the list of files which make up a dataset, i.e. the files whose
+    content determines the result of parsing it.
+
+    For CLDF metadata files, this includes all tables referenced by the
+    metadata.
+    """
+    filename = Path(filename)
+    res = [filename]
+    if filename.suffix == '.json':
+        with filename.open(encoding='utf8') as fp:
+            md = json.load(fp)
+        for table in md.get('tables', []):
+            if table.get('url'):
+                path = filename.parent / table['url']
+                if path.exists():
+                    res.append(path)
+    return res
+
+
+def content_hash(filenames, chunk_size=2 ** 20):
+    """
+    Return the SHA-256 hex digest of the concatenated content of files.
+    """
+    digest = hashlib.sha256()
+    for filename in filenames:
+        with Path(filename).open('rb') as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DataCache(object):
+    """
+    An on-disk cache of parsed datasets, stored as pickles in the user data
+    directory.
+
+    Entries are keyed by the content hash of the dataset files and by the
+    options passed to the reader, so any change to a data file results in a
+    cache miss.  When the cache grows beyond `max_bytes`, least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, directory=None, max_bytes=2 ** 30):
+        self.directory = Path(directory or Path(user_data_dir('beastling')) / 'cache')
+        self.max_bytes = max_bytes
+
+    def key(self, filename, **options):
+        """
+        Compute the cache key for parsing `filename` with the given options.
+        """
+        options['content'] = content_hash(dataset_files(filename))
+        options['version'] = CACHE_FORMAT_VERSION
+        return hashlib.sha256(
+            json.dumps(options, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    def path(self, key):
+        return self.directory / '{0}.pickle'.format(key)
+
+    def get(self, key):
+        """
+        Return the cached object for a key, or None if there is none.
+        """
+        path = self.path(key)
+        if not path.exists():
+            return None
+        try:
+            with path.open('rb') as fp:
+                res = pickle.load(fp)
+        except Exception:  # pragma: no cover
+            # A truncated or otherwise unreadable entry is just a cache miss.
+            path.unlink()
+            return None
+        # Mark this entry as recently used.
+        os.utime(str(path))
+        log.info('Loaded parsed data from cache {0}'.format(path))
+        return res
+
+    def put(self, key, obj):
+        """
+        Store an object under a key and evict old entries if necessary.
+        """
+        if not self.directory.exists():
+            self.directory.mkdir(parents=True)
+        # Write to a temporary file first, so concurrent readers never see a
+        # partially written entry.
+        fd, tmp = tempfile.mkstemp(dir=str(self.directory), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, str(self.path(key)))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into max_bytes.
+        """
+        entries = [(p.stat(), p) for p in self.directory.glob('*.pickle')]
+        entries.sort(key=lambda e: e[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in entries)
+        # Never evict the most recent entry, even if it alone is too big.
+        for stat, path in entries[:-1]:
+            if size <= self.max_bytes:
+                break
+            path.unlink()
+            size -= stat.st_size
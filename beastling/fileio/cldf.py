@@ -0,0 +1,106 @@
+import csv
+import json
+from pathlib import Path
+
+__all__ = ['TrustedDataset']
+
+CLDF_TERMS = "http://cldf.clld.org/v1.0/terms.rdf#"
+
+
+def _term(url):
+    if url and url.startswith(CLDF_TERMS):
+        return url[len(CLDF_TERMS):]
+
+
+class _Columns(object):
+    """
+    Maps CLDF properties to the column names of a component, like the
+    namespaces in `pycldf.Dataset.column_names`.  Unknown properties are None.
+    """
+    def __init__(self, properties):
+        self.__dict__.update(properties)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return None
+
+
+class TrustedTable(object):
+    """
+    A table of a CLDF dataset, read with the csv module.
+    """
+    def __init__(self, path, spec, dialect):
+        self.path = path
+        dialect = dict(dialect, **spec.get('dialect', {}))
+        self.encoding = dialect.get('encoding', 'utf-8')
+        if self.encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+            self.encoding = 'utf-8-sig'
+        self.fmtparams = dict(
+            delimiter=dialect.get('delimiter', ','),
+            quotechar=dialect.get('quoteChar', '"'),
+            doublequote=dialect.get('doubleQuote', True),
+            skipinitialspace=dialect.get('skipInitialSpace', False))
+        self.comment_prefix = dialect.get('commentPrefix', '#')
+        self.columns = spec.get('tableSchema', {}).get('columns', [])
+        # Header cells may contain the column titles instead of the names.
+        self.names = {}
+        for col in self.columns:
+            titles = col.get('titles', [])
+            if isinstance(titles, (str, dict)):
+                titles = [titles]
+            for title in titles:
+                if isinstance(title, dict):
+                    for t in title.values():
+                        self.names[t] = col['name']
+                else:
+                    self.names[title] = col['name']
+            if 'name' in col:
+                self.names[col['name']] = col['name']
+
+    def properties(self):
+        return {
+            _term(col.get('propertyUrl')): col['name']
+            for col in self.columns if _term(col.get('propertyUrl')) and 'name' in col}
+
+    def iterdicts(self):
+        with self.path.open(encoding=self.encoding, newline='') as fp:
+            reader = csv.reader(fp, **self.fmtparams)
+            header = [self.names.get(h, h) for h in next(reader, [])]
+            for row in reader:
+                if self.comment_prefix and row and row[0].startswith(self.comment_prefix):
+                    continue
+                # Empty cells are null values, as in csvw.
+                yield {k: v or None for k, v in zip(header, row)}
+
+    __iter__ = iterdicts
+
+
+class TrustedDataset(object):
+    """
+    A CLDF dataset described by a metadata file, which is read without any
+    validation or type conversion of the data.
+
+    Only the parts of the `pycldf.Dataset` API which BEASTling uses are
+    provided, i.e. `module`, `column_names` and access to component tables by
+    name.  All values are strings (or None for empty cells).
+    """
+    def __init__(self, metadata):
+        metadata = Path(metadata)
+        with metadata.open(encoding='utf8') as fp:
+            md = json.load(fp)
+        self.module = _term(md.get('dc:conformsTo')) or 'Generic'
+        dialect = md.get('dialect', {})
+        self.tables = {}
+        for spec in md.get('tables', []):
+            component = _term(spec.get('dc:conformsTo'))
+            if component:
+                self.tables[component] = TrustedTable(
+                    metadata.parent / spec['url'], spec, dialect)
+        self.column_names = _Columns({
+            # pycldf names the namespaces like "forms" for "FormTable".
+            component[:-len('Table')].lower() + 's': _Columns(table.properties())
+            for component, table in self.tables.items()})
+
+    def __getitem__(self, component):
+        return self.tables[component]
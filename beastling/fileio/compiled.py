@@ -0,0 +1,123 @@
+"""
+A binary format for datasets, which can be loaded without parsing.
+
+A compiled data file consists of
+
+- a header: the magic bytes, the format version and the length of the
+  symbol table,
+- the symbol table: JSON encoded language and feature identifiers, the
+  codebooks of all features, the mapping of language IDs to Glottocodes and
+  the options the data was read with,
+- the integer-coded feature matrix, as one column of little-endian unsigned
+  32 bit codes per feature, starting at an 8 byte boundary.
+
+The matrix is memory-mapped when loading, so processes loading the same
+compiled file share its pages rather than each holding a copy of the data.
+"""
+import sys
+import mmap
+import json
+import array
+import struct
+from pathlib import Path
+
+from beastling.fileio.matrix import FeatureMatrix
+
+__all__ = ['SUFFIX', 'is_compiled', 'write_compiled', 'load_compiled']
+
+MAGIC = b'BEASTLNG'
+FORMAT_VERSION = 1
+SUFFIX = '.bdat'
+HEADER = struct.Struct('<8sIIQ')
+# The options of `load_data` which determine how a data file is read.
+READER_OPTIONS = ('file_format', 'lang_column', 'value_column')
+
+
+def _aligned(offset):
+    return offset + (-offset % 8)
+
+
+def is_compiled(filename):
+    """
+    Check whether a file is a compiled data file, by its magic bytes.
+    """
+    try:
+        with Path(filename).open('rb') as fp:
+            return fp.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def write_compiled(data, language_code_map, filename, reader_options=None):
+    """
+    Write a FeatureMatrix with multiple values per cell to a compiled data
+    file.
+
+    :param reader_options: `dict` with the values of `READER_OPTIONS` the data was read with.
+    """
+    assert data.multiple
+    symbols = json.dumps(dict(
+        languages=data.languages,
+        features=data.features,
+        codebooks=[[list(v) for v in data.codebook(f)[1:]] for f in data.features],
+        language_code_map=language_code_map,
+        reader_options={k: (reader_options or {}).get(k) for k in READER_OPTIONS},
+    )).encode('utf8')
+    with Path(filename).open('wb') as fp:
+        fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(symbols)))
+        fp.write(symbols)
+        fp.write(b'\0' * (_aligned(HEADER.size + len(symbols)) - HEADER.size - len(symbols)))
+        for feature in data.features:
+            column = array.array('I', data.column(feature))
+            if sys.byteorder != 'little':  # pragma: no cover
+                column.byteswap()
+            fp.write(column.tobytes())
+
+
+def load_compiled(filename, expect_multiple=False, **reader_options):
+    """
+    Load a compiled data file.
+
+    Reader options (see `READER_OPTIONS`) which are given must match those the
+    file was compiled with, because the data cannot be read again with other
+    options.
+
+    Returns
+    -------
+    (FeatureMatrix, dict)
+        The data and a mapping of language IDs to Glottocodes.
+    """
+    with Path(filename).open('rb') as fp:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mm) < HEADER.size:
+        raise ValueError('{0} is not a compiled BEASTling data file'.format(filename))
+    magic, version, _, size = HEADER.unpack_from(mm)
+    if magic != MAGIC:
+        raise ValueError('{0} is not a compiled BEASTling data file'.format(filename))
+    if version != FORMAT_VERSION:
+        raise ValueError('{0} was compiled with an incompatible version of BEASTling'.format(
+            filename))
+    symbols = json.loads(mm[HEADER.size:HEADER.size + size].decode('utf8'))
+    compiled_options = symbols.get('reader_options', {})
+    for name in READER_OPTIONS:
+        value = reader_options.get(name)
+        if value is not None and value != compiled_options.get(name):
+            raise ValueError(
+                '{0} was compiled with {1}={2}, not {3}; compile the data file again with '
+                'these options'.format(filename, name, compiled_options.get(name), value))
+
+    data = FeatureMatrix(multiple=expect_multiple)
+    data.add_languages(symbols['languages'])
+    offset, nbytes = _aligned(HEADER.size + size), 4 * len(data.languages)
+    buffer = memoryview(mm)
+    for feature, codebook in zip(symbols['features'], symbols['codebooks']):
+        column = buffer[offset:offset + nbytes].cast('I')
+        if sys.byteorder != 'little':  # pragma: no cover
+            column = array.array('I', column)
+            column.byteswap()
+        # Without multiple values, a cell holds the last value, as with
+        # FeatureMatrix.set.
+        data.add_coded_feature(
+            feature, [tuple(v) if expect_multiple else v[-1] for v in codebook], column)
+        offset += nbytes
+    return data, symbols['language_code_map']
@@ -1,8 +1,10 @@
 import csv
 import sys
+import codecs
+import functools
 import typing
 import collections
-from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor
 import chardet
 import warnings
 
@@ -12,11 +14,18 @@ from pathlib import Path
 from csvw.dsv import UnicodeDictReader
 
 from beastling.util import log
+from beastling.util.fileio import COMPRESSION_SUFFIXES, data_suffix, open_binary, open_text
+from beastling.fileio.matrix import FeatureMatrix
+from beastling.fileio.cldf import TrustedDataset
+from beastling.fileio.compiled import SUFFIX, is_compiled, load_compiled, write_compiled
 
 
 def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel):
     """Read the beginning of the file and guess its csv dialect.
 
+    Results are memoised per file, keyed by path, modification time and
+    size, so sniffing the same file repeatedly is cheap.
+
     Parameters
     ----------
     filename: str or pathlib.Path
@@ -26,20 +35,80 @@ def sniff(filename, default_dialect: typing.Optional[csv.Dialect] = csv.excel):
     -------
     csv.Dialect
     """
-    with Path(filename).open("rb") as fp:
+    path = Path(filename).resolve()
+    stat = path.stat()
+    return _sniff(str(path), stat.st_mtime_ns, stat.st_size, default_dialect)
+
+
+_BOMS = [
+    # UTF-32 must be checked before UTF-16, because the UTF-32-LE BOM starts
+    # with the UTF-16-LE BOM.
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def detect_encoding(sample):
+    """Guess the encoding of the bytes at the beginning of a file.
+
+    Byte order marks and valid UTF-8 are recognised directly, only other
+    input is passed to chardet.
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # Decode incrementally, because the sample may end in the middle of a
+        # multi-byte character.
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return chardet.detect(sample)["encoding"]
+
+
+def _dialect_from_header(header):
+    """Determine the dialect from the delimiters in the header line.
+
+    Returns None if the header is ambiguous, i.e. if it contains quotes or
+    both or none of the possible delimiters.
+    """
+    header = header.rstrip('\r')
+    if '"' in header:
+        return None
+    delimiters = [d for d in (",", "\t") if d in header]
+    if len(delimiters) != 1:
+        return None
+    delimiter = delimiters[0]
+    fields = header.split(delimiter)
+    return type('sniffed', (csv.excel,), dict(
+        delimiter=delimiter,
+        skipinitialspace=all(f.startswith(' ') for f in fields[1:])))
+
+
+@functools.lru_cache(maxsize=256)
+def _sniff(filename, mtime, size, default_dialect):
+    with open_binary(filename) as fp:
         # On large files, csv.Sniffer seems to need a lot of data to make a
         # successful inference...
         sample = fp.read(1024)
-        encoding = chardet.detect(sample)["encoding"]
-        sample = sample.decode(encoding)
+        encoding = detect_encoding(sample)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        sample = decoder.decode(sample)
+        dialect = _dialect_from_header(sample.split("\n")[0])
+        if dialect:
+            dialect.encoding = encoding
+            return dialect
         while True:
             try:
                 dialect = csv.Sniffer().sniff(sample, [",", "\t"])
                 dialect.encoding = encoding
                 return dialect
             except csv.Error: # pragma: no cover
-                blob = fp.read(1024).decode(encoding)
-                sample += blob
+                blob = fp.read(1024)
+                sample += decoder.decode(blob)
                 if not blob:
                     # If blob is emtpy we've somehow hit the end of the file
                     # without figuring out the dialect.  Something is probably
@@ -59,32 +128,236 @@ def sanitise_name(name):
     return name.replace(" ", "_")
 
 
-def load_data(filename, file_format=None, lang_column=None, value_column=None, expect_multiple=False):
+def load_data(filename, file_format=None, lang_column=None, value_column=None, expect_multiple=False,
+              trusted=False, cache=None, feature_filter=None, language_filter=None):
+    """Load a dataset from a file.
+
+    Parameters
+    ----------
+    filename: pathlib.Path or 'stdin'
+        Path to the data file (or CLDF metadata file)
+    trusted: bool
+        If True, CLDF datasets described by a metadata file are read without
+        validating the data, which is much faster for big datasets.
+    cache: beastling.fileio.cache.DataCache or None
+        If given, parsed datasets are looked up in and stored in this cache.
+    feature_filter: callable or None
+        If given, only features for which `feature_filter(feature_id)` is true
+        are loaded.
+    language_filter: callable or None
+        If given, only languages for which
+        `language_filter(language_id, glottocode)` is true are loaded. The
+        Glottocode is `None` if the dataset does not provide one.
+
+    Returns
+    -------
+    (FeatureMatrix, dict)
+        The data and a mapping of language IDs to Glottocodes.
+    """
+    filters = dict(feature_filter=feature_filter, language_filter=language_filter)
+    # Compiled data files load faster than the cache.
+    if cache is None or str(filename) == 'stdin' or is_compiled(filename):
+        return _load_data(
+            filename, file_format, lang_column, value_column, expect_multiple, trusted, **filters)
+    key = cache.key(
+        filename,
+        file_format=file_format,
+        lang_column=lang_column,
+        value_column=value_column,
+        expect_multiple=expect_multiple,
+        trusted=trusted)
+    res = cache.get(key)
+    if res is None:
+        res = _load_data(filename, file_format, lang_column, value_column, expect_multiple, trusted)
+        cache.put(key, res)
+    # The cache holds unfiltered data, so it can be shared by analyses using
+    # different filters.
+    return apply_filters(*res, **filters)
+
+
+def compile_data(filename, output=None, **options):
+    """Parse a dataset and save it as compiled data file, which loads fast.
+
+    Parameters
+    ----------
+    filename: pathlib.Path
+        Path to the data file (or CLDF metadata file)
+    output: pathlib.Path or None
+        Path of the compiled data file, by default `filename` with the suffix
+        replaced by ".bdat"
+    options:
+        Further keyword arguments are passed into `load_data`, and the reader
+        options among them are recorded in the compiled data file
+
+    Returns
+    -------
+    pathlib.Path
+        The path of the compiled data file.
+    """
+    if not output:
+        output = Path(filename)
+        if output.suffix.lower() in COMPRESSION_SUFFIXES:
+            output = output.with_suffix('')
+        output = output.with_suffix(SUFFIX)
+    data, language_code_map = load_data(filename, expect_multiple=True, **options)
+    # The reader options are recorded, so that loading the compiled data with
+    # other options fails rather than silently ignoring them.
+    write_compiled(data, language_code_map, output, reader_options=options)
+    return output
+
+
+class FeatureFilter(object):
+    """
+    A (picklable) feature filter, selecting the features listed in a model
+    config.
+    """
+    def __init__(self, features=None, exclusions=None):
+        self.features = None if not features or features == ["*"] else set(features)
+        self.exclusions = set(exclusions or [])
+
+    def __call__(self, feature):
+        return (self.features is None or feature in self.features) and feature not in self.exclusions
+
+
+class DataLoader(object):
+    """
+    Loads the data files for the models of an analysis.
+
+    Each file is parsed only once for all models reading it with the same
+    options, and the resulting data is shared between these models.  Models
+    must therefore not modify it, but derive new matrices with the methods of
+    FeatureMatrix instead.  With more than one worker, files are parsed
+    concurrently in a process pool as soon as `start` is called.
+
+    If a SymbolTable is given, the identifiers of languages and features are
+    interned through it.
+    """
+    def __init__(self, workers=1, cache=None, language_filter=None, symbols=None):
+        self.workers = workers
+        self.cache = cache
+        self.language_filter = language_filter
+        self.symbols = symbols
+        self._requests = collections.OrderedDict()
+        self._results = {}
+
+    @staticmethod
+    def _key(filename, options):
+        return str(filename), tuple(sorted(options.items()))
+
+    def request(self, filename, feature_filter=None, **options):
+        """
+        Register a data file which will be loaded with the given options.
+        """
+        self._requests.setdefault(
+            self._key(filename, options), (filename, options, []))[2].append(feature_filter)
+
+    def _feature_filter(self, key):
+        # Only data read by a single model can be restricted to its features.
+        filters = self._requests[key][2] if key in self._requests else [None]
+        return filters[0] if len(filters) == 1 else None
+
+    def start(self):
+        """
+        Start parsing all requested data files concurrently.
+        """
+        if self.workers <= 1:
+            return
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        for key, (filename, options, _) in self._requests.items():
+            if str(filename) == 'stdin' or is_compiled(filename):
+                # Only this process can read from stdin, and compiled data is
+                # best memory-mapped by this process, too.
+                continue
+            # The language filter depends on the configuration and is applied
+            # once the data is back in this process.
+            self._results[key] = executor.submit(
+                load_data,
+                filename,
+                cache=self.cache,
+                feature_filter=self._feature_filter(key),
+                **options)
+        executor.shutdown(wait=False)
+
+    def get(self, filename, **options):
+        """
+        Return the data loaded from a file with the given options.
+
+        Returns
+        -------
+        (FeatureMatrix, dict)
+            The data and a mapping of language IDs to Glottocodes.
+        """
+        key = self._key(filename, options)
+        res = self._results.get(key)
+        if res is None or isinstance(res, Future):
+            if res is None:
+                res = load_data(
+                    filename,
+                    cache=self.cache,
+                    feature_filter=self._feature_filter(key),
+                    language_filter=self.language_filter,
+                    **options)
+            else:
+                res = apply_filters(*res.result(), language_filter=self.language_filter)
+            if self.symbols is not None:
+                res = (res[0].intern(self.symbols.intern), res[1])
+            self._results[key] = res
+        return res
+
+
+def apply_filters(data, language_code_map, feature_filter=None, language_filter=None):
+    """
+    Restrict loaded data to the features and languages passing the filters.
+    """
+    if feature_filter:
+        data = data.select_features([f for f in data.features if feature_filter(f)])
+    if language_filter:
+        data = data.select_languages(
+            [l for l in data.languages if language_filter(l, language_code_map.get(l))])
+    return data, language_code_map
+
+
+def _load_data(filename, file_format, lang_column, value_column, expect_multiple, trusted,
+               feature_filter=None, language_filter=None):
+    filters = dict(feature_filter=feature_filter, language_filter=language_filter)
     # Handle CSV dialect issues
     if str(filename) == 'stdin':
         filename = sys.stdin
         # We can't sniff from stdin, so guess comma-delimited and hope for
         # the best
         dialect = "excel" # Default dialect for csv module
+    elif (file_format and file_format.lower() == "compiled") or is_compiled(filename):
+        if file_format and file_format.lower() == "compiled":
+            file_format = None
+        return apply_filters(
+            *load_compiled(
+                filename,
+                expect_multiple=expect_multiple,
+                file_format=file_format,
+                lang_column=lang_column,
+                value_column=value_column),
+            **filters)
     elif file_format and file_format.lower() == "cldf":
-        return read_cldf_dataset(filename, value_column, expect_multiple=expect_multiple)
+        return read_cldf_dataset(
+            filename, value_column, expect_multiple=expect_multiple, trusted=trusted, **filters)
     elif file_format and file_format.lower() == "cldf-legacy":
         # CLDF pre-1.0 standard says delimiter is indicated by file extension
-        if filename.suffix.lower() == ".csv" or str(filename) == "stdin":
+        if data_suffix(filename) == ".csv" or str(filename) == "stdin":
             dialect = "excel"
-        elif filename.suffix.lower() == ".tsv":
+        elif data_suffix(filename) == ".tsv":
             dialect = "excel-tab"
         else:
             raise ValueError("CLDF standard dictates that filenames must end in .csv or .tsv")
     elif filename.suffix == ".json" or filename.name in {"forms.csv", "values.csv"}:
         # TODO: Should we just let the pycldf module try its hands on the file
         # and fall back to other formats if that doesn't work?
-        return read_cldf_dataset(filename, value_column, expect_multiple=expect_multiple)
+        return read_cldf_dataset(
+            filename, value_column, expect_multiple=expect_multiple, trusted=trusted, **filters)
     else:
         # Use CSV dialect sniffer in all other cases
         dialect = sniff(filename)
     # Read
-    with UnicodeDictReader(filename, dialect=dialect) as reader:
+    with open_text(filename) as stream, UnicodeDictReader(stream, dialect=dialect) as reader:
         # Guesstimate file format if user has not been explicit
         if file_format is None:
             file_format = 'cldf-legacy' if all(
@@ -94,9 +367,11 @@ def load_data(filename, file_format=None, lang_column=None, value_column=None, e
 
         # Load data
         if file_format == 'cldf-legacy':
-            data = load_cldf_data(reader, value_column, filename, expect_multiple=expect_multiple)
+            data = load_cldf_data(
+                reader, value_column, filename, expect_multiple=expect_multiple, **filters)
         elif file_format == 'beastling':
-            data = load_beastling_data(reader, lang_column, filename, expect_multiple=expect_multiple)
+            data = load_beastling_data(
+                reader, lang_column, filename, expect_multiple=expect_multiple, **filters)
         else:
             raise ValueError("File format specification '{:}' not understood".format(file_format))
     return data, {}
@@ -104,7 +379,8 @@ def load_data(filename, file_format=None, lang_column=None, value_column=None, e
 _language_column_names = ("iso", "iso_code", "glotto", "glottocode", "language", "language_id", "lang", "lang_id")
 
 
-def load_beastling_data(reader, lang_column, filename, expect_multiple=False):
+def load_beastling_data(reader, lang_column, filename, expect_multiple=False,
+                        feature_filter=None, language_filter=None):
     if not lang_column:
         for candidate in reader.fieldnames:
             if candidate.lower() in _language_column_names:
@@ -113,19 +389,28 @@ def load_beastling_data(reader, lang_column, filename, expect_multiple=False):
 
     if not lang_column or lang_column not in reader.fieldnames:
         raise ValueError("Cold not find language column in data file %s" % filename)
-    data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
+    # Decide once which columns to read, rather than for every row.
+    columns = [
+        f for f in reader.fieldnames
+        if f != lang_column and (feature_filter is None or feature_filter(f))]
+    data = FeatureMatrix(multiple=expect_multiple)
+    seen = set()
     for row in reader:
-        if row[lang_column] in data:
-            raise ValueError("Duplicated language identifier '%s' found in data file %s" % (row[lang_column], filename))
-        lang = row.pop(lang_column)
-        if expect_multiple:
-            data[lang] = collections.defaultdict(lambda : "?", {key: [value] for key, value in row.items()})
-        else:
-            data[lang] = collections.defaultdict(lambda : "?", row)
+        lang = row[lang_column]
+        if lang in seen:
+            raise ValueError("Duplicated language identifier '%s' found in data file %s" % (lang, filename))
+        seen.add(lang)
+        if language_filter and not language_filter(lang, None):
+            continue
+        data.add_language(lang)
+        for key in columns:
+            value = row[key]
+            data.set(lang, key, [value] if expect_multiple else value)
     return data
 
 
-def load_cldf_data(reader, value_column, filename, expect_multiple=False):
+def load_cldf_data(reader, value_column, filename, expect_multiple=False,
+                   feature_filter=None, language_filter=None):
     value_column = value_column or "Value"
     if "Feature_ID" in reader.fieldnames:
         feature_column = "Feature_ID"
@@ -133,23 +418,44 @@ def load_cldf_data(reader, value_column, filename, expect_multiple=False):
         feature_column = "Parameter_ID"
     else:
         raise ValueError("Could not find Feature_ID or Parameter_ID column, is %s a valid CLDF file?" % filename)
-    data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
+    data = FeatureMatrix(multiple=expect_multiple)
+    keep_language = _memoised_filter(language_filter)
+    keep_feature = _memoised_filter(feature_filter)
     for row in reader:
-        lang = row["Language_ID"]
-        if lang not in data:
-            if expect_multiple:
-                data[lang] = collections.defaultdict(lambda: [])
-            else:
-                data[lang] = collections.defaultdict(lambda: "?")
+        lang, feature = row["Language_ID"], row[feature_column]
+        if not keep_language(lang, None):
+            continue
+        if not keep_feature(feature):
+            # Languages without any selected features are still part of the data.
+            data.add_language(lang)
+            continue
         if expect_multiple:
-            data[lang][row[feature_column]].append(row[value_column])
+            data.append(lang, feature, row[value_column])
         else:
-            data[lang][row[feature_column]] = row[value_column]
+            data.set(lang, feature, row[value_column])
     return data
 
 
+def _memoised_filter(predicate):
+    """
+    Wrap a filter, so that it is evaluated only once per distinct argument, as
+    is needed for long-format data with many rows per language and feature.
+    """
+    if predicate is None:
+        return lambda *args: True
+    results = {}
+
+    def keep(*args):
+        res = results.get(args)
+        if res is None:
+            res = results[args] = bool(predicate(*args))
+        return res
+    return keep
+
+
 def iterlocations(filename):
-    with UnicodeDictReader(filename, dialect=sniff(filename, default_dialect=None)) as reader:
+    dialect = sniff(filename, default_dialect=None)
+    with open_text(filename) as stream, UnicodeDictReader(stream, dialect=dialect) as reader:
         # Identify fieldnames
         fieldnames = [(n.lower(), n) for n in reader.fieldnames]
         fieldmap = {}
@@ -206,7 +512,8 @@ def get_dataset(fname):
 
 
 # TODO: Change the behaviour to always expect multiple.
-def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
+def read_cldf_dataset(filename, code_column=None, expect_multiple=False,
+                      feature_filter=None, language_filter=None, trusted=False):
     """Load a CLDF dataset.
 
     Load the file as `json` CLDF metadata description file, or as metadata-free
@@ -221,16 +528,21 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
     ----------
     fname : str or Path
         Path to a CLDF dataset
+    feature_filter, language_filter : callable or None
+        Filters for features and languages, see `load_data`
+    trusted : bool
+        If True, a dataset described by a metadata file is read with the csv
+        module, skipping pycldf's validation and type conversion
 
     Returns
     -------
     Dataset
     """
-    dataset = get_dataset(filename)
-    if expect_multiple:
-        data = collections.defaultdict(lambda: collections.defaultdict(lambda: []))
+    if trusted and Path(filename).suffix == '.json':
+        dataset = TrustedDataset(filename)
     else:
-        data = collections.defaultdict(lambda: collections.defaultdict(lambda: "?"))
+        dataset = get_dataset(filename)
+    data = FeatureMatrix(multiple=expect_multiple)
 
     # Make sure this is a kind of dataset BEASTling can handle
     if dataset.module not in ("Wordlist", "StructureDataset"):
@@ -240,6 +552,8 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
     # Build dictionaries of nice IDs for languages and features
     col_map = dataset.column_names
     lang_ids, language_code_map = build_lang_ids(dataset, col_map)
+    keep_language = _memoised_filter(language_filter)
+    keep_feature = _memoised_filter(feature_filter)
     feature_ids = {}
     if col_map.parameters:
         for row in dataset["ParameterTable"]:
@@ -272,7 +586,6 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
                         "primary table or in a separate cognate table. "
                         "Is this a metadata-free wordlist and you forgot to "
                         "specify code_column explicitly?".format(filename))
-                form_column = dataset["FormTable", "id"].name
                 cognate_column_in_form_table = False
 
         language_column = col_map.forms.languageReference
@@ -286,14 +599,19 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
 
         for row in dataset["FormTable"].iterdicts():
             lang_id = lang_ids.get(row[language_column], row[language_column])
+            if not keep_language(lang_id, language_code_map.get(lang_id)):
+                continue
             feature_id = feature_ids.get(row[parameter_column], row[parameter_column])
+            if not keep_feature(feature_id):
+                data.add_language(lang_id)
+                continue
             if cognate_column_in_form_table:
                 if expect_multiple:
-                    data[lang_id][feature_id].append(row[code_column])
+                    data.append(lang_id, feature_id, row[code_column])
                 else:
-                    data[lang_id][feature_id] = row[code_column]
+                    data.set(lang_id, feature_id, row[code_column])
             else:
-                data[lang_id][feature_id] = cognatesets[row[col_map.forms.id]]
+                data.set(lang_id, feature_id, cognatesets[row[col_map.forms.id]])
         return data, language_code_map
 
     if dataset.module == "StructureDataset":
@@ -301,12 +619,17 @@ def read_cldf_dataset(filename, code_column=None, expect_multiple=False):
         for row in dataset["ValueTable"]:
             lang_id = lang_ids.get(
                 row[col_map.values.languageReference], row[col_map.values.languageReference])
+            if not keep_language(lang_id, language_code_map.get(lang_id)):
+                continue
             feature_id = feature_ids.get(
                 row[col_map.values.parameterReference], row[col_map.values.parameterReference])
+            if not keep_feature(feature_id):
+                data.add_language(lang_id)
+                continue
             if expect_multiple:
-                data[lang_id][feature_id].append(row[code_column] or '')
+                data.append(lang_id, feature_id, row[code_column] or '')
             else:
-                data[lang_id][feature_id] = row[code_column] or ''
+                data.set(lang_id, feature_id, row[code_column] or '')
         return data, language_code_map
 
 
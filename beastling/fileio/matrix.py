@@ -0,0 +1,325 @@
+import array
+import collections
+import collections.abc
+
+__all__ = ['FeatureMatrix', 'MISSING']
+
+MISSING = 0
+"""The code of a cell for which a language has no data point at all."""
+
+
+class FeatureMatrix(collections.abc.Mapping):
+    """
+    An integer-coded languages × features data matrix.
+
+    Each feature is stored as a column of unsigned integer codes, one per
+    language, which index into a per-feature codebook of distinct values.
+    Code `MISSING` marks languages without a data point for the feature.
+    Columns are padded lazily, i.e. rows beyond the end of a column are
+    missing, so adding languages is cheap.
+
+    For backwards compatibility, a FeatureMatrix behaves like the
+    `{language: {feature: value}}` dictionaries BEASTling used to pass
+    around: `matrix[language]` is a read-only mapping from features to
+    values.  If the matrix was built with `multiple=True`, cell values are
+    lists of data points and a fresh list is returned on every lookup.
+
+    Columns may also be read-only memoryviews, e.g. of a memory-mapped
+    compiled data file.
+
+    Once built by a reader, a matrix should be treated as immutable, as it
+    may be shared between models: all other methods, from `select_features`
+    to `intern`, return new matrices, which share columns and codebooks with
+    the original where possible.
+    """
+
+    def __init__(self, multiple=False):
+        self.multiple = multiple
+        self.languages = []
+        self.features = []
+        self._language_index = {}
+        self._feature_index = {}
+        # Per feature: the list of distinct values (with a placeholder for
+        # MISSING at index 0), the reverse mapping and the column of codes.
+        self._codebooks = []
+        self._codes = []
+        self._columns = []
+
+    # Building
+
+    def add_language(self, language):
+        """
+        Add a language (if not already present) and return its row index.
+        """
+        index = self._language_index.get(language)
+        if index is None:
+            index = self._language_index[language] = len(self.languages)
+            self.languages.append(language)
+        return index
+
+    def add_languages(self, languages):
+        for language in languages:
+            self.add_language(language)
+
+    def add_feature(self, feature):
+        """
+        Add a feature (if not already present) and return its column index.
+        """
+        index = self._feature_index.get(feature)
+        if index is None:
+            index = self._feature_index[feature] = len(self.features)
+            self.features.append(feature)
+            self._codebooks.append([None])
+            self._codes.append({})
+            self._columns.append(array.array('I'))
+        return index
+
+    def add_coded_feature(self, feature, values, column):
+        """
+        Add a feature from its distinct values (in code order, without an
+        entry for `MISSING`) and its column of codes.
+        """
+        col = self.add_feature(feature)
+        self._codebooks[col].extend(values)
+        self._codes[col].update((v, i) for i, v in enumerate(values, start=1))
+        self._columns[col] = column
+
+    def _intern(self, col, value):
+        codes = self._codes[col]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._codebooks[col])
+            self._codebooks[col].append(value)
+        return code
+
+    def _store(self, row, col, code):
+        column = self._columns[col]
+        if row >= len(column):
+            column.extend([MISSING] * (row + 1 - len(column)))
+        column[row] = code
+
+    def _get_code(self, row, col):
+        column = self._columns[col]
+        return column[row] if row < len(column) else MISSING
+
+    def set(self, language, feature, value):
+        """
+        Set the value of a cell, replacing any previous value.
+        """
+        if self.multiple:
+            value = tuple(value)
+        col = self.add_feature(feature)
+        self._store(self.add_language(language), col, self._intern(col, value))
+
+    def append(self, language, feature, value):
+        """
+        Add a data point to a cell of a matrix with `multiple=True`.
+        """
+        assert self.multiple
+        row, col = self.add_language(language), self.add_feature(feature)
+        code = self._get_code(row, col)
+        values = self._codebooks[col][code] if code != MISSING else ()
+        self._store(row, col, self._intern(col, values + (value,)))
+
+    # Coded access
+
+    def code(self, language, feature):
+        return self._get_code(self._language_index[language], self._feature_index[feature])
+
+    def codes(self, language, features=None):
+        """
+        Return the list of codes of a language for the given features.
+        """
+        row = self._language_index[language]
+        cols = range(len(self.features)) if features is None \
+            else [self._feature_index[f] for f in features]
+        return [self._get_code(row, col) for col in cols]
+
+    def column(self, feature):
+        """
+        Return the codes of all languages for a feature, in language order.
+        """
+        column = self._columns[self._feature_index[feature]]
+        if len(column) < len(self.languages):
+            column = array.array('I', column)
+            column.extend([MISSING] * (len(self.languages) - len(column)))
+        return column
+
+    def codebook(self, feature):
+        """
+        Return the list of distinct values of a feature, indexed by code.
+
+        The entry for `MISSING` is `None`.
+        """
+        return self._codebooks[self._feature_index[feature]]
+
+    def value(self, feature, code, default=None):
+        """
+        Decode a code of a feature into a value (a fresh list if multiple).
+        """
+        if code == MISSING:
+            return default
+        value = self._codebooks[self._feature_index[feature]][code]
+        return list(value) if self.multiple else value
+
+    def column_values(self, feature, default=None):
+        """
+        Return the decoded values of all languages for a feature.
+        """
+        return [self.value(feature, code, default) for code in self.column(feature)]
+
+    def code_counts(self, feature):
+        """
+        Return a `Counter` mapping the codes of a feature to the number of
+        languages with that code (including `MISSING`).
+        """
+        column = self._columns[self._feature_index[feature]]
+        counts = collections.Counter(column)
+        if len(column) < len(self.languages):
+            counts[MISSING] += len(self.languages) - len(column)
+        return counts
+
+    # Derived matrices
+
+    def _derive(self, languages, features):
+        res = FeatureMatrix(multiple=self.multiple)
+        res.languages = list(languages)
+        res._language_index = {l: i for i, l in enumerate(res.languages)}
+        res.features = list(features)
+        res._feature_index = {f: i for i, f in enumerate(res.features)}
+        return res
+
+    def select_features(self, features):
+        """
+        Return a matrix restricted to the given features, in the given order.
+
+        Features without any data in this matrix are skipped.
+        """
+        res = self._derive(self.languages, [f for f in features if f in self._feature_index])
+        for f in res.features:
+            col = self._feature_index[f]
+            res._codebooks.append(self._codebooks[col])
+            res._codes.append(self._codes[col])
+            res._columns.append(self._columns[col])
+        return res
+
+    def select_languages(self, languages):
+        """
+        Return a matrix restricted to the given languages, in the given order.
+        """
+        languages = [l for l in languages if l in self._language_index]
+        rows = [self._language_index[l] for l in languages]
+        res = self._derive(languages, self.features)
+        for col in range(len(self.features)):
+            res._codebooks.append(self._codebooks[col])
+            res._codes.append(self._codes[col])
+            column = self._columns[col]
+            n = len(column)
+            res._columns.append(
+                array.array('I', [column[row] if row < n else MISSING for row in rows]))
+        return res
+
+    def with_languages(self, languages):
+        """
+        Return a matrix with rows of missing data for those of the given
+        languages which are not in this matrix.
+        """
+        res = self._derive(
+            self.languages + [l for l in languages if l not in self._language_index],
+            self.features)
+        # Columns are padded lazily, so the new rows are missing.
+        res._codebooks, res._codes, res._columns = self._codebooks, self._codes, self._columns
+        return res
+
+    def intern(self, function):
+        """
+        Return a matrix in which language and feature identifiers are replaced
+        by the (equal) objects returned by function, e.g. `SymbolTable.intern`.
+        """
+        res = self._derive(map(function, self.languages), map(function, self.features))
+        res._codebooks, res._codes, res._columns = self._codebooks, self._codes, self._columns
+        return res
+
+    def recode(self, function, features=None):
+        """
+        Return a matrix in which every value v of the given features (default:
+        all) is replaced by function(v).
+
+        The function is called once per distinct value, not once per cell.
+        """
+        features = set(self.features if features is None else features)
+        res = self._derive(self.languages, self.features)
+        for col, feature in enumerate(self.features):
+            codebook, codes, column = self._codebooks[col], self._codes[col], self._columns[col]
+            if feature in features:
+                new_codebook, codes, table = [None], {}, [MISSING]
+                for value in codebook[1:]:
+                    value = function(list(value) if self.multiple else value)
+                    if self.multiple:
+                        value = tuple(value)
+                    if value not in codes:
+                        codes[value] = len(new_codebook)
+                        new_codebook.append(value)
+                    table.append(codes[value])
+                if len(new_codebook) != len(codebook):
+                    # Distinct values were merged, so the codes change.
+                    column = array.array('I', [table[c] for c in column])
+                codebook = new_codebook
+            res._codebooks.append(codebook)
+            res._codes.append(codes)
+            res._columns.append(column)
+        return res
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Columns may be memoryviews of a memory-mapped file, which cannot be
+        # pickled.
+        state['_columns'] = [
+            c if isinstance(c, array.array) else array.array('I', c) for c in self._columns]
+        return state
+
+    # Mapping interface
+
+    def __getitem__(self, language):
+        return _LanguageView(self, self._language_index[language])
+
+    def __iter__(self):
+        return iter(self.languages)
+
+    def __len__(self):
+        return len(self.languages)
+
+    def __contains__(self, language):
+        return language in self._language_index
+
+    def __repr__(self):
+        return '<{0} {1} languages × {2} features>'.format(
+            self.__class__.__name__, len(self.languages), len(self.features))
+
+
+class _LanguageView(collections.abc.Mapping):
+    """
+    Read-only mapping from features to values for one row of a FeatureMatrix.
+    """
+    __slots__ = ('_matrix', '_row')
+
+    def __init__(self, matrix, row):
+        self._matrix = matrix
+        self._row = row
+
+    def _code(self, col):
+        return self._matrix._get_code(self._row, col)
+
+    def __getitem__(self, feature):
+        col = self._matrix._feature_index.get(feature)
+        if col is None or self._code(col) == MISSING:
+            raise KeyError(feature)
+        return self._matrix.value(feature, self._code(col))
+
+    def __iter__(self):
+        for col, feature in enumerate(self._matrix.features):
+            if self._code(col) != MISSING:
+                yield feature
+
+    def __len__(self):
+        return sum(1 for col in range(len(self._matrix.features)) if self._code(col) != MISSING)
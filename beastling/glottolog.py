@@ -0,0 +1,664 @@
+"""
+Precompiled indexes of the Glottolog data used by BEASTling.
+
+Parsing the Glottolog Newick tree and geo data takes seconds, so the result
+is stored as a `GlottologIndex` file in the user data directory, one per
+Glottolog release.  An index records size and modification time of the
+source files it was built from, and is rebuilt when they change.
+
+The classification is stored as a tree of integer node IDs with a parent
+array, and the lists of ancestors of a languoid are only computed when it is
+looked up.  All data is kept in flat buffers, which are memory-mapped when an
+index file is opened, so processes using the same index - e.g. workers
+generating many configurations - share one copy of Glottolog.  An index is
+pickled by its path, so passing it to other processes is cheap.
+
+An index file consists of
+
+- a header: the magic bytes, the format version and the length of the
+  metadata,
+- the metadata: JSON encoded fingerprints of the source files, the positions
+  of all buffers in the file and some small tables,
+- the buffers, each starting at an 8 byte boundary.  Numbers are stored as
+  little-endian 64 bit integers or floats.
+"""
+import os
+import sys
+import json
+import mmap
+import array
+import bisect
+import struct
+import tempfile
+import itertools
+import collections.abc
+from pathlib import Path
+
+import newick
+from csvw.dsv import reader
+
+from beastling.util import log
+from beastling.util.monophyly import GLOTTOLOG_NODE_LABEL
+
+__all__ = ['GlottologIndex', 'CladeIndex', 'CodeTable', 'CodeMap', 'Classifications']
+
+MAGIC = b'BEASTGLT'
+# Bump this whenever the content of the index changes.
+INDEX_VERSION = 6
+HEADER = struct.Struct('<8sIIQ')
+
+
+def fingerprint(*paths):
+    res = []
+    for path in paths:
+        stat = Path(path).stat()
+        res.append([str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns])
+    return res
+
+
+def _aligned(offset):
+    return offset + (-offset % 8)
+
+
+class _Slice(object):
+    """
+    A part of a memory-mapped file, which can be sliced and searched like the
+    `bytes` it stands in for.
+    """
+    def __init__(self, buffer, start, stop):
+        self.buffer, self.start, self.stop = buffer, start, stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, s):
+        return self.buffer[self.start + s.start:self.start + s.stop]
+
+    def find(self, sub, start=0):
+        res = self.buffer.find(sub, self.start + start, self.stop)
+        return res - self.start if res >= 0 else res
+
+
+class CodeTable(collections.abc.Mapping):
+    """
+    A read-only mapping of fixed-width ASCII codes - i.e. Glottocodes or ISO
+    codes - to integers, stored as one sorted byte string of codes and an
+    array of values.
+    """
+    def __init__(self, codes, values, width):
+        self.codes = codes
+        self.values = values
+        self.width = width
+
+    @classmethod
+    def from_items(cls, items, width):
+        items = sorted(items)
+        return cls(
+            ''.join(code for code, _ in items).encode('ascii'),
+            array.array('q', [value for _, value in items]),
+            width)
+
+    def _code(self, k):
+        return self.codes[k * self.width:(k + 1) * self.width]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self._code(k).decode('ascii')
+
+    def __getitem__(self, code):
+        res = self.get(code)
+        if res is None:
+            raise KeyError(code)
+        return res
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def get(self, code, default=None):
+        if not isinstance(code, str) or len(code) != self.width:
+            return default
+        try:
+            code = code.encode('ascii')
+        except UnicodeEncodeError:
+            return default
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._code(mid) < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._code(lo) == code:
+            return self.values[lo]
+        return default
+
+
+class _Points(collections.abc.Sequence):
+    """
+    A sequence of `(lat, lon)` pairs, stored as flat array of floats.
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values) // 2
+
+    def __getitem__(self, i):
+        return (self.values[2 * i], self.values[2 * i + 1])
+
+
+class CodeMap(collections.abc.Mapping):
+    """
+    A read-only mapping of codes to values, stored as one `CodeTable` per
+    code width, which maps codes to the index of their value in a sequence of
+    distinct values.
+    """
+    def __init__(self, tables, values):
+        self.tables = tables
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, d, points=False):
+        """
+        :param points: Whether the values are `(lat, lon)` pairs, which are \
+        stored as array of floats.
+        """
+        values, rows, items = [], {}, collections.defaultdict(list)
+        for code, value in d.items():
+            if value not in rows:
+                rows[value] = len(values)
+                values.append(value)
+            items[len(code)].append((code, rows[value]))
+        if points:
+            values = _Points(array.array('d', itertools.chain(*values)))
+        return cls(
+            {width: CodeTable.from_items(items, width) for width, items in items.items()},
+            values)
+
+    def __getitem__(self, code):
+        table = self.tables.get(len(code)) if isinstance(code, str) else None
+        row = table.get(code) if table else None
+        if row is None:
+            raise KeyError(code)
+        return self.values[row]
+
+    def __contains__(self, code):
+        table = self.tables.get(len(code)) if isinstance(code, str) else None
+        return bool(table) and code in table
+
+    def __iter__(self):
+        return itertools.chain(*self.tables.values())
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+
+class CladeIndex(object):
+    """
+    The Glottolog classification as a tree of integer node IDs.
+
+    Languoids are numbered in pre-order, so the descendants of a node are the
+    languoids numbered from the node's number up to the number of its last
+    descendant.  Whether a languoid belongs to a clade thus takes two
+    comparisons, and finding the languoids of a clade is a range query.
+
+    As with the classifications, a languoid is not part of its own clade -
+    except for top-level families, i.e. isolates match their own name.
+
+    Glottolog lists languages which are isolates twice, as top-level node and
+    as its only child.  Lookups by Glottocode return the child.
+    """
+    def __init__(self, glottocodes, names, name_offsets, parent, last, ids, duplicates):
+        """
+        :param glottocodes: The Glottocodes of all nodes, as one byte string.
+        :param names: The names of all nodes, as one byte string, separated \
+        (and surrounded) by newlines.
+        :param name_offsets: The offsets of the names in `names`.
+        :param parent: The ID of the parent of each node, or -1 for top-level \
+        nodes.
+        :param last: The ID of the last descendant of each node.
+        :param ids: `CodeTable` mapping Glottocodes to node IDs.
+        :param duplicates: `dict` mapping Glottocodes occurring more than once \
+        to all their node IDs.
+        """
+        self._glottocodes = glottocodes
+        self._names = names
+        self._name_offsets = name_offsets
+        self.parent = parent
+        self.last = last
+        self.ids = ids
+        self.duplicates = duplicates
+
+    @classmethod
+    def from_nodes(cls, glottocodes, names, parent):
+        """
+        :param glottocodes: Glottocodes of the nodes of the classification in \
+        pre-order.
+        :param names: Names of the nodes.
+        :param parent: Index of the parent of each node, or -1 for top-level \
+        nodes.
+        """
+        names = [name.encode('utf8') for name in names]
+        name_offsets = array.array('q', [0])
+        for name in names:
+            name_offsets.append(name_offsets[-1] + len(name) + 1)
+        parent = array.array('q', parent)
+        last = array.array('q', range(len(parent)))
+        for i in reversed(range(len(parent))):
+            j = parent[i]
+            if j >= 0 and last[i] > last[j]:
+                last[j] = last[i]
+        ids, duplicates = {}, {}
+        for i, glottocode in enumerate(glottocodes):
+            if glottocode in ids:
+                duplicates.setdefault(glottocode, [ids[glottocode]]).append(i)
+            ids[glottocode] = i
+        return cls(
+            ''.join(glottocodes).encode('ascii'),
+            # Names are separated by newlines, so we can search for names.
+            b'\n' + b'\n'.join(names) + b'\n',
+            name_offsets,
+            parent,
+            last,
+            CodeTable.from_items(ids.items(), 8),
+            duplicates)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __contains__(self, glottocode):
+        return glottocode in self.ids
+
+    def glottocodes(self):
+        """
+        Iterate over the distinct Glottocodes in the classification.
+        """
+        return iter(self.ids)
+
+    def id(self, glottocode):
+        """
+        Return the node ID for a Glottocode, or None.
+        """
+        return self.ids.get(glottocode)
+
+    def glottocode(self, i):
+        return self._glottocodes[8 * i:8 * (i + 1)].decode('ascii')
+
+    def name(self, i):
+        return self._names[self._name_offsets[i] + 1:self._name_offsets[i + 1]].decode('utf8')
+
+    def nodes(self, clade, ignore_case=False):
+        """
+        Return the IDs of the nodes matching a clade, given as name or
+        Glottocode.
+        """
+        if ignore_case:
+            clade = clade.lower()
+            res = [i for i in range(len(self)) if self.name(i).lower() == clade]
+        else:
+            res, needle = [], b'\n' + clade.encode('utf8') + b'\n'
+            offset = self._names.find(needle)
+            while offset >= 0:
+                res.append(bisect.bisect_left(self._name_offsets, offset))
+                offset = self._names.find(needle, offset + 1)
+        if clade in self:
+            res.extend(
+                i for i in self.duplicates.get(clade, [self.id(clade)]) if i not in res)
+        return res
+
+    def ranges(self, clades, ignore_case=False):
+        """
+        Return the sorted, disjoint ranges of node IDs of all languoids
+        belonging to any of the clades.
+        """
+        ranges = []
+        for clade in clades:
+            for i in self.nodes(clade, ignore_case=ignore_case):
+                lo = i if self.parent[i] < 0 else i + 1
+                if lo <= self.last[i]:
+                    ranges.append((lo, self.last[i]))
+        res = []
+        for lo, hi in sorted(ranges):
+            if res and lo <= res[-1][1] + 1:
+                res[-1] = (res[-1][0], max(hi, res[-1][1]))
+            else:
+                res.append((lo, hi))
+        return res
+
+    def in_ranges(self, ranges, glottocode):
+        """
+        Check whether a languoid lies in one of the ranges returned by
+        `ranges`.
+        """
+        i = self.id(glottocode)
+        if i is None:
+            return False
+        k = bisect.bisect_right(ranges, (i, len(self))) - 1
+        return k >= 0 and ranges[k][0] <= i <= ranges[k][1]
+
+
+class Classifications(collections.abc.MutableMapping):
+    """
+    A `dict`-like mapping of Glottocodes and ISO codes to the list of
+    `(name, glottocode)` pairs of a languoid's ancestors (or of the languoid
+    itself, for top-level families).
+
+    The lists are computed from the `CladeIndex` of a `GlottologIndex` when a
+    languoid is first looked up.  Lists for languoids with the same parent
+    are shared, and must not be modified.  Nothing is loaded per family: the
+    index is memory-mapped, so only the parts of the tree which are looked up
+    are read.
+    """
+    def __init__(self, index):
+        self._index = index
+        self._paths = {}
+        self._data = {}
+        self._deleted = set()
+
+    def _path(self, i):
+        """
+        Return the list of `(name, glottocode)` pairs from the root to node `i`.
+        """
+        if i not in self._paths:
+            clades = self._index.clades
+            j = clades.parent[i]
+            item = (clades.name(i), clades.glottocode(i))
+            self._paths[i] = [item] if j < 0 else self._path(j) + [item]
+        return self._paths[i]
+
+    def __getitem__(self, key):
+        if key in self._data:
+            return self._data[key]
+        i = self._index.node(key)
+        if i is None or key in self._deleted:
+            raise KeyError(key)
+        j = self._index.clades.parent[i]
+        return self._path(i if j < 0 else j)
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        self._data.pop(key, None)
+        self._deleted.add(key)
+
+    def _keys(self):
+        for key in itertools.chain(self._index.clades.glottocodes(), self._index.isocodes):
+            if key not in self._data and key not in self._deleted:
+                yield key
+
+    def __iter__(self):
+        return itertools.chain(self._keys(), self._data)
+
+    def __len__(self):
+        return len(self._data) + sum(1 for _ in self._keys())
+
+
+class GlottologIndex(object):
+    """
+    The data BEASTling uses from a Glottolog release.
+
+    :ivar clades: `CladeIndex` for the classification.
+    :ivar isocodes: `CodeTable` mapping ISO codes to node IDs.
+    :ivar macroareas: `CodeMap` mapping Glottocodes and ISO codes to macroareas.
+    :ivar locations: `CodeMap` mapping Glottocodes and ISO codes to \
+    `(lat, lon)` pairs.  Dialects inherit the location of their closest \
+    ancestor with coordinates.
+    :ivar dialects: byte string flagging the node IDs of dialects.
+    :ivar dialect_isocodes: `dict` mapping node IDs of dialects to their ISO \
+    codes.
+    :ivar path: The index file, if the index has been opened from a file.
+    """
+    def __init__(self, clades, isocodes, macroareas, locations, dialects, dialect_isocodes,
+                 path=None):
+        self.clades = clades
+        self.isocodes = isocodes
+        self.macroareas = macroareas
+        self.locations = locations
+        self.dialects = dialects
+        self.dialect_isocodes = dialect_isocodes
+        self.path = path
+
+    def __reduce__(self):
+        # Memory-mapped indexes are passed to other processes by path, so all
+        # processes map the same file.
+        if self.path:
+            return (GlottologIndex.open, (str(self.path),))
+        return super(GlottologIndex, self).__reduce__()
+
+    @classmethod
+    def from_sources(cls, newick_path, geo_path):
+        """
+        Build the index by parsing Glottolog's Newick and geo data files.
+        """
+        codes, names, parent, isocodes = [], [], [], {}
+        for tree in newick.read(str(newick_path)):
+            # Number the nodes in pre-order.
+            stack = [(tree, -1)]
+            while stack:
+                node, j = stack.pop()
+                label = GLOTTOLOG_NODE_LABEL.match(node.name)
+                if label.group('isocode'):
+                    isocodes[label.group('isocode')] = label.group('glottocode')
+                stack.extend((child, len(codes)) for child in reversed(node.descendants))
+                codes.append(label.group('glottocode'))
+                names.append(label.group('name').strip().replace("\\'", "'"))
+                parent.append(j)
+        clades = CladeIndex.from_nodes(codes, names, parent)
+        isocodes = CodeTable.from_items(
+            [(isocode, clades.id(glottocode)) for isocode, glottocode in isocodes.items()], 3)
+
+        macroareas, locations = {}, {}
+        dialects, dialect_isocodes = bytearray(len(clades)), {}
+        for t in reader(geo_path, dicts=True):
+            identifiers = [t['glottocode']] + t['isocodes'].split()
+            if t['level'] == "dialect":
+                i = clades.id(t['glottocode'])
+                # A dialect may be missing from newick downloads of older
+                # Glottolog releases, where possibly isolates may not be included.
+                if i is not None:
+                    dialects[i] = 1
+                    if len(identifiers) > 1:
+                        dialect_isocodes[i] = identifiers[1:]
+            if t['macroarea']:
+                for id_ in identifiers:
+                    macroareas[id_] = t['macroarea']
+            if t['latitude'] and t['longitude']:
+                latlon = (float(t['latitude']), float(t['longitude']))
+                for id_ in identifiers:
+                    locations[id_] = latlon
+
+        index = cls(
+            clades, isocodes, CodeMap.from_dict(macroareas), locations, bytes(dialects),
+            dialect_isocodes)
+        index.inherit_locations(locations)
+        index.locations = CodeMap.from_dict(locations, points=True)
+        return index
+
+    def node(self, code):
+        """
+        Return the node ID for a Glottocode or ISO code, or None.
+        """
+        i = self.clades.id(code)
+        return self.isocodes.get(code) if i is None else i
+
+    def inherit_locations(self, locations, patched=None):
+        """
+        Let dialects inherit the location of their closest ancestor with a
+        location in `locations`, in one top-down pass over the classification.
+
+        If `patched` is given, only the subtrees below the languoids with
+        these identifiers are updated, and their locations are kept as is.
+        """
+        clades = self.clades
+        if patched is None:
+            patched, subtrees = set(), [(0, len(clades) - 1)]
+        else:
+            subtrees = []
+            for i in sorted(i for i in map(self.node, patched) if i is not None):
+                if not subtrees or i > subtrees[-1][1]:
+                    subtrees.append((i, clades.last[i]))
+
+        for lo, hi in subtrees:
+            # Maps node IDs to the location of the node or its closest ancestor.
+            nearest = {}
+            ancestor = clades.parent[lo]
+            while ancestor >= 0 and clades.glottocode(ancestor) not in locations:
+                ancestor = clades.parent[ancestor]
+            if ancestor >= 0:
+                nearest[clades.parent[lo]] = locations[clades.glottocode(ancestor)]
+            for i in range(lo, hi + 1):
+                glottocode = clades.glottocode(i)
+                inherited = nearest.get(clades.parent[i])
+                if self.dialects[i] and inherited and glottocode not in patched:
+                    for id_ in [glottocode] + self.dialect_isocodes.get(i, []):
+                        if id_ not in patched:
+                            locations[id_] = inherited
+                nearest[i] = locations.get(glottocode, inherited)
+
+    def classifications(self):
+        """
+        Return a new `Classifications` mapping for this index.
+        """
+        return Classifications(self)
+
+    @classmethod
+    def load(cls, newick_path, geo_path, index_path):
+        """
+        Open the index file `index_path`, (re)building it if it does not exist
+        or is out of date.
+        """
+        index_path = Path(index_path)
+        sources = fingerprint(newick_path, geo_path)
+        if index_path.exists():
+            try:
+                index = cls.open(index_path, sources=sources)
+                if index:
+                    return index
+            except Exception:  # pragma: no cover
+                # An unreadable index is just rebuilt.
+                pass
+        log.info('Building Glottolog index {0}'.format(index_path))
+        index = cls.from_sources(newick_path, geo_path)
+        if index.save(index_path, sources):
+            return cls.open(index_path)
+        return index  # pragma: no cover
+
+    @classmethod
+    def open(cls, index_path, sources=None):
+        """
+        Memory-map an index file.
+
+        :param sources: If given, return None unless the index was built from \
+        source files with these fingerprints.
+        """
+        with Path(index_path).open('rb') as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < HEADER.size or HEADER.unpack_from(mm)[0] != MAGIC:
+            raise ValueError('{0} is not a Glottolog index'.format(index_path))
+        _, version, _, size = HEADER.unpack_from(mm)
+        if version != INDEX_VERSION:
+            return None
+        md = json.loads(mm[HEADER.size:HEADER.size + size].decode('utf8'))
+        if sources is not None and md['sources'] != sources:
+            return None
+        base, buffer = _aligned(HEADER.size + size), memoryview(mm)
+
+        def get(name, typecode=None):
+            start, stop = (base + offset for offset in md['buffers'][name])
+            if typecode is None:
+                return _Slice(mm, start, stop)
+            res = buffer[start:stop].cast(typecode)
+            if sys.byteorder != 'little':  # pragma: no cover
+                res = array.array(typecode, res)
+                res.byteswap()
+            return res
+
+        def code_table(name, width):
+            return CodeTable(get(name + '_codes'), get(name + '_values', 'q'), width)
+
+        def code_map(name, values):
+            return CodeMap(
+                {w: code_table('{0}{1}'.format(name, w), w) for w in md[name]}, values)
+
+        return cls(
+            CladeIndex(
+                get('glottocodes'),
+                get('names'),
+                get('name_offsets', 'q'),
+                get('parent', 'q'),
+                get('last', 'q'),
+                code_table('ids', 8),
+                md['duplicates']),
+            code_table('isocodes', 3),
+            code_map('macroareas', md['macroarea_names']),
+            code_map('locations', _Points(get('points', 'd'))),
+            get('dialects', 'B'),
+            {int(k): v for k, v in md['dialect_isocodes'].items()},
+            path=Path(index_path))
+
+    def _buffers(self):
+        clades = self.clades
+        yield 'glottocodes', clades._glottocodes
+        yield 'names', clades._names
+        yield 'name_offsets', clades._name_offsets
+        yield 'parent', clades.parent
+        yield 'last', clades.last
+        tables = [('ids', clades.ids), ('isocodes', self.isocodes)]
+        for name in ['macroareas', 'locations']:
+            tables.extend(
+                ('{0}{1}'.format(name, w), t) for w, t in getattr(self, name).tables.items())
+        for name, table in tables:
+            yield name + '_codes', table.codes
+            yield name + '_values', table.values
+        yield 'points', self.locations.values.values
+        yield 'dialects', self.dialects
+
+    def save(self, index_path, sources):
+        """
+        Write an index built with `from_sources` to a file.
+
+        :return: True if the file was written.
+        """
+        index_path = Path(index_path)
+        buffers, positions, offset = [], {}, 0
+        for name, data in self._buffers():
+            if isinstance(data, array.array):
+                if sys.byteorder != 'little':  # pragma: no cover
+                    data = array.array(data.typecode, data)
+                    data.byteswap()
+                data = data.tobytes()
+            positions[name] = [offset, offset + len(data)]
+            buffers.append((offset, data))
+            offset = _aligned(offset + len(data))
+        md = json.dumps(dict(
+            sources=sources,
+            buffers=positions,
+            duplicates=self.clades.duplicates,
+            dialect_isocodes=self.dialect_isocodes,
+            macroareas=sorted(self.macroareas.tables),
+            macroarea_names=list(self.macroareas.values),
+            locations=sorted(self.locations.tables),
+        )).encode('utf8')
+        try:
+            if not index_path.parent.exists():
+                index_path.parent.mkdir(parents=True)
+            # Write to a temporary file first, so concurrent BEASTling
+            # processes never see a partially written index.
+            fd, tmp = tempfile.mkstemp(dir=str(index_path.parent), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(HEADER.pack(MAGIC, INDEX_VERSION, 0, len(md)))
+                fp.write(md)
+                base = _aligned(HEADER.size + len(md))
+                for offset, data in buffers:
+                    fp.write(b'\0' * (base + offset - fp.tell()))
+                    fp.write(data)
+            os.replace(tmp, str(index_path))
+            return True
+        except OSError as e:  # pragma: no cover
+            log.warning('Could not save Glottolog index {0}: {1}'.format(index_path, e))
+            return False
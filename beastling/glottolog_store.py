@@ -0,0 +1,162 @@
+"""
+A local store of Glottolog releases.
+
+BEASTling needs two files of each Glottolog release it uses: the classification
+as Newick trees and the locations of languages and dialects as CSV.  These are
+looked up in the package data and in the user data directory.  Alongside the
+files of a release, a JSON manifest records their SHA-256 checksums, so that
+the files can be verified later on.
+"""
+import os
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+__all__ = [
+    'PACKAGE_DATA', 'DATA_FILES', 'data_path', 'index_path', 'releases', 'release_key', 'checksum',
+    'record_checksums', 'import_release', 'verify_release']
+
+PACKAGE_DATA = Path(__file__).parent / 'data'
+# The local filename patterns and the names of the files on glottolog.org.
+DATA_FILES = {
+    'newick': ('glottolog-{0}.newick', 'tree-glottolog-newick.txt'),
+    'geo': ('glottolog-{0}-geo.csv', 'languages-and-dialects-geo.csv'),
+}
+MANIFEST = 'glottolog-{0}.json'
+INDEX = 'glottolog-{0}-index.bin'
+
+
+def data_path(directory, datatype, release):
+    return Path(directory) / DATA_FILES[datatype][0].format(release)
+
+
+def index_path(directory, release):
+    return Path(directory) / INDEX.format(release)
+
+
+def _manifest_path(directory, release):
+    return Path(directory) / MANIFEST.format(release)
+
+
+def release_key(release):
+    """
+    Sort key for release numbers, e.g. `sorted(releases, key=release_key)`.
+    """
+    return [(0, int(p), '') if p.isdigit() else (1, 0, p) for p in release.split('.')]
+
+
+def releases(directory):
+    """
+    List the releases with both data files in a directory, oldest first.
+    """
+    res = []
+    for p in Path(directory).glob('glottolog-*.newick'):
+        release = re.fullmatch(r'glottolog-(.+)\.newick', p.name).group(1)
+        if data_path(directory, 'geo', release).exists():
+            res.append(release)
+    return sorted(res, key=release_key)
+
+
+def checksum(path):
+    """
+    Compute the SHA-256 checksum of a file.
+    """
+    sha = hashlib.sha256()
+    with Path(path).open('rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _write_atomic(path, content):
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            content(fp)
+        os.replace(tmp, str(path))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _read_manifest(directory, release):
+    path = _manifest_path(directory, release)
+    if path.exists():
+        return json.loads(path.read_text(encoding='utf8'))
+    return {}
+
+
+def record_checksums(directory, release, *datatypes):
+    """
+    Record the checksums of data files of a release in its manifest.
+    """
+    manifest = _read_manifest(directory, release)
+    for datatype in datatypes:
+        manifest[datatype] = checksum(data_path(directory, datatype, release))
+    _write_atomic(
+        _manifest_path(directory, release),
+        lambda fp: fp.write(json.dumps(manifest, indent=4, sort_keys=True).encode('utf8')))
+
+
+def _check_source(datatype, path):
+    with Path(path).open('rb') as fp:
+        head = fp.read(1024).lstrip(b'\xef\xbb\xbf').lstrip()
+    if datatype == 'newick':
+        ok = head.startswith(b'(')
+    else:
+        ok = b'glottocode' in head.split(b'\n')[0]
+    if not ok:
+        raise ValueError('{0} does not look like Glottolog {1} data'.format(path, datatype))
+
+
+def import_release(directory, release, newick, geo):
+    """
+    Copy the data files of a Glottolog release, as downloaded from glottolog.org,
+    into a directory and record their checksums.
+
+    :return: `dict` mapping data types to the paths of the imported files.
+    """
+    directory = Path(directory)
+    sources = dict(newick=Path(newick), geo=Path(geo))
+    for datatype, source in sources.items():
+        if not source.exists():
+            raise ValueError('No such file: {0}'.format(source))
+        _check_source(datatype, source)
+    if not directory.exists():
+        directory.mkdir(parents=True)
+
+    res = {}
+    for datatype, source in sorted(sources.items()):
+        res[datatype] = data_path(directory, datatype, release)
+        with source.open('rb') as src:
+            _write_atomic(res[datatype], lambda fp: shutil.copyfileobj(src, fp))
+    record_checksums(directory, release, *sorted(sources))
+    # Make sure the copies are complete.
+    manifest = _read_manifest(directory, release)
+    for datatype, source in sources.items():
+        if checksum(source) != manifest[datatype]:  # pragma: no cover
+            raise ValueError('Copying {0} failed'.format(source))
+    return res
+
+
+def verify_release(directory, release):
+    """
+    Check the data files of a release against the checksums in its manifest.
+
+    :raises ValueError: if a file is missing, has no recorded checksum or does not match it.
+    """
+    manifest = _read_manifest(directory, release)
+    problems = []
+    for datatype in sorted(DATA_FILES):
+        path = data_path(directory, datatype, release)
+        if not path.exists():
+            problems.append('{0} is missing'.format(path.name))
+        elif datatype not in manifest:
+            problems.append('no checksum recorded for {0}'.format(path.name))
+        elif checksum(path) != manifest[datatype]:
+            problems.append('checksum mismatch for {0}'.format(path.name))
+    if problems:
+        raise ValueError('Glottolog {0} in {1}: {2}'.format(release, directory, '; '.join(problems)))
@@ -1,6 +1,5 @@
 import collections
 
-from ..fileio.datareaders import load_data
 from beastling.util.fileio import iterlines
 from beastling.util import xml
 from beastling.util import log
@@ -63,13 +62,10 @@ class BaseModel(FromOptions):
         self.metadata = []
         self.treedata = []
 
-        # Load the entire dataset from the file
-        self.data, language_code_map = load_data(
-            self.data_filename,
-            file_format=model_config.options.get("file_format", None),
-            lang_column=model_config.options.get("language_column", None),
-            value_column=model_config.options.get("value_column", None),
-            expect_multiple=True)
+        # Load the dataset from the file (or get it from another model using
+        # the same file)
+        self.data, language_code_map = global_config.data_loader.get(
+            self.data_filename, **model_config.reader_options)
 
         # Augment the Glottolog classifications with human-friendly language
         # names which may have been read from a CLDF dataset.  Note that we
@@ -80,6 +76,8 @@ class BaseModel(FromOptions):
         # clean this up some day!
         for language_id, glottocode in language_code_map.items():
             if glottocode in global_config.classifications:
+                global_config.language_glottocodes[language_id] = glottocode
+                global_config.language_glottocodes[language_id.lower()] = glottocode
                 global_config.classifications[language_id] = global_config.classifications[glottocode]
                 global_config.classifications[language_id.lower()] = global_config.classifications[language_id]
             if glottocode in global_config.glotto_macroareas:
@@ -103,10 +101,7 @@ class BaseModel(FromOptions):
         attribute.
         """
         if self.features == ["*"]:
-            self.features = set()
-            for lang_features in self.data.values():
-                self.features |= set(lang_features.keys())
-            self.features = list(self.features)
+            self.features = list(self.data.features)
         if self.exclusions:
             self.features = [f for f in self.features if f not in self.exclusions]
         self.feature_filter = set(self.features)
@@ -165,10 +160,8 @@ class BaseModel(FromOptions):
         Remove all languages from the data set which are not part of the
         configured language filter.
         """
-        all_langs = self.data.keys()
-        langs_to_remove = [l for l in all_langs if not self.config.filter_language(l)]
-        for lang in langs_to_remove:
-            self.data.pop(lang)
+        self.data = self.data.select_languages(
+            [l for l in self.data if self.config.filter_language(l)])
         # Make sure we've not removed all languages
         if not self.data.keys():
             raise ValueError("Language filters leave nothing in the dataset for model '%s'!" % self.name)
@@ -228,15 +221,8 @@ class BaseModel(FromOptions):
         Remove all features from the data set which are not part of the
         configured feature filter.
         """
-        self.features = set()
-        for language in self.data.values():
-            features_in_data = set(language.keys())
-            features_to_keep = features_in_data & self.feature_filter
-            self.features |= features_to_keep
-            features_to_remove = features_in_data - features_to_keep
-            for feat in features_to_remove:
-                language.pop(feat)
-        self.features = sorted(list(self.features))
+        self.features = sorted(f for f in self.data.features if f in self.feature_filter)
+        self.data = self.data.select_features(self.features)
 
     def reduce_multivalue_data(self, list_of_data_points):
         """Reduce a list of data points to a single one.
@@ -261,36 +247,39 @@ class BaseModel(FromOptions):
         self.counts = {}
         self.codemaps = {}
         for f in self.features:
-            # Compute various things
-            all_values = []
-            for l in self.data:
-                point = self.reduce_multivalue_data(self.data[l].get(f, ["?"]))
-                all_values.append(point)
-            missing_data_ratio = all_values.count("?") / (1.0*len(all_values))
-            non_q_values = [v for v in all_values if v != "?"]
-            counts = {}
-            for v in non_q_values:
-                counts[v] = non_q_values.count(v)
-            unique_values = list(set(non_q_values))
-            # Sort unique_values carefully.
-            # Possibly all feature values are numeric strings, e.g. "1", "2", "3".
-            # If we sort these as strings then we get weird things like "10" < "2".
-            # This can actually matter for things like ordinal models.
-            # So convert these to ints first...
-            if all([v.isdigit() for v in unique_values]):
-                unique_values = list(map(int, unique_values))
-                unique_values.sort()
-                unique_values = list(map(str, unique_values))
-            # ...otherwise, just sort normally
-            else:
-                unique_values.sort()
-            self.unique_values[f] = unique_values
+            # Count languages per distinct value of the feature, rather than
+            # looking at every language separately.
+            counts = collections.Counter()
+            for code, n in self.data.code_counts(f).items():
+                counts[self.reduce_multivalue_data(self.data.value(f, code, ["?"]))] += n
+            missing_data_ratio = counts.pop("?", 0) / (1.0*len(self.data))
+            self.set_feature_properties(f, dict(counts), missing_data_ratio)
+
+    def set_feature_properties(self, feature, counts, missing_data_ratio):
+        """
+        Store the metadata of a feature, given the number of occurrences of
+        each of its (non-missing) values.
+        """
+        unique_values = list(counts)
+        # Sort unique_values carefully.
+        # Possibly all feature values are numeric strings, e.g. "1", "2", "3".
+        # If we sort these as strings then we get weird things like "10" < "2".
+        # This can actually matter for things like ordinal models.
+        # So convert these to ints first...
+        if all([v.isdigit() for v in unique_values]):
+            unique_values = list(map(int, unique_values))
+            unique_values.sort()
+            unique_values = list(map(str, unique_values))
+        # ...otherwise, just sort normally
+        else:
+            unique_values.sort()
+        self.unique_values[feature] = unique_values
 
-            N = len(unique_values)
-            self.valuecounts[f] = N
-            self.missing_ratios[f] = missing_data_ratio
-            self.counts[f] = counts
-            self.codemaps[f] = self.build_codemap(unique_values)
+        N = len(unique_values)
+        self.valuecounts[feature] = N
+        self.missing_ratios[feature] = missing_data_ratio
+        self.counts[feature] = counts
+        self.codemaps[feature] = self.build_codemap(unique_values)
 
     def remove_unwanted_features(self):
         """
@@ -334,9 +323,7 @@ class BaseModel(FromOptions):
 
         for bad in bad_feats:
             self.features.remove(bad)
-            for lang in self.languages:
-                if bad in self.data[lang]:
-                    self.data[lang].pop(bad)
+        self.data = self.data.select_features(self.features)
 
         # Make sure there's something left
         if not self.features:
@@ -578,11 +565,16 @@ class BaseModel(FromOptions):
         self.filters = {}
         data = xml.data(
             beast, id="data_%s" % self.name, name="data_%s" % self.name, dataType="integer")
+        # Data points are formatted once per distinct value of a feature,
+        # rather than once per language.
+        formatted = [{} for f in self.features]
         for lang in self.languages:
-            formatted_points = [
-                self.format_datapoint(
-                    f, self.data[lang].get(f, ["?"]))
-                for f in self.features]
+            formatted_points = []
+            for f, cache, code in zip(
+                    self.features, formatted, self.data.codes(lang, self.features)):
+                if code not in cache:
+                    cache[code] = self.format_datapoint(f, self.data.value(f, code, ["?"]))
+                formatted_points.append(cache[code])
             value_string = self.data_separator.join(formatted_points)
             if not self.filters:
                 n = 1
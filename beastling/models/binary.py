@@ -147,49 +147,32 @@ class BinaryModel(BaseModel):
         self.counts = {}
         self.codemaps = {}
         self.feature_value_partially_unknown = {}
+        # Explicitly absent values ("-") carry no information beyond the
+        # absence of the other values, so strip them from the data.
+        self.data = self.data.recode(
+            lambda raw: [x for x in raw if x != "-"], features=self.features)
         for f in self.features:
             # Compute various things
-            all_values = []
             # Track whether any “unknown” values were encountered. The
             # difference between “unknown” and “absent” values matters: Assume
             # we have a feature with 3 possible values, A, B and C. Then "A"
             # would be binarized as "100", "B" as "010", "AB" as "110", "-" as
             # "000", "A-" as "100", but "?" as "???" and "A?" as "1??".
-            for l, values in self.data.items():
-                if f in values:
-                    raw = values[f]
-                    while "-" in raw:
-                        raw.remove("-")
-                    if "?" in raw:
-                        raw = [x for x in raw if x!='?']
-                    all_values.append(raw)
-            missing_data_ratio = 1 - len(all_values) / len(self.data)
-            non_q_values = [v for vs in all_values for v in vs]
-            assert None not in non_q_values
-            counts = {}
-            for v in non_q_values:
-                counts[v] = non_q_values.count(v)
-            unique_values = list(set(non_q_values))
-            # Sort unique_values carefully.
-            # Possibly all feature values are numeric strings, e.g. "1", "2", "3".
-            # If we sort these as strings then we get weird things like "10" < "2".
-            # This can actually matter for things like ordinal models.
-            # So convert these to ints first...
-            if all([v.isdigit() for v in unique_values]):
-                unique_values = list(map(int, unique_values))
-                unique_values.sort()
-                unique_values = list(map(str, unique_values))
-            # ...otherwise, just sort normally
-            else:
-                unique_values.sort()
-            self.unique_values[f] = unique_values
-
-            N = len(unique_values)
-            self.valuecounts[f] = N
-            self.missing_ratios[f] = missing_data_ratio
-            self.counts[f] = counts
-            self.codemaps[f] = self.build_codemap(unique_values)
-
+            # Count languages per distinct list of values, rather than looking
+            # at every language separately.
+            counts = collections.Counter()
+            present = 0
+            for code, n in self.data.code_counts(f).items():
+                raw = self.data.value(f, code)
+                if raw is None:
+                    continue
+                present += n
+                for v in raw:
+                    if v != "?":
+                        counts[v] += n
+            missing_data_ratio = 1 - present / len(self.data)
+            assert None not in counts
+            self.set_feature_properties(f, dict(counts), missing_data_ratio)
 
     def pattern_names(self, feature):
         """Content of the columns corresponding to this feature in the alignment.
@@ -300,7 +283,7 @@ class BinaryModelWithShareParams(BinaryModel):
         if self.binarised:
             for f in features:
                 for lang in self.data:
-                    for value in self.data[lang][f]:
+                    for value in self.data[lang].get(f, []):
                         if value == "?":
                             continue
                         dpoint, index = value, self.unique_values[f].index(value)
@@ -308,7 +291,12 @@ class BinaryModelWithShareParams(BinaryModel):
         else:
             for f in features:
                 for lang in self.data:
-                    all_data_points = set(self.data[lang].get(f, ["?"]))
+                    point = self.data[lang].get(f, ["?"])
+                    if self.recoded and f in self.data[lang] and "?" in point:
+                        # As in the alignment, where format_datapoint drops
+                        # "?" from recoded data points.
+                        point.remove("?")
+                    all_data_points = set(point)
                     if "?" in all_data_points:
                         valuestring = "".join(["?" for i in range(0,len(self.unique_values[f])+1)])
                     else:
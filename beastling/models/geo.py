@@ -87,10 +87,7 @@ class GeoModel(FromOptions):
                 newick="")
             for clade in self.sampling_points:
                 # Get languages in clade
-                if clade == "root":
-                    langs = self.config.languages.languages
-                else:
-                    langs = self.config.language_group(clade)
+                langs = self.config.language_group(clade)
                 if not langs:
                     continue
                 # Add the geo prior, which will trigger sampling
@@ -147,10 +144,11 @@ class GeoModel(FromOptions):
             dimension=2 * (2 * len(self.config.languages.languages) -1),
             minordimension="2")
         loc_data_text_bits = []
+        sampled = set(self.sampling_points)
         for lang in self.config.languages.languages:
             lat, lon = self.config.locations.get(lang, ("?", "?"))
             if "?" in (lat, lon):
-                if lang not in self.sampling_points:
+                if lang not in sampled:
                     self.sampling_points.append(lang)
                     log.info("Location of language %s will be sampled.  You may wish to add a prior." % lang, model=self)
             else:
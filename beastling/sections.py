@@ -119,6 +119,10 @@ def handle_file_or_list(value):
     return value
 
 
+# Values of `starting_tree` which select a starting tree computed by BEASTling.
+AUTO_STARTING_TREES = ('auto-distance', 'auto-parsimony')
+
+
 def get_tree(tree_type, cfg, section, option):
     """Load a tree from file or parse a string.
 
@@ -134,6 +138,9 @@ def get_tree(tree_type, cfg, section, option):
     """
     value = cfg.get(section, option)
     assert tree_type in ("starting", "monophyly")
+    if tree_type == "starting" and value.strip().lower() in AUTO_STARTING_TREES:
+        # The starting tree will be computed from the data.
+        return value.strip().lower()
     # Read from file if necessary
     fname = pathlib.Path(value)
     if fname.exists() and fname.is_file():
@@ -205,6 +212,21 @@ class Admin(Section):
         "4.0",
         "A string representing a Glottolog release number.",
         getter=ConfigParser.get)
+    offline = opt(
+        False,
+        "A boolean value.  If True, Glottolog data is never downloaded, and processing fails if "
+        "the Glottolog release is not available locally.",
+        getter=ConfigParser.getboolean)
+    cache_data = opt(
+        False,
+        "A boolean value, controlling whether or not to cache parsed data files in the user data "
+        "directory, so that subsequent runs on unchanged data files load faster.",
+        getter=ConfigParser.getboolean)
+    data_workers = opt(
+        1,
+        "An integer value, setting the number of processes used to load data files "
+        "concurrently.  Defaults to 1, i.e. data files are loaded one after another.",
+        getter=ConfigParser.getint)
 
     def __attrs_post_init__(self):
         if self.log_all:
@@ -297,8 +319,18 @@ class Languages(Section):
     )
     starting_tree = opt(
         None,
-        "A starting tree in Newick format, or the name of a file containing the same.",
+        "A starting tree in Newick format, or the name of a file containing the same, or "
+        "'auto-distance' or 'auto-parsimony' for a tree computed from the data.",
         getter=functools.partial(get_tree, 'starting'))
+    starting_tree_search_moves = opt(
+        1000,
+        "Maximum number of tree rearrangements tried in the search of an 'auto-parsimony' "
+        "starting tree.",
+        getter=ConfigParser.getint)
+    starting_tree_search_time = opt(
+        60.0,
+        "Time limit in seconds for the search of an 'auto-parsimony' starting tree.",
+        getter=ConfigParser.getfloat)
     sample_branch_lengths = opt(
         True,
         "A boolean value, controlling whether or not to estimate tree branch lengths.",
@@ -371,7 +403,7 @@ class Languages(Section):
         models. Thus, proper pruning and sanitising of trees can only happen after models have been
         loaded. Once this is done, this method must be called.
         """
-        if self.starting_tree:
+        if self.starting_tree and self.starting_tree not in AUTO_STARTING_TREES:
             self.starting_tree = sanitise_tree(self.starting_tree, 'starting', self.languages)
         if self.monophyly_newick:
             self.monophyly_newick = sanitise_tree(
@@ -455,6 +487,7 @@ class Model(Section):
     share_params = opt(True, getter=ConfigParser.getboolean)
 
     minimum_data = opt(0.0, getter=ConfigParser.getfloat)
+    trusted_data = opt(False, getter=ConfigParser.getboolean)
 
     features = opt(attr.Factory(lambda: ["*"]), getter=get_file_or_list)
     exclusions = opt(attr.Factory(list), getter=get_file_or_list)
@@ -470,6 +503,18 @@ class Model(Section):
         if self.binarized is not None and self.binarised is None:
             self.binarised = self.binarized
 
+    @property
+    def reader_options(self):
+        """
+        The options for reading the data file, as passed to `load_data`.
+        """
+        return dict(
+            file_format=self.options.get("file_format", None),
+            lang_column=self.options.get("language_column", None),
+            value_column=self.options.get("value_column", None),
+            expect_multiple=True,
+            trusted=self.trusted_data)
+
     def get_model(self, global_config):
         for cls in all_subclasses(BaseModel):
             if cls.__model_name__() == self.model:
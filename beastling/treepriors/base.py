@@ -25,8 +25,12 @@ class TreePrior (ABC):
             self.add_tip_heights(beastxml.config.tip_calibrations)
 
     def estimate_height(self, config):
+        """
+        Estimate the birthrate and height of the tree from the calibrations of
+        a `Configuration`.
+        """
         birthrate_estimates = []
-        for cal in config.config.calibrations.values():
+        for cal in config.calibrations.values():
             if len(cal.langs) == 1 or cal.dist not in ("normal", "lognormal"):
                 continue
             # Find the midpoint of this cal
@@ -49,7 +53,7 @@ class TreePrior (ABC):
         self.birthrate_estimate = round(sum(birthrate_estimates) / len(birthrate_estimates), 4)
         # Find the expected height of a tree with this birthrate
         self.treeheight_estimate = round((1.0 / self.birthrate_estimate)
-                                         * (log(len(config.config.languages.languages))
+                                         * (log(len(config.languages.languages))
                                             + 0.5772156649 - 1), 4)
 
     def add_tip_heights(self, tip_calibrations):
@@ -79,6 +83,11 @@ class TreePrior (ABC):
         """
         # If a starting tree is specified, use it...
         if beastxml.config.languages.starting_tree:
+            attribs = {}
+            if beastxml.config.starting_tree_computed:
+                # Tip heights of computed trees are fitted to the tip
+                # calibrations, so BEAST must not move them.
+                attribs["adjustTipHeights"] = "false"
             beastxml.init = xml.init(
                 beastxml.run,
                 estimate="false",
@@ -86,7 +95,8 @@ class TreePrior (ABC):
                 initial="@Tree.t:beastlingTree",
                 spec="beast.util.TreeParser",
                 IsLabelledNewick="true",
-                newick=beastxml.config.languages.starting_tree)
+                newick=beastxml.config.languages.starting_tree,
+                **attribs)
         # ...if not, use the simplest random tree initialiser possible
         else:
             # If we have non-trivial monophyly constraints, use ConstrainedRandomTree
@@ -190,8 +200,9 @@ class YuleTree (TreePrior):
         elif len(beastxml.config.calibrations) == 2:
             # Two calibrations can be handled by the calibrated Yule if they
             # are nested
-            langs1, langs2 = [c.langs for c in beastxml.config.calibrations.values()]
-            if len(set(langs1) & set(langs2)) in (len(langs1), len(langs2)):
+            langs1, langs2 = [
+                beastxml.config.taxa.clade(c.langs) for c in beastxml.config.calibrations.values()]
+            if langs1 <= langs2 or langs2 <= langs1:
                 yule = "calibrated"
             else:
                 yule = "standard"
@@ -0,0 +1,147 @@
+"""
+Clades, i.e. sets of languages of an analysis, as integer bitmasks.
+
+All clades of an analysis are drawn from the same `Taxa`, the sorted list of
+the analysis languages, which assigns each language a bit.  Comparing clades
+and computing unions or intersections then are single integer operations.
+"""
+import collections.abc
+
+__all__ = ['Taxa', 'Clade']
+
+
+class Taxa(object):
+    """
+    The languages of an analysis, each numbered by a bit.
+    """
+    def __init__(self, languages):
+        self.languages = list(languages)
+        self.bits = {language: i for i, language in enumerate(self.languages)}
+
+    def __len__(self):
+        return len(self.languages)
+
+    def __iter__(self):
+        return iter(self.languages)
+
+    def __contains__(self, language):
+        return language in self.bits
+
+    def mask(self, languages):
+        res = 0
+        for language in languages:
+            if language not in self.bits:
+                raise ValueError('Unknown language {0}'.format(language))
+            res |= 1 << self.bits[language]
+        return res
+
+    def clade(self, languages=()):
+        """
+        Return the clade of a collection of languages.
+
+        :raises ValueError: if a language is not one of the taxa.
+        """
+        if isinstance(languages, Clade) and languages.taxa is self:
+            return languages
+        return Clade(self, self.mask(languages))
+
+    @property
+    def root(self):
+        return Clade(self, (1 << len(self.languages)) - 1)
+
+
+class Clade(collections.abc.Set):
+    """
+    An immutable set of languages from `Taxa`, iterating in the order of the
+    taxa.
+
+    Clades of the same taxa are compared and combined via their bitmasks;
+    comparisons with other sets work as for any `Set`.  Since a clade may be
+    equal to a frozenset, it is hashed like one.
+    """
+    __slots__ = ['taxa', 'mask', '_hash']
+
+    def __init__(self, taxa, mask=0):
+        self.taxa = taxa
+        self.mask = mask
+        self._hash = None
+
+    def _same_taxa(self, other):
+        return isinstance(other, Clade) and other.taxa is self.taxa
+
+    def _from_iterable(self, it):
+        return frozenset(it)
+
+    def __contains__(self, language):
+        bit = self.taxa.bits.get(language)
+        return bit is not None and bool(self.mask >> bit & 1)
+
+    def __iter__(self):
+        mask, languages = self.mask, self.taxa.languages
+        while mask:
+            low = mask & -mask
+            yield languages[low.bit_length() - 1]
+            mask ^= low
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __bool__(self):
+        return bool(self.mask)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self))
+        return self._hash
+
+    def __repr__(self):
+        return 'Clade({0})'.format(list(self))
+
+    def __eq__(self, other):
+        if self._same_taxa(other):
+            return self.mask == other.mask
+        return collections.abc.Set.__eq__(self, other)
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+    def __le__(self, other):
+        if self._same_taxa(other):
+            return self.mask & other.mask == self.mask
+        return collections.abc.Set.__le__(self, other)
+
+    def __lt__(self, other):
+        if self._same_taxa(other):
+            return self.mask != other.mask and self <= other
+        return collections.abc.Set.__lt__(self, other)
+
+    def __ge__(self, other):
+        if self._same_taxa(other):
+            return other <= self
+        return collections.abc.Set.__ge__(self, other)
+
+    def __gt__(self, other):
+        if self._same_taxa(other):
+            return other < self
+        return collections.abc.Set.__gt__(self, other)
+
+    def __and__(self, other):
+        if self._same_taxa(other):
+            return Clade(self.taxa, self.mask & other.mask)
+        return collections.abc.Set.__and__(self, other)
+
+    def __or__(self, other):
+        if self._same_taxa(other):
+            return Clade(self.taxa, self.mask | other.mask)
+        return collections.abc.Set.__or__(self, other)
+
+    def __sub__(self, other):
+        if self._same_taxa(other):
+            return Clade(self.taxa, self.mask & ~other.mask)
+        return collections.abc.Set.__sub__(self, other)
+
+    def isdisjoint(self, other):
+        if self._same_taxa(other):
+            return not self.mask & other.mask
+        return collections.abc.Set.isdisjoint(self, other)
@@ -1,4 +1,17 @@
+import io
+import bz2
+import gzip
+import lzma
 import pathlib
+import contextlib
+
+# Magic bytes at the start of compressed files, and the modules to read them.
+_COMPRESSION = [
+    (b'\x1f\x8b', gzip),
+    (b'BZh', bz2),
+    (b'\xfd7zXZ\x00', lzma),
+]
+COMPRESSION_SUFFIXES = {'.gz', '.bz2', '.xz'}
 
 
 def iterlines(fname, name='file'):
@@ -8,3 +21,55 @@ def iterlines(fname, name='file'):
     with fname.open(encoding='utf8') as fp:
         for line in fp:
             yield line
+
+
+def compression(head):
+    """
+    Return the module to decompress data starting with the bytes `head`, or
+    None if the data is not compressed.
+    """
+    for magic, module in _COMPRESSION:
+        if head.startswith(magic):
+            return module
+
+
+def data_suffix(fname):
+    """
+    Return the lowercase suffix of a filename, ignoring compression suffixes,
+    e.g. ".csv" for "data.csv.gz".
+    """
+    fname = pathlib.Path(fname)
+    if fname.suffix.lower() in COMPRESSION_SUFFIXES:
+        fname = fname.with_suffix('')
+    return fname.suffix.lower()
+
+
+def open_binary(fname):
+    """
+    Open a file for reading bytes, decompressing gzip, bz2 or xz compressed
+    content on the fly.
+    """
+    with open(str(fname), 'rb') as fp:
+        module = compression(fp.read(6))
+    return module.open(str(fname), 'rb') if module else open(str(fname), 'rb')
+
+
+@contextlib.contextmanager
+def open_text(fname, encoding='utf-8-sig'):
+    """
+    Open a file for reading text, decompressing gzip, bz2 or xz compressed
+    content on the fly, i.e. without creating a decompressed copy.
+
+    `fname` may also be a text stream like `sys.stdin`, which is not closed.
+    """
+    if hasattr(fname, 'read'):
+        buffer = getattr(fname, 'buffer', None)
+        module = compression(buffer.peek(6)) if hasattr(buffer, 'peek') else None
+        if module is None:
+            yield fname
+        else:
+            with module.open(buffer) as stream:
+                yield io.TextIOWrapper(stream, encoding=encoding, newline='')
+        return
+    with io.TextIOWrapper(open_binary(fname), encoding=encoding, newline='') as stream:
+        yield stream
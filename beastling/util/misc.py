@@ -1,8 +1,9 @@
-from urllib.request import FancyURLopener
-
-import newick
+import shutil
+import collections
+from urllib.request import urlopen
 
 from beastling.util import log
+from beastling.util import trees
 
 
 class FromOptions(object):
@@ -24,13 +25,20 @@ def all_subclasses(cls):
         [s for c in cls.__subclasses__() for s in all_subclasses(c)])
 
 
-class URLopener(FancyURLopener):
-    def http_error_default(self, url, fp, errcode, errmsg, headers):
-        raise ValueError()  # pragma: no cover
+def retrieve_url(url, fname, timeout=60):
+    """
+    Download the resource at a URL to a file.
+
+    :param timeout: Timeout in seconds for connecting and for each read.
+    :raises IOError: if the download fails, e.g. with an HTTP error status or a timeout.
+    """
+    with urlopen(url, timeout=timeout) as response, open(str(fname), 'wb') as fp:
+        shutil.copyfileobj(response, fp)
 
 
-def retrieve_url(url, fname):
-    return URLopener().retrieve(url, str(fname))
+def _add_lengths(l1, l2):
+    # Like `newick.Node.length`, lengths are added as floats.
+    return '%s' % (float(l1 or 0.0) + float(l2 or 0.0))
 
 
 def sanitise_tree(tree, tree_type, languages):
@@ -44,45 +52,92 @@ def sanitise_tree(tree, tree_type, languages):
         * contains no duplicate taxa
         * has taxa which are a superset of the languages in the analysis
         * has no polytomies or unifurcations.
+
+    The tree is processed in a constant number of passes over its nodes, with
+    the same result as pruning it and calling `remove_redundant_nodes`,
+    `remove_internal_names` and `resolve_polytomies` of `newick.Node`.
     """
     # Make sure tree can be parsed
-    _s = tree
     try:
-        tree = newick.loads(tree)[0]
-    except:
+        tree = trees.parse(tree)
+    except (ValueError, IndexError):
         raise ValueError("Could not parse %s tree.  Is it valid Newick?" % tree_type)
     # Make sure starting tree contains no duplicate taxa
-    tree_langs = tree.get_leaf_names()
-    if not len(set(tree_langs)) == len(tree_langs):
-        dupes = set(l for l in tree_langs if tree_langs.count(l) > 1)
-        dupestring = ",".join(["%s (%d)" % (d, tree_langs.count(d)) for d in dupes])
+    tree_langs = collections.Counter(n.name for n in trees.postorder(tree) if not n.children)
+    dupes = [l for l, count in tree_langs.items() if count > 1]
+    if dupes:
+        dupestring = ",".join(["%s (%d)" % (d, tree_langs[d]) for d in dupes])
         raise ValueError(
             "%s tree contains duplicate taxa: %s" % (tree_type.capitalize(), dupestring))
-    tree_langs = set(tree_langs)
     # Make sure languages in tree is a superset of languages in the analysis
-    if not tree_langs.issuperset(languages):
-        missing_langs = set(languages).difference(tree_langs)
+    languages = set(languages)
+    missing_langs = languages.difference(tree_langs)
+    if missing_langs:
         miss_string = ",".join(missing_langs)
         raise ValueError(
             "Some languages in the data are not in the %s tree: %s" % (tree_type, miss_string))
     # If the trees' language set is a proper superset, prune the tree to fit the analysis
-    if not tree_langs == set(languages):
-        tree.prune_by_names(languages, inverse=True)
+    if len(tree_langs) != len(languages):
+        removed = set()
+        for node in trees.postorder(tree):
+            node.children = [c for c in node.children if id(c) not in removed]
+            # Nodes which lost all their children are pruned as well.
+            if node is not tree and not node.children and node.name not in languages:
+                removed.add(id(node))
         log.info(
-            "%s tree includes languages not present in any data set and will be pruned.".format(
+            "{0} tree includes languages not present in any data set and will be pruned.".format(
                 tree_type.capitalize()))
-    # Get the tree looking nice
-    tree.remove_redundant_nodes()
-    tree.remove_internal_names()
-    if tree_type == "starting":
-        tree.resolve_polytomies()
-    # Remove lengths for a monophyly tree
-    if tree_type == "monophyly":
-        for n in tree.walk():
-            n._length = None
+
+    # Get the tree looking nice.  Like `newick.Node.remove_redundant_nodes`,
+    # we replace each chain of nodes with a single child by the node at the
+    # bottom of the chain, which takes over the lengths of the chain and is
+    # moved behind its siblings.
+    replacement = {}
+    for node in trees.postorder(tree):
+        if len(node.children) == 1:
+            new = replacement.get(id(node.children[0]), node.children[0])
+            new.length = _add_lengths(new.length, node.length)
+            replacement[id(node)] = new
+        else:
+            node.children = [c for c in node.children if id(c) not in replacement] + \
+                [replacement[id(c)] for c in node.children if id(c) in replacement]
+    if id(tree) in replacement:
+        tree.children, tree.length = replacement[id(tree)].children, replacement[id(tree)].length
+
+    nodes = trees.postorder(tree)
+    for node in nodes:
+        if node.children:
+            node.name = None
+        if tree_type == "starting" and len(node.children) > 2:
+            _resolve_polytomy(node)
+        # Remove lengths for a monophyly tree
+        if tree_type == "monophyly":
+            node.length = None
     # Checks
+    nodes = trees.postorder(tree)
     if tree_type == "starting":
-        assert all(len(n.descendants) in (0, 2) for n in tree.walk())
-    assert len(tree.get_leaves()) == len(languages)
-    assert all(l.name for l in tree.get_leaves())
-    return newick.dumps(tree)
+        assert all(len(n.children) in (0, 2) for n in nodes)
+    leaves = [n for n in nodes if not n.children]
+    assert len(leaves) == len(languages)
+    assert all(l.name for l in leaves)
+    return trees.dumps(tree)
+
+
+def _resolve_polytomy(node):
+    """
+    Resolve a polytomy with zero length branches, with the same topology as
+    `newick.Node.resolve_polytomies`, which alternates the order of the
+    children at each new node.
+    """
+    first, rest = node.children[0], node.children[1:]
+    new = trees.Node(length='0.0')
+    node.children = [first, new]
+    lo, hi, forward = 0, len(rest) - 1, False
+    while hi - lo + 1 > 2:
+        if forward:
+            child, lo = rest[lo], lo + 1
+        else:
+            child, hi = rest[hi], hi - 1
+        new.children = [child, trees.Node(length='0.0')]
+        new, forward = new.children[1], not forward
+    new.children = rest[lo:hi + 1] if forward else rest[lo:hi + 1][::-1]
@@ -2,7 +2,11 @@ import re
 
 import newick
 
-__all__ = ['classifications_from_newick', 'make_newick', 'make_structure', 'check_structure']
+from beastling.util.clades import Clade
+
+__all__ = [
+    'classifications_from_newick', 'make_newick', 'make_structure', 'check_structure',
+    'MonophylyTree']
 
 GLOTTOLOG_NODE_LABEL = re.compile(
     "'(?P<name>[^\[]+)\[(?P<glottocode>[a-z0-9]{8})\](\[(?P<isocode>[a-z]{3})\])?(?P<appendix>-l-)?'")
@@ -45,72 +49,66 @@ def classifications_from_newick(string, label_pattern=GLOTTOLOG_NODE_LABEL):
     return classifications, nodemap, label2name
 
 
+def _sortkey(i):
+    """
+    Callable to pass into `sorted` to port sorting behaviour from py2 to py3.
+
+    :param i: Either a string or a list (of lists, ...) of strings.
+    :return: Pair (nesting level, first string)
+    """
+    d = 0
+    while isinstance(i, list):
+        d -= 1
+        i = i[0] if i else ''
+    return d, i
+
+
 def make_structure(classification, langs, depth, maxdepth):
     """
-    Recursively partition a list of languages (ISO or Glottocodes) into
-    lists corresponding to their Glottolog classification.  The process
-    may be halted part-way down the Glottolog tree.
+    Partition a list of languages (ISO or Glottocodes) into nested lists
+    corresponding to their Glottolog classification.  The process may be
+    halted part-way down the Glottolog tree.
+
+    The languages are inserted into a trie of the subgroup names on their
+    classification paths in one pass, and the structure is read off the trie.
 
     :param classification: `dict` {glottocode: [(name, glottocode), ...]}
+    :param depth: The level of the Glottolog tree at which to start partitioning.
+    :param maxdepth: The deepest level of the Glottolog tree used for partitioning.
     """
     if depth > maxdepth:
-        # We're done, so terminate recursion
+        # Nothing to partition.
         return langs
 
-    def subgroup(name, depth):
-        ancestors = classification[name.lower()]
-        return ancestors[depth][0] if depth < len(ancestors) else ''
-
-    def sortkey(i):
-        """
-        Callable to pass into `sorted` to port sorting behaviour from py2 to py3.
-
-        :param i: Either a string or a list (of lists, ...) of strings.
-        :return: Pair (nesting level, first string)
-        """
-        d = 0
-        while isinstance(i, list):
-            d -= 1
-            i = i[0] if i else ''
-        return d, i
-
-    N = len(langs)
-    # Find the ancestor of all the given languages at at particular depth
-    # (i.e. look `depth` nodes below the root of the Glottolog tree)
-    groupings = list(set([subgroup(l, depth) for l in langs]))
-    if len(groupings) == 1:
-        # If all languages belong to the same classificatio at this depth,
-        # there are two possibilities
-        if groupings[0] == "":
-            # If the common classification is an empty string, then we know
-            # that there is no further refinement possible, so stop
-            # the recursion here.
-            langs.sort()
-            return langs
-        else:
-            # If the common classification is non-empty, we need to
-            # descend further, since some languages might get
-            # separated later
-            return make_structure(classification, langs, depth + 1, maxdepth)
-    else:
-        # If the languages belong to multiple classifications, split them
-        # up accordingly and then break down each classification
-        # individually.
-
-        # Group up those languages which share a non-blank Glottolog classification
-        partition = [[l for l in langs if subgroup(l, depth) == group] for group in groupings if group != ""]
-        # Add those languages with blank classifications in their own isolate groups
-        for l in langs:
-            if subgroup(l, depth) == "":
-                partition.append([l, ])
-        # Get rid of any empty sets we may have accidentally created
-        partition = [part for part in partition if part]
-        # Make sure we haven't lost any langs
-        assert sum((len(p) for p in partition)) == N
+    # A trie node is a pair of a dict of child nodes, keyed by subgroup name,
+    # and the list of languages with no subgroup at the node's level - or, for
+    # nodes below `maxdepth`, all languages of the subgroup - in input order.
+    root = ({}, [])
+    for lang in langs:
+        node = root
+        for name, _ in classification[lang.lower()][depth:maxdepth + 1]:
+            node = node[0].setdefault(name, ({}, []))
+        node[1].append(lang)
+
+    def structure(node, depth):
+        children, leaves = node
+        if depth > maxdepth:
+            return leaves
+        if not children:
+            # No further refinement possible.
+            return sorted(leaves)
+        if len(children) == 1 and not leaves:
+            # All languages belong to the same subgroup at this level, but may
+            # get separated further down.
+            return structure(next(iter(children.values())), depth + 1)
+        # Break down each subgroup individually, and put languages with no
+        # subgroup at this level in their own isolate groups.
         return sorted(
-            [make_structure(classification, group, depth + 1, maxdepth)
-             for group in partition],
-            key=sortkey)
+            [structure(child, depth + 1) for child in children.values()] +
+            [[l] for l in leaves],
+            key=_sortkey)
+
+    return structure(root, depth)
 
 
 def check_structure(struct):
@@ -145,3 +143,79 @@ def make_newick(struct):
         return "(%s)" % ",".join(struct) if len(struct) > 1 else struct[0]
     else:
         return "(%s)" % ",".join([make_newick(substruct) for substruct in struct])
+
+
+class MonophylyTree(object):
+    """
+    The clades of a monophyly constraint tree, with the leaves of each clade
+    precomputed as an integer bitset.
+
+    :param tree: A Newick string or `newick.Node`.
+    :param taxa: Optional list of leaf names, fixing the bit of each taxon, e.g. \
+    the `Taxa` of an analysis.  Other leaves are numbered after these.
+    """
+    def __init__(self, tree, taxa=()):
+        if isinstance(tree, str):
+            tree = newick.loads(tree)[0]
+        self.taxa = taxa
+        self.bits = {name: i for i, name in enumerate(taxa)}
+        # Nodes are numbered in pre-order, so children come after their parent.
+        nodes, self.children, stack = [], [], [tree]
+        while stack:
+            node = stack.pop()
+            self.children.append([])
+            nodes.append(node)
+            stack.extend(reversed(node.descendants))
+        index = {id(node): i for i, node in enumerate(nodes)}
+        self.clades = [0] * len(nodes)
+        for i in range(len(nodes) - 1, -1, -1):
+            node = nodes[i]
+            if node.descendants:
+                self.children[i] = [index[id(child)] for child in node.descendants]
+                for j in self.children[i]:
+                    self.clades[i] |= self.clades[j]
+            else:
+                self.clades[i] = 1 << self.bits.setdefault(node.name, len(self.bits))
+        # Clades with no finer structure:
+        self.terminal = [all(not self.children[j] for j in c) for c in self.children]
+
+    def bitset(self, taxa):
+        """
+        :return: The bitset of a collection of taxa, or None if some are not in the tree.
+        """
+        if isinstance(taxa, Clade) and taxa.taxa is self.taxa:
+            # Leaves are numbered like the taxa of the clade.
+            return taxa.mask if taxa.mask & ~self.clades[0] == 0 else None
+        res = 0
+        for taxon in taxa:
+            if taxon not in self.bits:
+                return None
+            res |= 1 << self.bits[taxon]
+        return res
+
+    def is_compatible(self, taxa):
+        """
+        Check whether constraining `taxa` to be monophyletic agrees with the tree.
+
+        That is the case if the taxa are a clade of the tree, or are a subset of
+        a clade with no finer structure, or are the union of children of a clade.
+        """
+        taxa = self.bitset(taxa)
+        if taxa is None:
+            return False
+        # The clades containing the taxa form a path from the root, which we
+        # walk down.
+        node = 0
+        if taxa & self.clades[node] != taxa:
+            return False
+        while True:
+            clade = self.clades[node]
+            if clade == taxa or self.terminal[node] or all(
+                    taxa & self.clades[j] in (0, self.clades[j]) for j in self.children[node]):
+                return True
+            for j in self.children[node]:
+                if taxa & self.clades[j] == taxa:
+                    node = j
+                    break
+            else:
+                return False
@@ -0,0 +1,722 @@
+"""
+Starting trees computed from the data of an analysis.
+
+Languages are compared on the features of all data models: the distance
+between two languages is the proportion of differing values among the features
+for which both have data.  A tree is built from these distances by UPGMA, i.e.
+average linkage clustering, which - unlike neighbour joining - yields a rooted
+ultrametric tree, as BEAST needs for contemporaneous languages.  Monophyly
+constraints are respected by clustering within each constrained clade first.
+
+The distance tree may be improved under parsimony, and its node heights may be
+fitted to the calibrations of an analysis.
+"""
+import sys
+import math
+import time
+import array
+import random
+import operator
+import itertools
+import functools
+import collections
+
+from beastling.fileio.matrix import MISSING
+from beastling.util import log
+from beastling.util.trees import Node, dumps, postorder
+from beastling.util.monophyly import MonophylyTree
+
+__all__ = [
+    'hamming_distances', 'upgma', 'distance_tree', 'ParsimonyTree', 'parsimony_tree']
+
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # pragma: no cover
+    def _popcount(n):
+        return bin(n).count('1')
+
+
+def _mask(bits, size):
+    buf = bytearray((size + 7) // 8)
+    for bit in bits:
+        buf[bit >> 3] |= 1 << (bit & 7)
+    return int.from_bytes(bytes(buf), 'little')
+
+
+def _encode(models, languages):
+    """
+    Encode the data of models as lists of (feature, state) pairs per language.
+
+    Features are numbered across models, states per feature, in order of
+    appearance.  Missing data is left out.
+
+    :return: Pair (list of the number of states per feature, list of lists of \
+    (feature, state) pairs, in the order of languages).
+    """
+    index = {language: i for i, language in enumerate(languages)}
+    nstates, res = [], [[] for _ in languages]
+    for model in models:
+        rows = [index.get(language) for language in model.data.languages]
+        for f in model.features:
+            feature = len(nstates)
+            # The state of each code of the feature, or None for missing data.
+            states, values = {MISSING: None}, {}
+            for row, code in zip(rows, model.data.column(f)):
+                if row is None:
+                    continue
+                if code not in states:
+                    value = model.reduce_multivalue_data(model.data.value(f, code, ['?']))
+                    states[code] = None if value == '?' else values.setdefault(value, len(values))
+                if states[code] is not None:
+                    res[row].append((feature, states[code]))
+            nstates.append(len(values))
+    return nstates, res
+
+
+def hamming_distances(models, languages):
+    """
+    Compute the pairwise distances between languages on the features of models.
+
+    Missing data is handled pairwise, i.e. two languages are only compared on
+    the features for which both have data.  Pairs without any such features
+    are assigned the mean of all other distances.
+
+    Each language is represented by a bitset of the features for which it has
+    data and a bitset of its (feature, value) pairs, so that comparing two
+    languages takes two integer intersections.
+
+    :param models: The data models, with the analysis features selected.
+    :param languages: The analysis languages, in the order of the matrix rows.
+    :return: Square matrix of distances, as list of `array.array('d')`.
+    """
+    nstates, data = _encode(models, languages)
+    offsets = [0]
+    for n in nstates:
+        offsets.append(offsets[-1] + n)
+    observed = [_mask([f for f, _ in row], len(nstates)) for row in data]
+    states = [_mask([offsets[f] + s for f, s in row], offsets[-1]) for row in data]
+
+    n = len(languages)
+    res = [array.array('d', [0.0] * n) for _ in range(n)]
+    unknown, total, count = [], 0.0, 0
+    for i in range(n):
+        oi, si, row = observed[i], states[i], res[i]
+        for j in range(i):
+            shared = _popcount(oi & observed[j])
+            if shared:
+                d = 1.0 - _popcount(si & states[j]) / shared
+                row[j] = res[j][i] = d
+                total += d
+                count += 1
+            else:
+                unknown.append((i, j))
+    mean = total / count if count else 1.0
+    for i, j in unknown:
+        res[i][j] = res[j][i] = mean
+    return res
+
+
+def _average_linkage(distances, clusters, heights):
+    """
+    Merge clusters into one by UPGMA, with the nearest-neighbour chain
+    algorithm, i.e. in time quadratic in the number of clusters.
+
+    :param clusters: List of pairs (node, list of leaf indices).
+    :param heights: `dict` mapping node ids to heights, updated for new nodes.
+    """
+    k = len(clusters)
+    if k == 1:
+        return clusters[0]
+    nodes = [node for node, _ in clusters]
+    leaves = [list(leaves) for _, leaves in clusters]
+    # The distance between clusters is the mean distance between their leaves.
+    # The diagonal is infinite, so that a cluster is not its own neighbour.
+    columns = [j for cluster in leaves for j in cluster]
+    if len(columns) == k:
+        d = [list(map(distances[i].__getitem__, columns)) for i in columns]
+    else:
+        slices, start = [], 0
+        for cluster in leaves:
+            slices.append((start, start + len(cluster)))
+            start += len(cluster)
+        d = []
+        for cluster in leaves:
+            totals = [sum(x) for x in zip(*[
+                map(distances[i].__getitem__, columns) for i in cluster])]
+            d.append([sum(totals[s:e]) / (len(cluster) * (e - s)) for s, e in slices])
+    for a in range(k):
+        d[a][a] = float('inf')
+
+    alive, chain = list(range(k)), []
+    while len(alive) > 1:
+        if not chain:
+            chain.append(alive[0])
+        a = chain[-1]
+        row = d[a]
+        b = min(alive, key=row.__getitem__)
+        if len(chain) > 1 and row[chain[-2]] <= row[b]:
+            b = chain[-2]
+        if len(chain) < 2 or b != chain[-2]:
+            chain.append(b)
+            continue
+        # a and b are mutual nearest neighbours, so we merge them.
+        del chain[-2:]
+        a, b = min(a, b), max(a, b)
+        row = d[a]
+        na, nb = len(leaves[a]), len(leaves[b])
+        node = Node(children=[nodes[a], nodes[b]])
+        heights[id(node)] = max(row[b] / 2, heights[id(nodes[a])], heights[id(nodes[b])])
+        nodes[a] = node
+        leaves[a].extend(leaves[b])
+        alive.remove(b)
+        row = d[a] = [(na * x + nb * y) / (na + nb) for x, y in zip(row, d[b])]
+        for j in alive:
+            d[j][a] = row[j]
+    return nodes[alive[0]], leaves[alive[0]]
+
+
+def upgma(distances, names, constraint=None):
+    """
+    Build a tree from a distance matrix by UPGMA.
+
+    :param distances: Square matrix of distances.
+    :param names: The leaf names, in the order of the matrix.
+    :param constraint: Optional `MonophylyTree` with leaves numbered as the \
+    rows of the matrix.  Clusters are only merged within its clades.
+    :return: Pair (root `Node`, `dict` mapping node ids to heights).
+    """
+    heights = {}
+
+    def leaf(i):
+        node = Node(name=names[i])
+        heights[id(node)] = 0.0
+        return node, [i]
+
+    if constraint is None:
+        root = _average_linkage(distances, [leaf(i) for i in range(len(names))], heights)
+    else:
+        # Clades are numbered in pre-order, so we can cluster them bottom-up.
+        clusters = [None] * len(constraint.clades)
+        for i in range(len(constraint.clades) - 1, -1, -1):
+            if constraint.children[i]:
+                clusters[i] = _average_linkage(
+                    distances, [clusters[j] for j in constraint.children[i]], heights)
+            else:
+                clusters[i] = leaf(constraint.clades[i].bit_length() - 1)
+        root = clusters[0]
+    return root[0], heights
+
+
+def _fitch(a, b, full):
+    """
+    Combine the Fitch state sets of two subtrees.
+
+    A state set is a tuple with a bitset over the features for each state, so
+    that all features are handled by a few integer operations per state.
+
+    :return: Pair (state set, number of state changes).
+    """
+    inter = tuple(x & y for x, y in zip(a, b))
+    empty = full & ~functools.reduce(operator.or_, inter, 0)
+    if not empty:
+        return inter, 0
+    return tuple(x | ((y | z) & empty) for x, y, z in zip(inter, a, b)), _popcount(empty)
+
+
+class ParsimonyTree(object):
+    """
+    A rooted binary tree, improved by hill-climbing on its Fitch parsimony
+    score with NNI and SPR moves.
+
+    Nodes are numbered, with the leaves first, and the tree is stored as
+    lists of parents and children.  For each node we keep the Fitch state set
+    of its subtree (`down`) and of the rest of the tree (`up`), which allows
+    to score all moves of one kind from one pass over the tree.
+
+    :param root: The starting tree, as `Node`.
+    :param leaves: `dict` mapping leaf names to their state sets.
+    :param required: Bitsets of leaves (numbered in the order of `leaves`) \
+    which must remain clades, e.g. from monophyly constraints.
+    """
+    def __init__(self, root, leaves, required=()):
+        self.names = list(leaves)
+        self.full = functools.reduce(
+            operator.or_, (x for states in leaves.values() for x in states), 0)
+        self.required = set(required)
+        self.parent = [None] * len(self.names)
+        self.children = [[] for _ in self.names]
+        self.down = [leaves[name] for name in self.names]
+        index = {name: i for i, name in enumerate(self.names)}
+
+        def number(node):
+            if not node.children:
+                return index[node.name]
+            self.parent.append(None)
+            self.children.append([])
+            self.down.append(None)
+            return len(self.parent) - 1
+
+        self.root = number(root)
+        stack = [(root, self.root)]
+        while stack:
+            node, i = stack.pop()
+            for child in node.children:
+                j = number(child)
+                self.parent[j] = i
+                self.children[i].append(j)
+                stack.append((child, j))
+        self.update()
+
+    def _postorder(self):
+        res, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            res.append(node)
+            stack.extend(self.children[node])
+        res.reverse()
+        return res
+
+    def update(self):
+        """
+        Recompute the state sets, clades and score of the tree.
+        """
+        nodes = self._postorder()
+        self.clades = [0] * len(self.parent)
+        self.score = 0
+        for node in nodes:
+            if self.children[node]:
+                left, right = self.children[node]
+                self.down[node], cost = _fitch(self.down[left], self.down[right], self.full)
+                self.score += cost
+                self.clades[node] = self.clades[left] | self.clades[right]
+            else:
+                self.clades[node] = 1 << node
+        self.up = [None] * len(self.parent)
+        for node in reversed(nodes):
+            if self.children[node]:
+                left, right = self.children[node]
+                if node == self.root:
+                    self.up[left], self.up[right] = self.down[right], self.down[left]
+                else:
+                    self.up[left] = _fitch(self.up[node], self.down[right], self.full)[0]
+                    self.up[right] = _fitch(self.up[node], self.down[left], self.full)[0]
+
+    def _quartet(self, a, b, c, d):
+        ab, c1 = _fitch(a, b, self.full)
+        cd, c2 = _fitch(c, d, self.full)
+        return c1 + c2 + _fitch(ab, cd, self.full)[1]
+
+    def _swap(self, x, y):
+        # Exchange the subtrees rooted at x and y.
+        px, py = self.parent[x], self.parent[y]
+        self.children[px][self.children[px].index(x)] = y
+        self.children[py][self.children[py].index(y)] = x
+        self.parent[x], self.parent[y] = py, px
+
+    def nni(self):
+        """
+        Apply the best nearest neighbour interchange, if it improves the score.
+
+        Each internal edge separates four subtrees, whose state sets are
+        known, so the change of score of an interchange is the change of the
+        cost of joining these four.
+
+        :return: Boolean flag signaling whether the tree was changed.
+        """
+        best = (0, None, None)
+        for u in range(len(self.names), len(self.parent)):
+            p = self.parent[u]
+            if p is None:
+                continue
+            a, b = self.children[u]
+            c = self._sibling(u)
+            if p == self.root:
+                # The edge between the children of the root is visited from
+                # its left end only.
+                if u != self.children[p][0] or not self.children[c]:
+                    continue
+                blocked = self.clades[u] in self.required or self.clades[c] in self.required
+                c, d = self.children[c]
+                sets = [self.down[x] for x in (a, b, c, d)]
+            else:
+                sets = [self.down[a], self.down[b], self.down[c], self.up[p]]
+                blocked = self.clades[u] in self.required
+            if blocked:
+                continue
+            current = self._quartet(*sets)
+            for x, y, delta in [
+                (b, c, self._quartet(sets[0], sets[2], sets[1], sets[3]) - current),
+                (a, c, self._quartet(sets[1], sets[2], sets[0], sets[3]) - current),
+            ]:
+                if delta < best[0]:
+                    best = (delta, x, y)
+        if best[1] is None:
+            return False
+        self._swap(best[1], best[2])
+        self.update()
+        return True
+
+    def spr(self, s):
+        """
+        Move the subtree rooted at s to the position which minimises the score.
+
+        The rest of the tree has a fixed score, so the cost of inserting s on
+        an edge is the cost of joining it with the state sets on both sides.
+
+        :return: Boolean flag signaling whether the tree was changed.
+        """
+        p = self.parent[s]
+        if p is None or p == self.root:
+            return False
+        clade, t = self.clades[s], self._sibling(s)
+        # Required clades containing s must be kept whole, so s must stay
+        # within the smallest of them; required clades disjoint from s must
+        # not receive it.
+        inside = [c & ~clade for c in self.required if c & clade == clade and c != clade]
+        outside = {c for c in self.required if not c & clade}
+        self._prune(p, t)
+        self.update()
+        nodes = {c: n for n, c in enumerate(self.clades) if c}
+        anchor = nodes[min(inside, key=_popcount)] if inside else self.root
+
+        def cost(x):
+            return _fitch(
+                _fitch(self.down[x], self.up[x], self.full)[0], self.down[s], self.full)[1]
+
+        best, stack = (cost(t), t), [anchor]
+        while stack:
+            x = stack.pop()
+            if x != self.root and x != t:
+                best = min(best, (cost(x), x))
+            if self.clades[x] not in outside:
+                stack.extend(self.children[x])
+        self._insert(p, best[1])
+        self.update()
+        return best[1] != t
+
+    def _sibling(self, x):
+        siblings = self.children[self.parent[x]]
+        return siblings[1 - siblings.index(x)]
+
+    def _prune(self, p, t):
+        # Remove node p from the tree, leaving its child t in its place.
+        g = self.parent[p]
+        self.children[p].remove(t)
+        self.children[g][self.children[g].index(p)] = t
+        self.parent[t], self.parent[p] = g, None
+
+    def _insert(self, p, x):
+        # Insert node p, with its remaining child, on the edge above x.
+        y = self.parent[x]
+        self.children[y][self.children[y].index(x)] = p
+        self.parent[p] = y
+        self.children[p].insert(0, x)
+        self.parent[x] = p
+
+    def search(self, max_moves=None, time_limit=None, seed=0):
+        """
+        Improve the tree by NNI until no interchange helps, then by SPR moves
+        of random subtrees, until no move helps.
+
+        The order of SPR moves only depends on the seed, so the search is
+        deterministic unless it is stopped by the time limit.
+
+        :param max_moves: Maximum number of moves to try, counting each pass \
+        over the interchanges and each SPR move of a subtree.
+        :param time_limit: Time limit in seconds, as a safety net for large trees.
+        :return: Boolean flag signaling whether the search was stopped by the time limit.
+        """
+        deadline = time.monotonic() + time_limit if time_limit is not None else None
+        rng, moves = random.Random(seed), 0
+        while True:
+            nodes = [n for n in range(len(self.parent)) if n != self.root]
+            rng.shuffle(nodes)
+            # Each round tries the best interchange first (node None), and
+            # starts over after the first move which improves the tree.
+            for node in itertools.chain([None], nodes):
+                if moves == max_moves:
+                    return False
+                if deadline is not None and time.monotonic() >= deadline:
+                    return True
+                moves += 1
+                if self.nni() if node is None else self.spr(node):
+                    break
+            else:
+                return False
+
+    def tree(self):
+        """
+        :return: The tree as `Node`.
+        """
+        nodes = {}
+        for node in self._postorder():
+            nodes[node] = Node(
+                name=None if self.children[node] else self.names[node],
+                children=[nodes[c] for c in self.children[node]])
+        return nodes[self.root]
+
+
+def _mean_heights(root, names, distances):
+    """
+    Compute node heights as half the mean distance between the leaves of the
+    children of each node, as in UPGMA.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    heights, leaves = {}, {}
+    nodes = [root]
+    for node in nodes:
+        nodes.extend(node.children)
+    for node in reversed(nodes):
+        if node.children:
+            left, right = [leaves.pop(id(c)) for c in node.children]
+            total = sum(sum(map(distances[i].__getitem__, right)) for i in left)
+            heights[id(node)] = total / (2.0 * len(left) * len(right))
+            leaves[id(node)] = left + right
+        else:
+            heights[id(node)] = 0.0
+            leaves[id(node)] = [index[node.name]]
+    return heights
+
+
+def distance_tree(config):
+    """
+    Build a starting tree for a processed configuration from the distances
+    between its languages.
+
+    The tree respects the monophyly constraints and calibrated clades, and its
+    node heights are fitted to the calibrations as described for `_fit_tree`.
+
+    :return: Newick string.
+    :raises ValueError: if the constraints and calibrations cannot be satisfied.
+    """
+    languages = list(config.taxa)
+    constraint, calibrations = _calibrated_constraint(config)
+    root, heights = upgma(hamming_distances(config.models, languages), languages, constraint)
+    return _fit_tree(config, root, heights, calibrations)
+
+
+def parsimony_tree(config, max_moves=None, time_limit=None):
+    """
+    Build a starting tree for a processed configuration by improving the
+    distance tree under Fitch parsimony over all features.
+
+    The topology is searched within the monophyly constraints and calibrated
+    clades; node heights are then computed from the distances between
+    languages and fitted to the calibrations as for the distance tree.
+
+    :param max_moves: Maximum number of moves to try, see `ParsimonyTree.search`.
+    :param time_limit: Time limit for the search, in seconds.
+    :return: Newick string.
+    :raises ValueError: if the constraints and calibrations cannot be satisfied.
+    """
+    languages = list(config.taxa)
+    distances = hamming_distances(config.models, languages)
+    constraint, calibrations = _calibrated_constraint(config)
+    root, _ = upgma(distances, languages, constraint)
+
+    nstates, data = _encode(config.models, languages)
+    # Leaves have the observed state of each feature, or all states of
+    # features without data.
+    nbits = max(nstates or [1])
+    unknown = [_mask([f for f, n in enumerate(nstates) if n > s], len(nstates))
+               for s in range(nbits)]
+    leaves = collections.OrderedDict()
+    for language, row in zip(languages, data):
+        observed, features = _mask([f for f, _ in row], len(nstates)), [[] for _ in unknown]
+        for f, s in row:
+            features[s].append(f)
+        leaves[language] = tuple(
+            _mask(fs, len(nstates)) | (x & ~observed) for fs, x in zip(features, unknown))
+    required = [c for c in constraint.clades if c & (c - 1)] if constraint else []
+    tree = ParsimonyTree(root, leaves, required)
+    score = tree.score
+    if tree.search(max_moves, time_limit):
+        log.warning(
+            "Parsimony search stopped after {0} seconds, so the starting tree may vary "
+            "between runs.".format(time_limit))
+    log.info(
+        "Parsimony search improved the starting tree from {0} to {1} changes.".format(
+            score, tree.score))
+    root = tree.tree()
+    return _fit_tree(config, root, _mean_heights(root, languages, distances), calibrations)
+
+
+def _constraint(config):
+    if config.languages.monophyly and config.languages.monophyly_newick:
+        return MonophylyTree(config.languages.monophyly_newick, config.taxa)
+
+
+def _nest(clades, names):
+    """
+    Arrange clades, i.e. bitsets of leaves, in a tree.
+
+    :return: The tree as Newick string.
+    :raises ValueError: if two of the clades overlap without being nested.
+    """
+    root = (1 << len(names)) - 1
+    children = {root: []}
+    # Larger clades are inserted first, so each clade is inserted below the
+    # smallest one containing it.
+    for clade in sorted(set(clades) - {root}, key=_popcount, reverse=True):
+        node = root
+        while node is not None:
+            parent, node = node, None
+            for child in children[parent]:
+                if clade & child == clade:
+                    node = child
+                    break
+                if clade & child:
+                    raise ValueError('Clades overlap')
+        children[parent].append(clade)
+        children[clade] = []
+
+    def newick(clade):
+        parts, rest = [newick(child) for child in children[clade]], clade
+        for child in children[clade]:
+            rest &= ~child
+        parts.extend(names[i] for i in range(len(names)) if rest >> i & 1)
+        return '({0})'.format(','.join(parts)) if len(parts) > 1 else parts[0]
+
+    return newick(root)
+
+
+def _bounds(cal, hard=False):
+    """
+    Return the interval of heights we aim for with a calibration: the support
+    of uniform distributions and the central 95% of other distributions or,
+    if `hard`, their support.
+    """
+    if cal.dist == 'uniform':
+        return cal.offset + cal.param[0], cal.offset + cal.param[1]
+    if cal.dist == 'point':
+        return cal.mean(), cal.mean()
+    if hard:
+        return (cal.offset if cal.dist == 'lognormal' else 0.0), float('inf')
+    mu, sigma = cal.param
+    if cal.dist == 'lognormal':
+        return cal.offset + math.exp(mu - 1.96 * sigma), cal.offset + math.exp(mu + 1.96 * sigma)
+    return cal.offset + mu - 1.96 * sigma, cal.offset + mu + 1.96 * sigma
+
+
+def _fit_heights(nodes, parents, bounds, desired, eps):
+    """
+    Choose node heights within bounds, as close to the desired heights as
+    possible, and with each node at least `eps` above its children.
+
+    :param nodes: The nodes of a tree, in post-order.
+    :param parents: `dict` mapping node ids to parent nodes.
+    :param bounds: `dict` mapping node ids to (lower, upper) bounds.
+    :return: `dict` mapping node ids to heights or None if there are no such heights.
+    """
+    # The lowest height of each node, given the bounds of its descendants:
+    lowest = {}
+    for node in nodes:
+        lower, upper = bounds[id(node)]
+        lowest[id(node)] = max([lower] + [lowest[id(c)] + eps for c in node.children])
+        if lowest[id(node)] > upper:
+            return None
+    # Going down the tree, nodes can be placed anywhere between this height
+    # and their upper bound or the height of their parent.
+    heights = {}
+    for node in reversed(nodes):
+        upper = bounds[id(node)][1]
+        if id(node) in parents:
+            upper = min(upper, heights[id(parents[id(node)])] - eps)
+        heights[id(node)] = min(max(desired[id(node)], lowest[id(node)]), upper)
+    return heights
+
+
+def _calibrated_constraint(config):
+    """
+    Combine the monophyly constraints of a configuration with its calibrated
+    clades, which BEASTling also constrains to be monophyletic.
+
+    :return: A pair of the constraint - a `MonophylyTree` or None - and a list
+        of pairs of calibrated clades and their calibrations.
+    :raises ValueError: if two clades overlap without being nested.
+    """
+    taxa = config.taxa
+    constraint = _constraint(config)
+    clades = [c for c in constraint.clades if c & (c - 1)] if constraint else []
+    calibrations = [(taxa.clade(cal.langs).mask, cal) for cal in config.calibrations.values()]
+    clades.extend(clade for clade, cal in calibrations if clade & (clade - 1))
+    if clades:
+        try:
+            constraint = MonophylyTree(_nest(clades, list(taxa)), taxa)
+        except ValueError:
+            raise ValueError(
+                "Calibrated clades overlap with each other or with monophyly constraints.")
+    return constraint, calibrations
+
+
+def _fit_tree(config, root, raw, calibrations):
+    """
+    Set the branch lengths of a tree which resolves the calibrated clades,
+    fitting its node heights to the calibrations.
+
+    Node heights are those given by `raw`, scaled to the estimated tree height
+    and moved into the central 95% of calibration distributions - or, if that
+    is not possible, into their support.
+
+    :param raw: `dict` mapping node ids to heights.
+    :return: Newick string.
+    :raises ValueError: if the calibrations cannot be satisfied.
+    """
+    taxa = config.taxa
+    nodes, parents, masks = postorder(root), {}, {}
+    for node in nodes:
+        if node.children:
+            masks[id(node)] = 0
+            for child in node.children:
+                parents[id(child)] = node
+                masks[id(node)] |= masks[id(child)]
+        else:
+            masks[id(node)] = 1 << taxa.bits[node.name]
+    by_mask = {masks[id(node)]: node for node in nodes}
+    # Tips start at the mean of their calibration, as in the date trait.
+    tips = {next(iter(cal.langs)): cal.mean() for cal in config.tip_calibrations.values()}
+
+    # The calibrated nodes, and the heights we aim for with their calibrations:
+    calibrated, centres = [], {}
+    for clade, cal in calibrations:
+        node = by_mask[clade]
+        if cal.originate:
+            if id(node) not in parents:
+                raise ValueError("The root has no ancestor, but originate(root) was calibrated.")
+            node = parents[id(node)]
+        calibrated.append((node, cal))
+        lower, upper = _bounds(cal)
+        centres[id(node)] = cal.mean() if upper < sys.maxsize else 1.5 * lower
+    config.treeprior.estimate_height(config)
+    # The root should leave room above the lower bounds.
+    centres.setdefault(id(root), max(
+        [config.treeprior.treeheight_estimate or raw[id(root)]] +
+        [1.5 * centre for centre in centres.values()] + [1.5 * tip for tip in tips.values()]))
+    # Without calibrations, we keep the shape of the tree, scaling each
+    # calibrated subtree to the height of its calibration.
+    desired, scales = {}, {}
+    for node in reversed(nodes):
+        if id(node) in centres and raw[id(node)]:
+            scales[id(node)] = centres[id(node)] / raw[id(node)]
+        else:
+            scales[id(node)] = scales[id(parents[id(node)])] if id(node) in parents else 1.0
+        desired[id(node)] = raw[id(node)] * scales[id(node)]
+
+    eps = (centres[id(root)] or 1.0) / (100.0 * len(taxa))
+    for hard in (False, True):
+        bounds = {
+            id(n): (tips.get(n.name, 0.0),) * 2 if not n.children else (0.0, float('inf'))
+            for n in nodes}
+        for node, cal in calibrated:
+            lower, upper = _bounds(cal, hard)
+            bounds[id(node)] = (
+                max(lower, bounds[id(node)][0]), min(upper, bounds[id(node)][1]))
+        for e in (eps, eps / 1000):
+            heights = _fit_heights(nodes, parents, bounds, desired, e)
+            if heights is not None:
+                for node in nodes:
+                    for child in node.children:
+                        child.length = '%.8g' % (heights[id(node)] - heights[id(child)])
+                return dumps(root)
+    raise ValueError("No starting tree satisfies the monophyly constraints and calibrations.")
@@ -0,0 +1,39 @@
+"""
+Interning of language and feature identifiers.
+
+A configuration-wide mapping of identifiers to dense integers was descoped to
+interning: the feature matrices already store their data as integer codes,
+and the set algebra over languages runs on the integer bitmasks of
+`beastling.util.clades`, so further integer codes for the identifiers would
+only have to be translated back everywhere identifiers are used by name.
+"""
+
+
+class SymbolTable(object):
+    """
+    A table of identifiers, e.g. of languages or features.
+
+    Interning identifiers through a table makes equal identifiers from
+    different sources (e.g. the data files of several models) the same
+    string object, so each identifier is stored only once.
+    """
+    def __init__(self, symbols=()):
+        self._symbols = {}
+        for symbol in symbols:
+            self.intern(symbol)
+
+    def intern(self, symbol):
+        """
+        Return the canonical string object for an identifier, adding it to the
+        table if necessary.
+        """
+        return self._symbols.setdefault(symbol, symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self._symbols
+
+    def __iter__(self):
+        return iter(self._symbols)
+
+    def __len__(self):
+        return len(self._symbols)
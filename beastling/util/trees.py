@@ -0,0 +1,104 @@
+"""
+A lightweight tree of nodes with Newick labels, which can be processed without
+recursion, i.e. for trees of any depth.
+"""
+import re
+
+__all__ = ['Node', 'parse', 'postorder', 'dumps']
+
+
+class Node(object):
+    """
+    A node of a tree read by `parse`, with name and length as strings
+    (or None), like `newick.Node`.
+    """
+    __slots__ = ['name', 'length', 'children']
+
+    def __init__(self, name=None, length=None, children=None):
+        self.name = name
+        self.length = length
+        self.children = children or []
+
+
+def _label(s):
+    name, length = s.split(':', 1) if ':' in s else (s, None)
+    if length and ':' in length:
+        raise ValueError(length)
+    return name or None, length or None
+
+
+def parse(s):
+    """
+    Parse the first tree in a Newick string, in one pass over the string.
+
+    Node labels are read as by `newick.loads`, i.e. without any quoting.
+    """
+    s = [t.strip() for t in s.split(';') if t.strip()][0]
+    # Each item on the stack is the list of children of an open node.  `closed`
+    # is the last node whose list of children has been closed, until we know
+    # its label.
+    stack, children, closed, text = [], [], None, ''
+
+    def finish():
+        # Finish the node which ends at the current position.
+        if closed is not None:
+            closed.name, closed.length = _label(text.rstrip())
+            return closed
+        return Node(*_label(text.strip()))
+
+    for token in re.split('([(),])', s):
+        if token == '(':
+            if closed is not None or text.strip():
+                raise ValueError('unexpected "("')
+            stack.append(children)
+            children, text = [], ''
+        elif token == ',' or token == ')':
+            children.append(finish())
+            closed, text = None, ''
+            if token == ')':
+                if not stack:
+                    raise ValueError('unmatched ")"')
+                closed, children = Node(children=children), stack.pop()
+        else:
+            text = token
+    if stack:
+        raise ValueError('unmatched "("')
+    return finish()
+
+
+def postorder(root):
+    """
+    Return the nodes of a tree in post-order, without recursion.
+    """
+    res, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        res.append(node)
+        stack.extend(node.children)
+    res.reverse()
+    return res
+
+
+def dumps(root):
+    """
+    Serialise a tree in Newick format, exactly like `newick.dumps`.
+    """
+    empty = {}
+    for node in postorder(root):
+        empty[id(node)] = not node.name and not node.length and (
+            not node.children or (len(node.children) == 1 and empty[id(node.children[0])]))
+    res, stack = [], [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            res.append(node)
+            continue
+        label = (node.name or '') + (':' + node.length if node.length else '')
+        if node.children and not (len(node.children) == 1 and empty[id(node.children[0])]):
+            stack.extend([label, ')'])
+            for i, child in enumerate(reversed(node.children)):
+                stack.extend([',', child] if i else [child])
+            stack.append('(')
+        else:
+            res.append(label)
+    return ''.join(res) + ';'
@@ -0,0 +1,66 @@
+"""
+Benchmark reading a CLDF Wordlist with pycldf against the trusted reader.
+
+Usage: python benchmarks/cldf_reader.py [--concepts N] [FORMS ...]
+"""
+import argparse
+import random
+import tempfile
+import timeit
+from pathlib import Path
+
+from pycldf import Wordlist
+
+from beastling.fileio.datareaders import read_cldf_dataset
+
+
+def make_wordlist(directory, n_forms, n_concepts):
+    rng = random.Random(n_forms)
+    n_languages = max(1, n_forms // n_concepts)
+    ds = Wordlist.in_dir(directory)
+    ds.add_component('LanguageTable')
+    ds.add_component('ParameterTable')
+    ds.add_columns('FormTable', 'Cognateset_ID')
+    ds['FormTable', 'Cognateset_ID'].propertyUrl = \
+        'http://cldf.clld.org/v1.0/terms.rdf#cognatesetReference'
+    ds.write(
+        LanguageTable=[
+            dict(ID='l{0}'.format(i), Name='Language {0}'.format(i))
+            for i in range(n_languages)],
+        ParameterTable=[
+            dict(ID='p{0}'.format(i), Name='Concept {0}'.format(i))
+            for i in range(n_concepts)],
+        FormTable=[
+            dict(
+                ID=str(i),
+                Language_ID='l{0}'.format(i // n_concepts),
+                Parameter_ID='p{0}'.format(i % n_concepts),
+                Form='form',
+                Cognateset_ID='c{0}'.format(rng.randrange(5)))
+            for i in range(n_forms)])
+    return Path(directory) / 'Wordlist-metadata.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('sizes', nargs='*', type=int, default=[10000, 100000, 500000])
+    parser.add_argument('--concepts', type=int, default=200)
+    args = parser.parse_args()
+
+    print('{0:>8} {1:>12} {2:>12}'.format('forms', 'pycldf (s)', 'trusted (s)'))
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            md = make_wordlist(tmp, n, args.concepts)
+            res = {}
+
+            def read(trusted):
+                res[trusted] = read_cldf_dataset(md, expect_multiple=True, trusted=trusted)
+
+            pycldf_time = timeit.timeit(lambda: read(False), number=1)
+            trusted_time = timeit.timeit(lambda: read(True), number=1)
+            assert res[True] == res[False]
+            print('{0:>8} {1:>12.3f} {2:>12.3f}'.format(n, pycldf_time, trusted_time))
+
+
+if __name__ == '__main__':
+    main()
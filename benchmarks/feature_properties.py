@@ -0,0 +1,71 @@
+"""
+Benchmark BaseModel/BinaryModel.compute_feature_properties against the
+original implementation, which counted values with list.count.
+
+Usage: python benchmarks/feature_properties.py [--features N] [SIZE ...]
+"""
+import argparse
+import random
+import timeit
+
+from beastling.fileio.matrix import FeatureMatrix
+from beastling.models.basemodel import BaseModel
+from beastling.models.binary import BinaryModel
+
+
+def legacy_compute_feature_properties(model):
+    """
+    The original, quadratic implementation of
+    BaseModel.compute_feature_properties, reading from the feature matrix.
+    """
+    model.valuecounts, model.unique_values, model.missing_ratios = {}, {}, {}
+    model.counts, model.codemaps = {}, {}
+    for f in model.features:
+        all_values = [model.reduce_multivalue_data(v) for v in model.data.column_values(f, ["?"])]
+        missing_data_ratio = all_values.count("?") / (1.0*len(all_values))
+        non_q_values = [v for v in all_values if v != "?"]
+        counts = {}
+        for v in non_q_values:
+            counts[v] = non_q_values.count(v)
+        unique_values = sorted(set(non_q_values), key=int)
+        model.unique_values[f] = unique_values
+        model.valuecounts[f] = len(unique_values)
+        model.missing_ratios[f] = missing_data_ratio
+        model.counts[f] = counts
+        model.codemaps[f] = model.build_codemap(unique_values)
+
+
+def make_model(cls, n_languages, n_features, n_values=8, missing=0.2):
+    rng = random.Random(n_languages)
+    data = FeatureMatrix(multiple=True)
+    for l in range(n_languages):
+        for f in range(n_features):
+            if rng.random() > missing:
+                data.append('l%d' % l, 'f%d' % f, str(rng.randrange(n_values)))
+    model = cls.__new__(cls)
+    model.data = data
+    model.features = sorted(data.features)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('sizes', nargs='*', type=int, default=[1000, 5000, 20000])
+    parser.add_argument('--features', type=int, default=10)
+    args = parser.parse_args()
+
+    print('{0:>8} {1:>12} {2:>12} {3:>12}'.format('langs', 'legacy (s)', 'base (s)', 'binary (s)'))
+    for n in args.sizes:
+        base = make_model(BaseModel, n, args.features)
+        binary = make_model(BinaryModel, n, args.features)
+        legacy_time = timeit.timeit(lambda: legacy_compute_feature_properties(base), number=1)
+        legacy_counts = base.counts
+        base_time = timeit.timeit(base.compute_feature_properties, number=1)
+        assert base.counts == legacy_counts
+        binary_time = timeit.timeit(binary.compute_feature_properties, number=1)
+        print('{0:>8} {1:>12.3f} {2:>12.3f} {3:>12.3f}'.format(
+            n, legacy_time, base_time, binary_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark sanitising large user-provided trees, optionally against the newick package.
+
+Usage: python benchmarks/sanitise_tree.py [--compare] [TIPS ...]
+"""
+import argparse
+import random
+import timeit
+
+import newick
+
+from beastling.util.misc import sanitise_tree
+
+
+def make_tree(n_tips, rng):
+    """
+    Make a Glottolog-like tree, i.e. a shallow tree with polytomies and
+    unifurcations.
+    """
+    def build(names, depth):
+        if len(names) == 1:
+            return names[0]
+        if depth > 12 or len(names) < 4:
+            return '(' + ','.join(names) + ')'
+        cuts = sorted(rng.sample(range(1, len(names)), min(rng.randrange(2, 8), len(names)) - 1))
+        res = '(' + ','.join(
+            build(names[i:j], depth + 1) for i, j in zip([0] + cuts, cuts + [len(names)])) + ')'
+        return '(' + res + ')' if rng.random() < 0.2 else res
+
+    names = ['l{0}'.format(i) for i in range(n_tips)]
+    return build(names, 0) + ';', names
+
+
+def sanitise_with_newick(tree, languages):
+    tree = newick.loads(tree)[0]
+    tree.prune_by_names(languages, inverse=True)
+    tree.remove_redundant_nodes()
+    tree.remove_internal_names()
+    tree.resolve_polytomies()
+    return newick.dumps(tree)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('sizes', nargs='*', type=int, default=[1000, 10000, 50000])
+    parser.add_argument('--compare', action='store_true', default=False)
+    args = parser.parse_args()
+
+    print('{0:>8} {1:>12} {2:>12}'.format('tips', 'newick (s)', 'sanitise (s)'))
+    for n in args.sizes:
+        rng = random.Random(n)
+        tree, names = make_tree(n, rng)
+        # Prune a tenth of the tips, as for a tree covering more languages
+        # than the data.
+        languages = set(rng.sample(names, n - n // 10))
+        res = {}
+
+        def run(name, func):
+            res[name] = func(tree, languages)
+
+        newick_time = float('nan')
+        if args.compare:
+            newick_time = timeit.timeit(lambda: run('newick', sanitise_with_newick), number=1)
+        sanitise_time = timeit.timeit(
+            lambda: run('sanitise', lambda t, l: sanitise_tree(t, 'starting', l)), number=1)
+        if args.compare:
+            assert res['newick'] == res['sanitise']
+        print('{0:>8} {1:>12.3f} {2:>12.3f}'.format(n, newick_time, sanitise_time))
+
+
+if __name__ == '__main__':
+    main()
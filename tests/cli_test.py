@@ -69,3 +69,63 @@ def test_generate_extract(capsys, tmppath, config_dir, caplog):
     _run_main('--extract {0}'.format(xml))
     assert tcfg.exists()
     tcfg.unlink()
+
+
+def test_compile_data(capsys, tmppath, data_dir, config_dir):
+    compiled = tmppath / 'basic.bdat'
+    _run_main('--compile-data -o {0} {1}'.format(compiled, data_dir / 'basic.csv'))
+    assert compiled.exists()
+    out, err = capsys.readouterr()
+    assert 'Compiled' in out
+    _run_main('--compile-data -o {0} {1}'.format(compiled, data_dir / 'basic.csv'), status=4)
+
+    cfg = tmppath / 'compiled.conf'
+    cfg.write_text(
+        (config_dir / 'basic.conf').read_text(encoding='utf8').replace(
+            './tests/data/basic.csv', str(compiled)),
+        encoding='utf8')
+    xml = tmppath / 'test.xml'
+    _run_main('-o {0} {1}'.format(xml, cfg))
+    assert xml.exists()
+
+    compiled = tmppath / 'nonstandard_lang_col.bdat'
+    _run_main('--compile-data --language-column sprache -o {0} {1}'.format(
+        compiled, data_dir / 'nonstandard_lang_col.csv'))
+    cfg.write_text(
+        (config_dir / 'nonstandard_lang_col.conf').read_text(encoding='utf8').replace(
+            './tests/data/nonstandard_lang_col.csv', str(compiled)),
+        encoding='utf8')
+    _run_main('-o {0} --overwrite {1}'.format(xml, cfg))
+
+
+def test_glottolog(capsys, tmppath, mocker):
+    mocker.patch('beastling.cli.user_data_dir', mocker.Mock(return_value=str(tmppath)))
+    newick = tmppath / 'tree-glottolog-newick.txt'
+    newick.write_text("('Lang [lang1234][abc]-l-':1)'Family [fami1234]':1;", encoding='utf8')
+    geo = tmppath / 'languages-and-dialects-geo.csv'
+    geo.write_text(
+        'glottocode,name,isocodes,level,macroarea,latitude,longitude\n'
+        'lang1234,Lang,abc,language,Eurasia,1.0,2.0\n',
+        encoding='utf8')
+
+    _run_main('glottolog', status=2)
+    _run_main('glottolog import 4.0 {0} {1}'.format(newick, geo), status=1)
+    _run_main('glottolog import 4.1 {0} {1}'.format(newick, geo))
+    _run_main('glottolog import 4.1 {0} {1}'.format(newick, geo), status=4)
+    _run_main('glottolog import 4.1 {0} {1} --overwrite'.format(newick, geo))
+    _run_main('glottolog verify')
+    _run_main('glottolog precompile 4.1')
+    assert (tmppath / 'glottolog-4.1-index.bin').exists()
+    _run_main('glottolog precompile 5.0', status=1)
+    capsys.readouterr()
+    _run_main('glottolog list')
+    out, err = capsys.readouterr()
+    assert [l.split('\t')[0] for l in out.splitlines()] == ['4.0', '4.1']
+    assert out.splitlines()[1].endswith('indexed')
+
+    geo.write_text('glottocode,x\n', encoding='utf8')
+    _run_main('glottolog import 4.1 {0} {1} --overwrite'.format(newick, geo))
+    (tmppath / 'glottolog-4.1-geo.csv').write_text('x', encoding='utf8')
+    _run_main('glottolog verify 4.1', status=2)
+    out, err = capsys.readouterr()
+    assert 'mismatch' in err
@@ -1,5 +1,6 @@
 import io
 import sys
+import pickle
 from pathlib import Path
 import logging
 
@@ -51,22 +52,33 @@ def test_get_glottolog_newick(tmppath, mocker):
 def test_get_glottolog_data_download(tmppath, mocker):
     data_dir = tmppath / 'data'
 
-    class URLopener(object):
-        def retrieve(self, url, fname):
-            with io.open(fname, 'w', encoding='utf8') as fp:
-                fp.write('(B [abcd1234],C [abcd1234])A [abcd1234];')
-
-    class URLopenerError(object):
-        def retrieve(self, url, fname):
-            raise IOError()
-
     mocker.patch('beastling.configuration.user_data_dir', mocker.Mock(return_value=str(data_dir)))
-    mocker.patch('beastling.util.misc.URLopener', URLopenerError)
+    mocker.patch('beastling.util.misc.urlopen', mocker.Mock(side_effect=IOError))
     with pytest.raises(ValueError):
         get_glottolog_data('newick', '2.5')
 
-    mocker.patch('beastling.util.misc.URLopener', URLopener)
+    assert not list(data_dir.iterdir())
+
+    mocker.patch(
+        'beastling.util.misc.urlopen',
+        mocker.Mock(return_value=io.BytesIO(b'(B [abcd1234],C [abcd1234])A [abcd1234];')))
     assert get_glottolog_data('newick', '2.5')
+    assert sorted(p.name for p in data_dir.iterdir()) == \
+        ['glottolog-2.5.json', 'glottolog-2.5.newick']
+
+
+def test_get_glottolog_data_offline(tmppath, mocker, config_factory):
+    mocker.patch('beastling.configuration.user_data_dir', mocker.Mock(return_value=str(tmppath)))
+    mocker.patch('beastling.configuration.retrieve_url', mocker.Mock(side_effect=AssertionError))
+    with pytest.raises(ValueError, match='offline'):
+        get_glottolog_data('newick', '2.5', offline=True)
+    assert get_glottolog_data('newick', '4.0', offline=True).exists()
+
+    cfg = config_factory('glottolog_families')
+    cfg.admin.glottolog_release = '2.5'
+    cfg.offline = True
+    with pytest.raises(ValueError, match='offline'):
+        cfg.process()
 
 
 def test_families(config_factory):
@@ -210,6 +222,46 @@ def test_minimum_data(config_factory):
     assert "f8" not in config.models[0].features
 
 
+def test_shared_data(mocker, config_factory):
+    load = mocker.spy(beastling.fileio.datareaders, 'load_data')
+    _processed_config(config_factory, 'multimodel', 'multi_mk')
+    # Five models use basic.csv, but it is only parsed once:
+    assert load.call_count == 2
+
+    # Identifiers are shared between models:
+    config = _processed_config(config_factory, 'multimodel')
+    lang = config.languages.languages[0]
+    assert all(l in config.symbols for l in config.languages.languages)
+    assert all(
+        [l for l in m.data.languages if l == lang][0] is config.symbols.intern(lang)
+        for m in config.models)
+
+    config = config_factory('multimodel', 'multi_mk')
+    config.admin.data_workers = 2
+    config.process()
+    serial = _processed_config(config_factory, 'multimodel', 'multi_mk')
+    for model, expected in zip(config.models, serial.models):
+        assert model.features == expected.features
+        assert model.data == expected.data
+
+
+def test_shared_glottolog(mocker, config_dir):
+    configfiles = [str(config_dir / '{0}.conf'.format(n)) for n in ['basic', 'geo']]
+    config = Configuration(configfile=configfiles)
+    config.process()
+
+    # A worker process gets the index by path, and does not load Glottolog itself:
+    index = pickle.loads(pickle.dumps(config.glottolog))
+    load = mocker.spy(beastling.configuration.GlottologIndex, 'load')
+    shared = Configuration(configfile=configfiles, glottolog=index)
+    shared.process()
+    assert not load.called
+    assert shared.glottolog is index
+    assert all(
+        shared.locations[l] == config.locations[l] for l in config.languages.languages)
+    assert shared.classifications['aiw'] == config.classifications['aiw']
+
+
 def test_pruned_rlc(config_factory):
     # Make sure pruned trees are disabled if used in conjunction with RLC
     config = config_factory('basic', 'pruned', 'random')
@@ -255,6 +307,18 @@ def test_bad_ascertainment(config_factory):
         config.process()
 
 
+def test_binary_frequencies(config_factory):
+    # The empirical frequencies of recoded data are those of the alignment,
+    # which has "?" removed from data points, before and after it is written.
+    config = _processed_config(config_factory, 'admin', 'covarion_multistate')
+    model = config.models[0]
+    assert model.build_freq_str() == "0.80 0.20"
+    BeastXml(config)
+    assert model.build_freq_str() == "0.80 0.20"
+    assert model.build_freq_str('f7') == "0.83 0.17"
+    assert model.build_freq_str('f8') == "0.89 0.11"
+
+
 def test_user_locations(config_factory):
     # First check that we correctly load Glottolog's locations for aiw and abp
     config = _processed_config(config_factory, 'basic', 'geo')
@@ -312,6 +376,16 @@ def test_language_groups(config_factory):
     assert config.language_groups["macronesian"] == {"kbt", "abf", "abg"}
 
 
+def test_clade_languages(config_factory):
+    config = _processed_config(config_factory, 'basic', 'calibration')
+    index = config.clade_languages()
+    # The index is built once, for the final list of languages:
+    assert config.clade_languages() is index
+    assert index['cushitic'] == set(config.get_languages_by_glottolog_clade('Cushitic'))
+    assert 'omotic' not in index
+    assert set(config.get_languages_by_glottolog_clade('cushitic,Omotic')) == index['cushitic']
+
+
 def test_nonexisting_language_group(config_factory):
     config = config_factory('basic', 'reconstruct_one')
     with pytest.raises(KeyError):
@@ -337,6 +411,17 @@ def test_calibration(config_factory):
     assert 'DistributionForcush1243MRCA' in BeastXml(config).tostring().decode('utf8')
 
 
+def test_calibration_single_language_clade(config_factory, caplog):
+    # A calibration on a Glottolog clade with only one language in the
+    # analysis is ambiguous, so it is ignored.
+    config = config_factory('basic')
+    config.calibration_configs['Chadic'] = '4.8 - 5.2'
+    with caplog.at_level(logging.INFO, logger=beastling.__name__):
+        config.process()
+    assert not config.calibrations
+    assert any('matches only one language' in r.message for r in caplog.records)
+
+
 @pytest.mark.parametrize(
     'cfgs,in_xml',
     [
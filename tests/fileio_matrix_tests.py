@@ -0,0 +1,92 @@
+import pytest
+
+from beastling.fileio.matrix import FeatureMatrix, MISSING
+
+
+@pytest.fixture
+def matrix():
+    m = FeatureMatrix(multiple=True)
+    m.append('l1', 'f1', 'a')
+    m.append('l1', 'f1', 'b')
+    m.append('l2', 'f1', 'a')
+    m.append('l2', 'f2', '-')
+    m.append('l3', 'f2', 'x')
+    return m
+
+
+def test_mapping_interface(matrix):
+    assert list(matrix) == ['l1', 'l2', 'l3']
+    assert matrix['l1']['f1'] == ['a', 'b']
+    assert dict(matrix['l2']) == {'f1': ['a'], 'f2': ['-']}
+    assert 'f2' not in matrix['l1']
+    assert matrix['l1'].get('f2', ['?']) == ['?']
+    assert len(matrix['l3']) == 1
+    # Values are copies, so callers may mutate them freely:
+    matrix['l1']['f1'].append('c')
+    assert matrix['l1']['f1'] == ['a', 'b']
+    with pytest.raises(KeyError):
+        matrix['xyz']
+
+
+def test_codes(matrix):
+    assert matrix.code('l1', 'f1') != matrix.code('l2', 'f1')
+    assert matrix.code('l1', 'f2') == MISSING
+    assert matrix.codes('l3') == [MISSING, matrix.code('l3', 'f2')]
+    assert list(matrix.column('f1')) == [2, 1, MISSING]
+    assert matrix.codebook('f1') == [None, ('a',), ('a', 'b')]
+    assert matrix.value('f1', MISSING, ['?']) == ['?']
+    assert matrix.column_values('f2') == [None, ['-'], ['x']]
+
+
+def test_single_valued():
+    m = FeatureMatrix()
+    m.set('l1', 'f', '1')
+    m.set('l1', 'f', '2')
+    m.add_language('l2')
+    assert m['l1']['f'] == '2'
+    assert dict(m['l2']) == {}
+    assert m == {'l1': {'f': '2'}, 'l2': {}}
+
+
+def test_select(matrix):
+    sub = matrix.select_features(['f2', 'f3'])
+    assert sub.features == ['f2']
+    assert dict(sub['l1']) == {}
+    assert matrix['l1']['f1'] == ['a', 'b']
+
+    sub = matrix.select_languages(['l3', 'l1', 'l4'])
+    assert list(sub) == ['l3', 'l1']
+    assert sub['l1']['f1'] == ['a', 'b']
+    assert sub['l3']['f2'] == ['x']
+    assert 'l2' in matrix
+
+
+def test_with_languages(matrix):
+    res = matrix.with_languages(['l4', 'l1'])
+    assert list(res) == ['l1', 'l2', 'l3', 'l4']
+    assert dict(res['l4']) == {}
+    assert res['l1']['f1'] == ['a', 'b']
+    assert 'l4' not in matrix
+
+
+def test_intern(matrix):
+    res = matrix.intern(lambda s: s.upper())
+    assert list(res) == ['L1', 'L2', 'L3']
+    assert res['L1']['F1'] == ['a', 'b']
+    assert list(matrix) == ['l1', 'l2', 'l3']
+
+
+def test_recode(matrix):
+    recoded = matrix.recode(lambda vs: [v for v in vs if v != 'b'], features=['f1'])
+    assert recoded['l1']['f1'] == ['a']
+    assert recoded.code('l1', 'f1') == recoded.code('l2', 'f1')
+    assert recoded['l2']['f2'] == ['-']
+    assert matrix['l1']['f1'] == ['a', 'b']
+
+
+def test_code_counts(matrix):
+    matrix.add_language('l4')
+    counts = matrix.code_counts('f1')
+    assert counts[MISSING] == 2
+    assert counts[matrix.code('l1', 'f1')] == 1
+    assert sum(counts.values()) == len(matrix)
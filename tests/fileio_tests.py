@@ -1,13 +1,19 @@
+import bz2
+import gzip
+import lzma
+import pickle
 import logging
-from io import StringIO
+from io import StringIO, BytesIO, BufferedReader, TextIOWrapper
 
 import pytest
 from pycldf import Wordlist, Generic
 
 import beastling
 from beastling.fileio.datareaders import (
-    load_data, sniff, build_lang_ids, read_cldf_dataset, iterlocations,
+    load_data, sniff, build_lang_ids, read_cldf_dataset, iterlocations, detect_encoding,
+    compile_data,
 )
+from beastling.fileio.cache import DataCache
 
 @pytest.fixture
 def cldf_factory(tmppath):
@@ -161,6 +167,36 @@ def test_sniffer(data_dir, fname):
     assert dialect.delimiter == "," if fname.endswith('.csv') else '\t'
 
 
+@pytest.mark.parametrize(
+    'content,encoding',
+    [
+        ('äb'.encode('utf8'), 'utf-8'),
+        ('äb'.encode('utf-8-sig'), 'utf-8-sig'),
+        ('äb'.encode('utf16'), 'utf-16'),
+        ('äb'.encode('utf32'), 'utf-32'),
+        # A truncated multi-byte character at the end of the sample:
+        (b'a' + 'ä'.encode('utf8')[:1], 'utf-8'),
+    ]
+)
+def test_detect_encoding(content, encoding):
+    assert detect_encoding(content) == encoding
+
+
+def test_sniff_memoised(mocker, tmppath):
+    fname = tmppath / 'data.csv'
+    fname.write_text('iso, a, b\nabc, 1, 2\n', encoding='utf16')
+    dialect = sniff(fname)
+    assert dialect.delimiter == ',' and dialect.skipinitialspace
+    assert dialect.encoding == 'utf-16'
+
+    detect = mocker.spy(beastling.fileio.datareaders, 'detect_encoding')
+    assert sniff(str(fname)) is dialect
+    assert not detect.called
+
+    fname.write_text('iso\ta\nabc\t1\n', encoding='utf8')
+    assert sniff(fname).delimiter == '\t'
+
+
 def test_iterlocations_missing_column(tmppath):
     tmppath.joinpath('locs').write_text('iso,lat\nabc,2.2', encoding='utf8')
 
@@ -171,3 +207,152 @@ def test_iterlocations_missing_column(tmppath):
 def test_iterlocations_invalid_coords(tmppath):
     tmppath.joinpath('locs').write_text('iso,lat,lon\nabc,2.2,xy', encoding='utf8')
     assert list(iterlocations(tmppath.joinpath('locs')))[0][1][1] == '?'
+
+
+def test_load_data_cached(mocker, data_dir, tmppath):
+    cache = DataCache(tmppath / 'cache')
+    data, _ = load_data(data_dir / 'basic.csv', cache=cache)
+    assert len(list(cache.directory.glob('*.pickle'))) == 1
+
+    parse = mocker.patch('beastling.fileio.datareaders._load_data', return_value=({}, {}))
+    cached, _ = load_data(data_dir / 'basic.csv', cache=cache)
+    assert not parse.called
+    assert cached == data
+
+    # Different reader options or changed content bypass the cache entry:
+    load_data(data_dir / 'basic.csv', expect_multiple=True, cache=cache)
+    assert parse.call_count == 1
+    data_dir.joinpath('basic.csv').write_text(
+        data_dir.joinpath('basic.csv').read_text(encoding='utf8') + 'xyz1234,1,1,1,1,1,1,1,1,1,1\n',
+        encoding='utf8')
+    load_data(data_dir / 'basic.csv', cache=cache)
+    assert parse.call_count == 2
+
+
+def test_load_cldf_data_cached(data_dir, tmppath):
+    cache = DataCache(tmppath / 'cache')
+    fname = data_dir / 'StructureDataset-metadata.json'
+    assert load_data(fname, cache=cache) == load_data(fname, cache=cache) == load_data(fname)
+
+
+def test_data_cache_eviction(tmppath):
+    cache = DataCache(tmppath / 'cache', max_bytes=1)
+    cache.put('a', list(range(100)))
+    cache.put('b', list(range(100)))
+    assert cache.get('a') is None
+    assert cache.get('b') == list(range(100))
+
+
+@pytest.mark.parametrize(
+    'fname,kw',
+    [
+        ('basic.csv', dict()),
+        ('cldf.csv', dict()),
+        ('cldf.csv', dict(expect_multiple=True)),
+        ('StructureDataset-metadata.json', dict()),
+    ]
+)
+def test_load_data_filtered(data_dir, tmppath, fname, kw):
+    data, _ = load_data(data_dir / fname, **kw)
+    features, languages = set(data.features[::2]), set(data.languages[::3])
+    filters = dict(
+        feature_filter=lambda f: f in features,
+        language_filter=lambda l, glottocode: l in languages)
+    expected = {l: {f: v for f, v in data[l].items() if f in features} for l in languages}
+
+    filtered, _ = load_data(data_dir / fname, **dict(kw, **filters))
+    assert set(filtered.features) == features
+    assert filtered == expected
+
+    cache = DataCache(tmppath / 'cache')
+    for _ in range(2):
+        assert load_data(data_dir / fname, cache=cache, **dict(kw, **filters))[0] == expected
+
+
+@pytest.mark.parametrize(
+    'fname',
+    [
+        'Wordlist-metadata.json',
+        'Wordlist-with-languages-table-metadata.json',
+        'StructureDataset-metadata.json',
+    ]
+)
+@pytest.mark.parametrize('expect_multiple', [True, False])
+def test_read_cldf_dataset_trusted(data_dir, fname, expect_multiple):
+    data, lmap = read_cldf_dataset(data_dir / fname, expect_multiple=expect_multiple)
+    trusted, trusted_lmap = read_cldf_dataset(
+        data_dir / fname, expect_multiple=expect_multiple, trusted=True)
+    assert trusted == data
+    assert trusted_lmap == lmap
+
+
+def test_read_cldf_dataset_trusted_factory(cldf_factory, tmppath):
+    cldf_factory()
+    data, _ = read_cldf_dataset(
+        tmppath / 'metadata.json', code_column='Parameter_ID', trusted=True)
+    assert data['l_name']['pname'] == 'p'
+    with pytest.raises(ValueError):
+        read_cldf_dataset(tmppath / 'metadata.json', trusted=True)
+
+
+@pytest.mark.parametrize('fname', ['basic.csv', 'cldf.csv', 'StructureDataset-metadata.json'])
+def test_compile_data(data_dir, tmppath, fname):
+    compiled = compile_data(data_dir / fname, tmppath / 'data.bdat')
+    for expect_multiple in [True, False]:
+        data, lmap = load_data(data_dir / fname, expect_multiple=expect_multiple)
+        cdata, clmap = load_data(compiled, expect_multiple=expect_multiple)
+        assert cdata == data and clmap == lmap
+        assert pickle.loads(pickle.dumps(cdata)) == data
+
+    features, languages = set(data.features[1:]), set(data.languages[::2])
+    cdata, _ = load_data(
+        compiled,
+        cache=DataCache(tmppath / 'cache'),
+        feature_filter=lambda f: f in features,
+        language_filter=lambda l, glottocode: l in languages)
+    assert set(cdata) == languages and set(cdata.features) == features
+    assert not (tmppath / 'cache').exists()
+
+
+def test_compile_data_reader_options(data_dir, tmppath):
+    fname = data_dir / 'nonstandard_lang_col.csv'
+    compiled = compile_data(fname, tmppath / 'data.bdat', lang_column='sprache')
+    assert load_data(compiled, lang_column='sprache') == load_data(fname, lang_column='sprache')
+    assert load_data(compiled) == load_data(fname, lang_column='sprache')
+    # The data cannot be read again with other options:
+    with pytest.raises(ValueError, match='compiled with lang_column=sprache'):
+        load_data(compiled, lang_column='language')
+    with pytest.raises(ValueError, match='value_column'):
+        load_data(compiled, file_format='compiled', value_column='Value')
+
+
+def test_load_compiled_errors(tmppath):
+    fname = tmppath / 'data.bdat'
+    fname.write_bytes(b'BEASTLNG')
+    with pytest.raises(ValueError):
+        load_data(fname)
+
+
+@pytest.mark.parametrize('fname', ['basic.csv', 'cldf.csv', 'cldf.tsv'])
+@pytest.mark.parametrize('module', [gzip, bz2, lzma])
+def test_load_compressed_data(data_dir, tmppath, fname, module):
+    compressed = tmppath / (fname + '.z')
+    compressed.write_bytes(module.compress(data_dir.joinpath(fname).read_bytes()))
+    assert sniff(compressed).delimiter == sniff(data_dir / fname).delimiter
+    assert load_data(compressed) == load_data(data_dir / fname)
+    if fname == 'cldf.tsv':
+        compressed = compressed.rename(tmppath / 'cldf.tsv.gz')
+        assert load_data(compressed, file_format='cldf-legacy') == load_data(data_dir / fname)
+
+
+def test_load_compressed_data_from_stdin(mocker, data_dir):
+    filename = data_dir / 'basic.csv'
+    mocker.patch(
+        'beastling.fileio.datareaders.sys.stdin',
+        TextIOWrapper(BufferedReader(BytesIO(gzip.compress(filename.read_bytes())))))
+    assert load_data('stdin') == load_data(filename)
+
+
+def test_iterlocations_compressed(tmppath):
+    tmppath.joinpath('locs.csv.xz').write_bytes(lzma.compress(b'iso,lat,lon\nabc,2.2,3.3'))
+    assert list(iterlocations(tmppath.joinpath('locs.csv.xz'))) == [('abc', (2.2, 3.3))]
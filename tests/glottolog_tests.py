@@ -0,0 +1,163 @@
+import pickle
+
+import pytest
+
+from beastling import glottolog_store
+from beastling.glottolog import GlottologIndex, CladeIndex, CodeTable, CodeMap
+
+
+def test_GlottologIndex(tmppath, mocker):
+    newick = tmppath / 'glottolog.newick'
+    newick.write_text(
+        "('Dialect [dial1234]':1,'Lang [lang1234][abc]-l-':1)'Family [fami1234]':1;",
+        encoding='utf8')
+    geo = tmppath / 'glottolog-geo.csv'
+    geo.write_text(
+        'glottocode,name,isocodes,level,macroarea,latitude,longitude\n'
+        'lang1234,Lang,abc,language,Eurasia,1.0,2.0\n'
+        'dial1234,Dialect,,dialect,Eurasia,,\n',
+        encoding='utf8')
+    path = tmppath / 'index.bin'
+
+    index = GlottologIndex.load(newick, geo, path)
+    assert path.exists()
+    classifications = index.classifications()
+    assert classifications['abc'] == [('Family', 'fami1234')]
+    assert 'xyz' not in classifications
+    assert [index.clades.glottocode(i) for i in range(3)] == ['fami1234', 'dial1234', 'lang1234']
+    assert list(index.clades.parent) == [-1, 0, 0]
+    assert index.clades.name(2) == 'Lang'
+    assert index.node('abc') == index.clades.id('lang1234') == 2
+    assert index.macroareas['abc'] == 'Eurasia'
+    # The dialect's closest ancestor with a location is the family, which has none:
+    assert 'dial1234' not in index.locations
+    # The index is memory-mapped, and passed to other processes by path:
+    assert index.path == path
+    assert pickle.loads(pickle.dumps(index)).classifications()['abc'] == [('Family', 'fami1234')]
+    assert len(pickle.dumps(index)) < 200
+
+    build = mocker.spy(GlottologIndex, 'from_sources')
+    assert GlottologIndex.load(newick, geo, path).locations == index.locations
+    assert not build.called
+
+    # Changing a source file triggers a rebuild:
+    geo.write_text(
+        geo.read_text(encoding='utf8') + 'fami1234,Family,,family,Eurasia,3.0,4.0\n',
+        encoding='utf8')
+    index = GlottologIndex.load(newick, geo, path)
+    assert build.called
+    assert index.locations['dial1234'] == (3.0, 4.0)
+
+
+def test_inherit_locations(tmppath):
+    newick = tmppath / 'glottolog.newick'
+    newick.write_text(
+        "((('Subdialect [subd1234]':1)'Dialect [dial1234][xyz]':1)'Lang [lang1234][abc]-l-':1,"
+        "'Other [othe1234]':1)'Family [fami1234]':1;",
+        encoding='utf8')
+    geo = tmppath / 'glottolog-geo.csv'
+    geo.write_text(
+        'glottocode,name,isocodes,level,macroarea,latitude,longitude\n'
+        'subd1234,Subdialect,,dialect,,,\n'
+        'dial1234,Dialect,xyz,dialect,,5.0,6.0\n'
+        'lang1234,Lang,abc,language,,1.0,2.0\n'
+        'othe1234,Other,,language,,3.0,4.0\n',
+        encoding='utf8')
+    index = GlottologIndex.from_sources(newick, geo)
+    # Dialects are located at their language, whatever the order of the geo data:
+    assert index.locations['subd1234'] == index.locations['xyz'] == (1.0, 2.0)
+
+    locations = dict(index.locations)
+    patched = {'abc': (7.0, 8.0), 'lang1234': (7.0, 8.0), 'subd1234': (9.0, 9.0)}
+    locations.update(patched)
+    index.inherit_locations(locations, patched)
+    assert locations['dial1234'] == locations['xyz'] == (7.0, 8.0)
+    assert locations['subd1234'] == (9.0, 9.0)
+    assert locations['othe1234'] == (3.0, 4.0)
+
+
+def test_Classifications(tmppath):
+    newick = tmppath / 'glottolog.newick'
+    newick.write_text(
+        "(('Lang [lang1234][abc]-l-':1)'Sub [subg1234]':1)'Family [fami1234]':1;\n"
+        "('Other [othe1234]':1)'Other family [othe1235]':1;",
+        encoding='utf8')
+    geo = tmppath / 'glottolog-geo.csv'
+    geo.write_text('glottocode,name,isocodes,level,macroarea,latitude,longitude\n', encoding='utf8')
+    classifications = GlottologIndex.from_sources(newick, geo).classifications()
+
+    assert classifications['abc'] == [('Family', 'fami1234'), ('Sub', 'subg1234')]
+    assert classifications['abc'] is classifications['lang1234']
+    assert classifications.get('othe1235') == [('Other family', 'othe1235')]
+    assert classifications.get('xyz') is None
+    classifications['othe1234'] = []
+    assert classifications['othe1234'] == []
+    classifications['mylang'] = classifications['lang1234']
+    del classifications['subg1234']
+    assert 'subg1234' not in classifications
+    assert sorted(classifications) == [
+        'abc', 'fami1234', 'lang1234', 'mylang', 'othe1234', 'othe1235']
+    assert len(classifications) == 6
+
+
+def test_CladeIndex():
+    # Glottolog lists isolates twice, as family and as its only language.
+    glottocodes = [
+        'fami1234', 'subg1234', 'lang1234', 'lang1235', 'lang1236', 'isol1234', 'isol1234']
+    names = ['Family', 'Sub', 'A', 'B', 'C', 'Isolate', 'Isolate']
+    index = CladeIndex.from_nodes(glottocodes, names, [-1, 0, 1, 1, 0, -1, 5])
+    assert list(index.last) == [4, 3, 2, 3, 4, 6, 6]
+    assert index.id('isol1234') == 6
+    assert index.id('xyz') is None
+
+    def members(*clades, **kw):
+        ranges = index.ranges(clades, **kw)
+        return {gc for gc in glottocodes if index.in_ranges(ranges, gc)}
+
+    assert members('Family') == {'subg1234', 'lang1234', 'lang1235', 'lang1236', 'fami1234'}
+    assert members('subg1234') == {'lang1234', 'lang1235'}
+    assert members('sub', ignore_case=True) == {'lang1234', 'lang1235'}
+    assert members('sub') == set()
+    assert members('Sub', 'Isolate') == {'lang1234', 'lang1235', 'isol1234'}
+    assert members('isol1234') == {'isol1234'}
+    assert members('A') == set()
+    assert not index.in_ranges(index.ranges(['Family']), 'unknown')
+
+
+def test_CodeTable():
+    table = CodeTable.from_items([('abc', 1), ('aaa', 2), ('xyz', 3)], 3)
+    assert list(table) == ['aaa', 'abc', 'xyz']
+    assert table.get('abc') == 1 and table.get('xyz') == 3
+    assert table.get('abd') is None and table.get('ab') is None
+    assert 'aaa' in table and 'zzz' not in table
+
+
+def test_CodeMap():
+    m = CodeMap.from_dict({'abc': (1.0, 2.0), 'abcd1234': (1.0, 2.0), 'xyz': (3.0, 4.0)}, points=True)
+    assert dict(m) == {'abc': (1.0, 2.0), 'abcd1234': (1.0, 2.0), 'xyz': (3.0, 4.0)}
+    assert len(m.values) == 2
+    assert 'ab' not in m and m.get(1) is None
+
+
+def test_glottolog_store(tmppath):
+    newick = tmppath / 'tree-glottolog-newick.txt'
+    newick.write_text("('Lang [lang1234][abc]-l-':1)'Family [fami1234]':1;", encoding='utf8')
+    geo = tmppath / 'languages-and-dialects-geo.csv'
+    geo.write_text(
+        'glottocode,name,isocodes,level,macroarea,latitude,longitude\n', encoding='utf8')
+    store = tmppath / 'store'
+
+    with pytest.raises(ValueError):
+        glottolog_store.import_release(store, '4.1', geo, newick)
+    paths = glottolog_store.import_release(store, '4.1', newick, geo)
+    assert paths['newick'].read_text(encoding='utf8') == newick.read_text(encoding='utf8')
+    glottolog_store.import_release(store, '4.10', newick, geo)
+    assert glottolog_store.releases(store) == ['4.1', '4.10']
+    glottolog_store.verify_release(store, '4.1')
+
+    paths['geo'].write_text('x', encoding='utf8')
+    with pytest.raises(ValueError, match='mismatch'):
+        glottolog_store.verify_release(store, '4.1')
+    paths['newick'].unlink()
+    assert glottolog_store.releases(store) == ['4.10']
+    glottolog_store.verify_release(glottolog_store.PACKAGE_DATA, '4.0')
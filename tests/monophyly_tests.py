@@ -14,3 +14,33 @@ def test_glottolog():
     struct = make_structure(c, ['olde1238', 'sate1242', 'hind1273', 'schi1234'], 0, 9)
     assert check_structure(struct)
     assert make_newick(struct) == '(((hind1273,schi1234),sate1242),olde1238)'
+
+
+def test_make_structure():
+    c = {
+        'a': [('F', 'f'), ('X', 'x')],
+        'b': [('F', 'f'), ('X', 'x'), ('Y', 'y')],
+        'c': [('F', 'f'), ('X', 'x'), ('Y', 'y')],
+        'd': [('F', 'f')],
+        'e': [('G', 'g')],
+    }
+    assert make_structure(c, ['e', 'd', 'c', 'b', 'a'], 0, 9) == [[[['a'], ['b', 'c']], ['d']], ['e']]
+    # Languages below the maximal depth keep their order:
+    assert make_structure(c, ['e', 'd', 'c', 'b', 'a'], 0, 1) == [[['c', 'b', 'a'], ['d']], ['e']]
+    assert make_structure(c, ['c', 'b', 'a'], 2, 9) == [['a'], ['b', 'c']]
+
+
+def test_MonophylyTree():
+    tree = MonophylyTree('(((a,b),c),(d,e,f),g)', ['g', 'a'])
+    assert tree.bits['g'] == 0 and tree.bits['a'] == 1
+    assert tree.bitset(['a', 'g']) == 3
+    assert tree.bitset(['a', 'x']) is None
+    assert tree.is_compatible(['a', 'b'])
+    assert tree.is_compatible(['a', 'b', 'c'])
+    # A subset of a clade without finer structure:
+    assert tree.is_compatible(['d', 'e'])
+    # A union of child clades:
+    assert tree.is_compatible(['a', 'b', 'c', 'g'])
+    assert not tree.is_compatible(['a', 'c'])
+    assert not tree.is_compatible(['c', 'd'])
+    assert not tree.is_compatible(['a', 'x'])
@@ -1,5 +1,7 @@
 import pytest
 
+from beastling.util.misc import sanitise_tree
+
 
 def _make_tree_cfg(config_factory, tree_dir, tree_file):
     cfg = config_factory('admin', 'mk', tree_file)
@@ -33,3 +35,18 @@ def test_duplicate_taxa_tree(config_factory, tree_dir):
     cfg = _make_tree_cfg(config_factory, tree_dir, "duplicates")
     with pytest.raises(ValueError):
         cfg.process()
+
+
+def test_sanitise_tree():
+    tree = '((a:1,(b:2)x:1):1,(c,d,e,f),g)'
+    # Unifurcations are removed, adding up branch lengths, pruned taxa are
+    # removed and polytomies resolved:
+    assert sanitise_tree(tree, 'starting', list('abcdef')) == \
+        '((a:1,b:3.0):1,(c,(f,(d,e):0.0):0.0));'
+    assert sanitise_tree(tree, 'monophyly', list('abcdefg')) == '((a,b),(c,d,e,f),g);'
+    with pytest.raises(ValueError, match='duplicate'):
+        sanitise_tree('((a,b),(a,c))', 'starting', list('abc'))
+    with pytest.raises(ValueError, match='not in'):
+        sanitise_tree('((a,b),c)', 'starting', list('abcd'))
+    with pytest.raises(ValueError, match='parse'):
+        sanitise_tree('((a,b),c', 'starting', list('abc'))
@@ -1,4 +1,13 @@
+import re
+import collections
+
+import newick
+import pytest
+
 from beastling.beastxml import BeastXml
+from beastling.util.trees import Node, dumps, postorder
+from beastling.util.monophyly import MonophylyTree
+from beastling.util.starting_trees import upgma, ParsimonyTree
 
 
 def test_random_tree(config_factory):
@@ -23,3 +32,107 @@ def test_constrained_random_tree(config_factory):
     config = config_factory('basic','monophyletic')
     xml = BeastXml(config).tostring().decode('utf8')
     assert "beast.evolution.tree.ConstrainedRandomTree" in xml
+
+
+def test_tip_calibrated_tree(config_factory):
+    """Check that a starting tree computed from the data places calibrated
+    tips at their calibrated dates, and that BEAST keeps them there."""
+    config = config_factory('basic', 'calibration_tip')
+    config.languages.starting_tree = 'auto-distance'
+    xml = BeastXml(config).tostring().decode('utf8')
+    assert 'adjustTipHeights="false"' in xml
+    tree = newick.loads(re.search('newick="([^"]+)"', xml).group(1))[0]
+    depths = {tree: 0}
+    for node in tree.walk():
+        for child in node.descendants:
+            depths[child] = depths[node] + child.length
+    height = max(depths.values())
+    for cal in config.tip_calibrations.values():
+        tip = tree.get_node(next(iter(cal.langs)))
+        assert abs(height - depths[tip] - cal.mean()) < 1e-6 * height
+
+
+def test_distance_tree(config_factory):
+    """Check that a starting tree is computed from the data, respecting
+    monophyly constraints, and passed to TreeParser."""
+    config = config_factory('basic', 'monophyletic')
+    config.languages.starting_tree = 'auto-distance'
+    config.process()
+    tree = newick.loads(config.languages.starting_tree)[0]
+    assert sorted(tree.get_leaf_names()) == sorted(config.languages.languages)
+    assert all(n.length > 0 for n in tree.walk() if n is not tree)
+    constraints = MonophylyTree(config.languages.monophyly_newick, config.taxa)
+    assert all(constraints.is_compatible(n.get_leaf_names()) for n in tree.walk())
+    xml = BeastXml(config).tostring().decode('utf8')
+    assert "beast.util.TreeParser" in xml
+    assert "RandomTree" not in xml
+
+
+@pytest.mark.parametrize('starting_tree', ['auto-distance', 'auto-parsimony'])
+@pytest.mark.parametrize('calibrations', [
+    'calibration_nested_root', 'calibration_disjoint', 'calibration_uniform_range'])
+def test_auto_tree_calibrations(config_factory, starting_tree, calibrations):
+    """Check that a starting tree computed from the data resolves the
+    calibrated clades at heights within their calibrations."""
+    config = config_factory('basic', calibrations)
+    config.languages.starting_tree = starting_tree
+    config.process()
+    tree = newick.loads(config.languages.starting_tree)[0]
+    heights = {}
+    for node in reversed(list(tree.walk())):
+        heights[node] = max([heights[c] + c.length for c in node.descendants] or [0])
+    assert all(n.length > 0 for n in tree.walk() if n is not tree)
+    clades = {frozenset(n.get_leaf_names()): n for n in tree.walk()}
+    for name, cal in config.calibrations.items():
+        # The calibrations are given as ranges, e.g. "20 - 25".
+        lower, upper = map(float, re.findall(r'[0-9.]+', config.calibration_configs[name]))
+        assert lower <= heights[clades[frozenset(cal.langs)]] <= upper
+
+
+def test_upgma():
+    def tree(root, heights):
+        for node in postorder(root):
+            for child in node.children:
+                child.length = '%g' % (heights[id(node)] - heights[id(child)])
+        return dumps(root)
+
+    distances = [
+        [0, 2, 6, 10],
+        [2, 0, 6, 10],
+        [6, 6, 0, 10],
+        [10, 10, 10, 0]]
+    assert tree(*upgma(distances, 'abcd')) == '(((a:1,b:1):2,c:3):2,d:5);'
+    # Constrained to make (c,d) a clade, which forces the root above the mean
+    # distance:
+    root, heights = upgma(distances, 'abcd', MonophylyTree('((a,b),(c,d))', 'abcd'))
+    assert tree(root, heights) == '((a:1,b:1):4,(c:5,d:5):0);'
+
+
+def test_parsimony_tree(config_factory):
+    config = config_factory('basic', 'monophyletic')
+    config.languages.starting_tree = 'auto-parsimony'
+    config.languages.starting_tree_search_moves = 100
+    config.process()
+    tree = newick.loads(config.languages.starting_tree)[0]
+    assert sorted(tree.get_leaf_names()) == sorted(config.languages.languages)
+    constraints = MonophylyTree(config.languages.monophyly_newick, config.taxa)
+    assert all(constraints.is_compatible(n.get_leaf_names()) for n in tree.walk())
+
+
+def test_ParsimonyTree():
+    def tree(names):
+        a, c, b, d = [Node(name=n) for n in names]
+        return Node(children=[Node(children=[a, c]), Node(children=[b, d])])
+
+    # Two features, with states 0 for a and b and 1 for c and d:
+    leaves = collections.OrderedDict([('a', (3, 0)), ('b', (3, 0)), ('c', (0, 3)), ('d', (0, 3))])
+    t = ParsimonyTree(tree('acbd'), leaves)
+    assert t.score == 4
+    assert not t.search(max_moves=10)
+    assert t.score == 2
+    # Leaves are numbered in the order of the dict, so (a,b) is 0b0011:
+    assert {0b0011, 0b1100}.issubset(t.clades)
+    # The search respects required clades:
+    t = ParsimonyTree(tree('acbd'), leaves, required=[0b0101])
+    t.search(max_moves=10)
+    assert t.score == 4
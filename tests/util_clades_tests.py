@@ -0,0 +1,25 @@
+import pytest
+
+from beastling.util.clades import Taxa
+
+
+def test_Clade():
+    taxa = Taxa(['a', 'b', 'c', 'd'])
+    ab, bc = taxa.clade(['b', 'a']), taxa.clade('bc')
+    assert list(ab) == ['a', 'b'] and len(ab) == 2
+    assert 'a' in ab and 'c' not in ab and 'x' not in ab
+    assert ab == {'a', 'b'} and ab == taxa.clade(['a', 'b']) and ab != bc
+    assert len({ab, bc, taxa.clade('ab')}) == 2
+    # Clades which are equal to frozensets have the same hash:
+    assert {frozenset('ab'): 1}[ab] == 1 and len({ab, frozenset('ab')}) == 1
+    assert (ab | bc) == set('abc') and (ab & bc) == {'b'} and (ab - bc) == {'a'}
+    assert ab <= taxa.root and ab < taxa.root and not ab <= bc and taxa.root >= bc
+    assert taxa.clade('a').isdisjoint(bc)
+    assert not taxa.clade()
+    assert taxa.clade(ab) is ab
+    # Clades of different taxa are compared as sets:
+    assert ab == Taxa(['b', 'a']).clade('ab')
+    assert ab | {'x'} == {'a', 'b', 'x'}
+
+    with pytest.raises(ValueError):
+        taxa.clade(['x'])
@@ -0,0 +1,12 @@
+from beastling.util.symbols import SymbolTable
+
+
+def test_SymbolTable():
+    symbols = SymbolTable(['b', 'a'])
+    assert list(symbols) == ['b', 'a'] and len(symbols) == 2
+    assert 'x' not in symbols
+
+    name = ''.join(['a', 'b'])
+    assert symbols.intern(name) is name
+    assert symbols.intern(''.join(['a', 'b'])) is name
+    assert list(symbols) == ['b', 'a', 'ab']
@@ -0,0 +1,23 @@
+import newick
+import pytest
+
+from beastling.util.trees import Node, parse, postorder, dumps
+
+
+@pytest.mark.parametrize('tree', [
+    '(A:1,(B:2,C:3)D:4)E;',
+    '((A,B),(C,(D,E)));',
+    '(A,((B)));',
+])
+def test_dumps(tree):
+    assert dumps(parse(tree)) == newick.dumps(newick.loads(tree))
+
+
+def test_postorder():
+    root = Node('r', children=[Node('a'), Node('b', children=[Node('c')])])
+    assert [n.name for n in postorder(root)] == ['a', 'c', 'b', 'r']
+
+
+def test_parse_invalid():
+    with pytest.raises(ValueError):
+        parse('((A,B);')